@@ -1,6 +1,11 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from .database import Base, engine
+from .upstream_scope import begin_scope, end_scope
+from .bot_runner import bot_runner
+from .config import settings
+from .fill_ingest import run_fill_ingestion
 from .routers import users, wallets, bots, trades, vaults, ws, market, bot_ws
 
 def create_app():
@@ -9,6 +14,25 @@ def create_app():
     @app.on_event("startup")
     def on_startup():
         Base.metadata.create_all(bind=engine)
+        if bot_runner.pool is not None:
+            bot_runner.pool.start()
+
+    @app.on_event("startup")
+    async def start_fill_ingestion():
+        if settings.fill_ingest_interval_seconds > 0:
+            app.state.fill_ingestion = asyncio.create_task(run_fill_ingestion())
+
+    @app.middleware("http")
+    async def count_upstream_calls(request: Request, call_next):
+        scope, token = begin_scope()
+        try:
+            response = await call_next(request)
+        finally:
+            end_scope(token)
+        # Debug headers so regressions in upstream fan-out show up in the network tab
+        response.headers["X-Upstream-Calls"] = str(scope.upstream_calls)
+        response.headers["X-Upstream-Calls-Shared"] = str(scope.shared_calls)
+        return response
 
     # Include your routers
     app.include_router(users.router, prefix="/users", tags=["users"])
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import time
+
+import websockets
+from eth_account import Account
+from hyperliquid.utils import constants
+from hyperliquid.utils.error import ClientError, ServerError
+from hyperliquid.utils.signing import (
+    get_timestamp_ms,
+    order_request_to_order_wire,
+    order_wires_to_order_action,
+    sign_l1_action,
+)
+
+from .client_registry import client_registry
+from .config import settings
+from .exchange_interface import ExchangeInterface
+from .hyperliquid_api import resting_side
+from .market_cache import acached
+from .upstream_scope import record_upstream_call, single_flight
+
+# base_url -> (built_at, {coin name: asset id}), rebuilt from cached meta.
+_asset_maps = {}
+
+
+class AsyncHyperliquidAPI(ExchangeInterface):
+    def __init__(self, private_key=None, is_mainnet=True):
+        self.base_url = constants.MAINNET_API_URL if is_mainnet else constants.TESTNET_API_URL
+        self.is_mainnet = is_mainnet
+        self.wallet = None
+        if private_key:
+            self.wallet = client_registry.get_signer(private_key) if settings.exchange_client_pooling else Account.from_key(private_key)
+
+    async def _post(self, url_path: str, payload: dict):
+        record_upstream_call()
+        if settings.exchange_client_pooling:
+            response = await client_registry.get_async_client(self.base_url).post(url_path, content=json.dumps(payload))
+        else:
+            async with client_registry.new_async_client(self.base_url) as client:
+                response = await client.post(url_path, content=json.dumps(payload))
+        if 400 <= response.status_code < 500:
+            try:
+                err = response.json()
+            except ValueError:
+                err = None
+            if not isinstance(err, dict):
+                raise ClientError(response.status_code, None, response.text, None, response.headers)
+            raise ClientError(response.status_code, err.get("code"), err.get("msg"), response.headers, err.get("data"))
+        if response.status_code >= 500:
+            raise ServerError(response.status_code, response.text)
+        try:
+            return response.json()
+        except ValueError:
+            return {"error": f"Could not parse JSON: {response.text}"}
+
+    async def _info(self, payload: dict):
+        key = self.base_url + json.dumps(payload, sort_keys=True)
+        return await single_flight(key, lambda: self._post("/info", payload))
+
+    async def _post_action(self, action: dict):
+        if not self.wallet:
+            raise Exception("Exchange not initialized. Provide a private key.")
+        nonce = get_timestamp_ms()
+        signature = sign_l1_action(self.wallet, action, None, nonce, None, self.is_mainnet)
+        return await self._post(
+            "/exchange",
+            {"action": action, "nonce": nonce, "signature": signature, "vaultAddress": None, "expiresAfter": None},
+        )
+
+    async def _asset(self, name: str) -> int:
+        built = _asset_maps.get(self.base_url)
+        if built is None or name not in built[1] or time.monotonic() - built[0] > settings.exchange_meta_refresh_seconds:
+            meta = await self.get_meta()
+            spot_meta = await self.get_spot_meta()
+            assets = {asset_info["name"]: asset for asset, asset_info in enumerate(meta["universe"])}
+            token_by_index = {token["index"]: token for token in spot_meta["tokens"]}
+            for spot_info in spot_meta["universe"]:
+                # spot assets start at 10000
+                asset = spot_info["index"] + 10000
+                assets[spot_info["name"]] = asset
+                base, quote = spot_info["tokens"]
+                assets.setdefault(f'{token_by_index[base]["name"]}/{token_by_index[quote]["name"]}', asset)
+            built = _asset_maps[self.base_url] = (time.monotonic(), assets)
+        if name not in built[1]:
+            raise Exception(f"Unknown asset: {name}")
+        return built[1][name]
+
+    async def _order_wire(self, symbol: str, is_buy: bool, sz: float, limit_px: float, order_type: dict, reduce_only: bool = False):
+        order = {
+            "coin": symbol,
+            "is_buy": is_buy,
+            "sz": sz,
+            "limit_px": limit_px,
+            "order_type": order_type,
+            "reduce_only": reduce_only,
+        }
+        return order_request_to_order_wire(order, await self._asset(symbol))
+
+    async def get_user_state(self, user_address: str):
+        return await self._info({"type": "clearinghouseState", "user": user_address})
+
+    async def get_sub_accounts(self, user_address: str):
+        return await self._info({"type": "subAccounts", "user": user_address})
+
+    @acached
+    async def get_all_mids(self):
+        return await self._info({"type": "allMids"})
+
+    @acached
+    async def get_meta(self):
+        return await self._info({"type": "meta"})
+
+    @acached
+    async def get_spot_meta(self):
+        return await self._info({"type": "spotMeta"})
+
+    @acached
+    async def get_vault_meta(self):
+        return await self._info({"type": "vaultSummaries"})
+
+    async def vault_deposit(self, vault_address: str, amount: int):
+        return await self._post_action({"type": "vaultTransfer", "vaultAddress": vault_address, "isDeposit": True, "usd": amount})
+
+    async def vault_withdraw(self, vault_address: str, amount: int):
+        return await self._post_action({"type": "vaultTransfer", "vaultAddress": vault_address, "isDeposit": False, "usd": amount})
+
+    async def place_order(self, symbol: str, is_buy: bool, sz: float, limit_px: float, order_type: dict):
+        order_wire = await self._order_wire(symbol, is_buy, sz, limit_px, order_type)
+        return await self._post_action(order_wires_to_order_action([order_wire]))
+
+    async def modify_order(self, symbol: str, oid: int, sz: float, limit_px: float, order_type: dict, is_buy: bool | None = None):
+        if is_buy is None:
+            # The modify wire needs the side; take it from the resting order.
+            is_buy = resting_side(await self.query_order_status(self.wallet.address, oid), oid)
+        order_wire = await self._order_wire(symbol, is_buy, sz, limit_px, order_type)
+        return await self._post_action({"type": "batchModify", "modifies": [{"oid": oid, "order": order_wire}]})
+
+    async def cancel_order(self, symbol: str, oid: int):
+        return await self._post_action({"type": "cancel", "cancels": [{"a": await self._asset(symbol), "o": oid}]})
+
+    async def cancel_orders_batch(self, cancellations: list[dict]):
+        cancels = [{"a": await self._asset(cancel["coin"]), "o": cancel["oid"]} for cancel in cancellations]
+        return await self._post_action({"type": "cancel", "cancels": cancels})
+
+    async def place_orders_batch(self, orders: list[dict]):
+        order_wires = [
+            await self._order_wire(order["symbol"], order["is_buy"], order["sz"], order["limit_px"], order["order_type"], order.get("reduce_only", False))
+            for order in orders
+        ]
+        return await self._post_action(order_wires_to_order_action(order_wires))
+
+    async def modify_orders_batch(self, modifies: list[dict]):
+        sides = [modify.get("is_buy") for modify in modifies]
+        missing = [index for index, is_buy in enumerate(sides) if is_buy is None]
+        if missing:
+            statuses = await asyncio.gather(*(self.query_order_status(self.wallet.address, modifies[index]["oid"]) for index in missing))
+            for index, status in zip(missing, statuses):
+                sides[index] = resting_side(status, modifies[index]["oid"])
+        wires = [
+            {"oid": modify["oid"], "order": await self._order_wire(modify["symbol"], is_buy, modify["sz"], modify["limit_px"], modify["order_type"], modify.get("reduce_only", False))}
+            for modify, is_buy in zip(modifies, sides)
+        ]
+        return await self._post_action({"type": "batchModify", "modifies": wires})
+
+    async def get_open_orders(self, user_address: str):
+        return await self._info({"type": "frontendOpenOrders", "user": user_address})
+
+    async def get_positions(self, user_address: str):
+        user_state = await self.get_user_state(user_address)
+        return user_state.get("assetPositions", [])
+
+    async def get_user_vault_equity(self, user_address: str):
+        return await self._info({"type": "userVaultEquities", "user": user_address})
+
+    @acached
+    async def get_vault_details(self, vault_address: str):
+        # Public vault data only needs the zero address as the requesting user.
+        return await self._info({"type": "vaultDetails", "vaultAddress": vault_address, "user": constants.ZERO_ADDRESS})
+
+    @acached
+    async def get_validators(self):
+        return await self._info({"type": "validatorSummaries"})
+
+    async def subscribe_to_user_events(self, user_address: str, callback):
+        ws_url = "ws" + self.base_url[len("http"):] + "/ws"
+        async with websockets.connect(ws_url) as ws:
+            await ws.send(json.dumps({"method": "subscribe", "subscription": {"type": "userEvents", "user": user_address}}))
+            async for message in ws:
+                event = json.loads(message)
+                if event.get("channel") == "user":
+                    await callback(event)
+
+    async def get_historical_orders(self, user_address: str):
+        return await self._info({"type": "historicalOrders", "user": user_address})
+
+    async def get_user_fills(self, user_address: str):
+        return await self._info({"type": "userFills", "user": user_address})
+
+    async def query_order_status(self, user_address: str, oid: int):
+        return await self._info({"type": "orderStatus", "user": user_address, "oid": oid})
+
+    async def get_user_fills_by_time(self, user_address: str, start_time: int, end_time: int):
+        return await self._info({"type": "userFillsByTime", "user": user_address, "startTime": start_time, "endTime": end_time})
+
+    async def get_user_funding(self, user_address: str, start_time: int, end_time: int):
+        return await self._info({"type": "userFunding", "user": user_address, "startTime": start_time, "endTime": end_time})
+
+    async def get_historical_portfolio_value(self, user_address: str, start_time: int, end_time: int):
+        # Times are unix seconds, matching what the dashboard chart sends and plots.
+        portfolio = dict(await self._info({"type": "portfolio", "user": user_address}))
+        history = portfolio.get("allTime", {}).get("accountValueHistory", [])
+        return [
+            {"time": timestamp // 1000, "value": value}
+            for timestamp, value in history
+            if start_time <= timestamp // 1000 <= end_time
+        ]
+
+    async def place_spot_order(self, symbol: str, is_buy: bool, sz: float, limit_px: float, order_type: dict):
+        return await self.place_order(symbol, is_buy, sz, limit_px, order_type)
+
+    async def get_spot_balances(self, user_address: str):
+        user_state = await self.get_user_state(user_address)
+        return user_state.get("spotAssetPositions", [])
+
+    @acached
+    async def get_funding_history(self, symbol: str, start_time: int, end_time: int):
+        return await self._info({"type": "fundingHistory", "coin": symbol, "startTime": start_time, "endTime": end_time})
+
+    @acached
+    async def get_candles(self, symbol: str, interval: str, start_time: int, end_time: int):
+        req = {"coin": symbol, "interval": interval, "startTime": start_time, "endTime": end_time}
+        return await self._info({"type": "candleSnapshot", "req": req})
+
+    @acached
+    async def get_l2_book(self, symbol: str):
+        return await self._info({"type": "l2Book", "coin": symbol})
+
+    async def query_user_rate_limits(self, user_address: str):
+        return await self._info({"type": "userRateLimit", "user": user_address})
+
+
+def get_async_api():
+    return AsyncHyperliquidAPI()
@@ -0,0 +1,313 @@
+import io
+import multiprocessing
+import sys
+from collections import deque
+
+import numpy as np
+
+from .bot_code_cache import bot_code_cache
+from .bot_runner import BotTradingAPI, CapitalManager
+from .candle_store import candle_store
+from .config import settings
+from .hyperliquid_api import HyperliquidAPI
+
+CANDLE_FIELDS = ("t", "o", "h", "l", "c", "v")
+MS_PER_YEAR = 365 * 24 * 3600 * 1000
+# trading_api methods that need market data candles do not have.
+UNSUPPORTED = {"estimate_impact": "it needs the order book, and candles have none"}
+
+
+def candles_to_arrays(candles: list[dict]):
+    return {field: np.array([float(candle[field]) for candle in candles]) for field in CANDLE_FIELDS}
+
+
+def fetch_candles(symbol: str, interval: str, start_time: int, end_time: int, api: HyperliquidAPI = None):
+    """Candle history for [start_time, end_time] as NumPy arrays, through the local candle store."""
+    return candles_to_arrays(candle_store.get_candles_sync(api or HyperliquidAPI(), symbol, interval, start_time, end_time))
+
+
+class SimulatedExchange:
+    """Stands in for HyperliquidAPI during a backtest: orders rest until a later bar trades through them."""
+
+    def __init__(self, symbol: str, candles: dict, capital_manager: CapitalManager, taker_fee_bps: float, maker_fee_bps: float, slippage_bps: float):
+        self.symbol = symbol
+        self.candles = candles
+        self.capital_manager = capital_manager
+        self.taker_fee = taker_fee_bps / 10_000
+        self.maker_fee = maker_fee_bps / 10_000
+        self.slippage = slippage_bps / 10_000
+        self.bar = 0
+        self.orders = {}  # oid -> order placed by the bot, in placement order
+        self._next_oid = 1
+        self.position = 0.0
+        self.entry_px = 0.0
+        # One entry per fill; turned into arrays when the statistics are computed.
+        self.fill_bars, self.fill_sizes, self.fill_prices, self.fill_fees, self.fill_realized = [], [], [], [], []
+
+    def place_order(self, symbol: str, is_buy: bool, sz: float, limit_px: float, order_type: dict):
+        if symbol != self.symbol:
+            raise Exception(f"Backtest only replays {self.symbol}, not {symbol}.")
+        close = self.candles["c"][self.bar]
+        marketable = limit_px >= close if is_buy else limit_px <= close
+        tif = order_type.get("limit", {}).get("tif", "Gtc")
+        if tif == "Alo" and marketable:
+            return {"status": "ok", "response": {"type": "order", "data": {"statuses": [{"error": "Post only order would have immediately matched"}]}}}
+        oid = self._next_oid
+        self._next_oid += 1
+        self.orders[oid] = {
+            "oid": oid, "coin": symbol, "is_buy": is_buy, "sz": sz, "limit_px": limit_px,
+            "tif": tif, "taker": marketable, "placed_bar": self.bar,
+        }
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": [{"resting": {"oid": oid}}]}}}
+
+    def place_orders_batch(self, orders: list[dict]):
+        statuses = [
+            self.place_order(order["symbol"], order["is_buy"], order["sz"], order["limit_px"], order["order_type"])["response"]["data"]["statuses"][0]
+            for order in orders
+        ]
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+    def modify_order(self, symbol: str, oid: int, sz: float, limit_px: float, order_type: dict, is_buy: bool = None):
+        # As on the exchange, the modified order rests under a new oid and loses its place.
+        order = self.orders.get(oid)
+        if order is None or order["coin"] != symbol:
+            return {"status": "ok", "response": {"type": "order", "data": {"statuses": [{"error": "Cannot modify canceled or filled order"}]}}}
+        del self.orders[oid]
+        return self.place_order(symbol, order["is_buy"] if is_buy is None else is_buy, sz, limit_px, order_type)
+
+    def modify_orders_batch(self, modifies: list[dict]):
+        statuses = [
+            self.modify_order(
+                modify["symbol"], modify["oid"], modify["sz"], modify["limit_px"], modify["order_type"], modify.get("is_buy")
+            )["response"]["data"]["statuses"][0]
+            for modify in modifies
+        ]
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+    def get_l2_book(self, symbol: str):
+        raise Exception(f"estimate_impact is not available in backtests: {UNSUPPORTED['estimate_impact']}.")
+
+    def cancel_order(self, symbol: str, oid: int):
+        if self.orders.pop(oid, None) is None:
+            return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": [{"error": "Order was never placed, already canceled, or filled."}]}}}
+        return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": ["success"]}}}
+
+    def get_open_orders(self, user_address: str = None):
+        timestamp = int(self.candles["t"][self.bar])
+        return [
+            {"coin": o["coin"], "side": "B" if o["is_buy"] else "A", "limitPx": str(o["limit_px"]), "sz": str(o["sz"]), "oid": o["oid"], "timestamp": timestamp, "tif": o["tif"]}
+            for o in self.orders.values()
+        ]
+
+    def get_positions(self, user_address: str = None):
+        if not self.position:
+            return []
+        close = self.candles["c"][self.bar]
+        return [{"type": "oneWay", "position": {
+            "coin": self.symbol,
+            "szi": str(self.position),
+            "entryPx": str(self.entry_px),
+            "unrealizedPnl": str((close - self.entry_px) * self.position),
+        }}]
+
+    def match(self, bar: int):
+        # Orders placed at an earlier bar's close trade against this bar.
+        o, h, l = self.candles["o"][bar], self.candles["h"][bar], self.candles["l"][bar]
+        for oid, order in list(self.orders.items()):
+            if order["placed_bar"] >= bar:
+                continue
+            px, is_buy = order["limit_px"], order["is_buy"]
+            if order["taker"] and not (o <= px if is_buy else o >= px):
+                # The bar gapped past the limit: the order rests at it rather than crossing.
+                order["taker"] = False
+            if order["taker"]:
+                # Crossed the book when placed: filled at this bar's open, with slippage, no worse than the limit.
+                price = min(o * (1 + self.slippage), px) if is_buy else max(o * (1 - self.slippage), px)
+                filled = True
+                fee = self.taker_fee
+            else:
+                filled = l <= px if is_buy else h >= px
+                # A bar that opens through the limit fills at the open.
+                price = min(o, px) if is_buy else max(o, px)
+                fee = self.maker_fee
+            if filled:
+                del self.orders[oid]
+                self._fill(bar, is_buy, order["sz"], price, fee)
+            elif order["tif"] == "Ioc":
+                del self.orders[oid]
+
+    def _fill(self, bar: int, is_buy: bool, sz: float, price: float, fee_rate: float):
+        signed = sz if is_buy else -sz
+        fee = sz * price * fee_rate
+        realized = 0.0
+        if self.position and (self.position > 0) != (signed > 0):
+            closed = min(abs(signed), abs(self.position))
+            realized = closed * (price - self.entry_px) * (1 if self.position > 0 else -1)
+        new_position = self.position + signed
+        if not self.position or (self.position > 0) == (signed > 0):
+            self.entry_px = (self.entry_px * abs(self.position) + price * sz) / abs(new_position)
+        elif new_position and (new_position > 0) != (self.position > 0):
+            self.entry_px = price  # flipped through zero
+        self.position = new_position if abs(new_position) > 1e-12 else 0.0
+        self.capital_manager.track_fill(self.symbol, is_buy, sz, price)
+        self.capital_manager.available_capital -= fee
+        self.fill_bars.append(bar)
+        self.fill_sizes.append(signed)
+        self.fill_prices.append(price)
+        self.fill_fees.append(fee)
+        self.fill_realized.append(realized - fee)
+
+
+class SimulatedTradingAPI(BotTradingAPI):
+    """The `trading_api` a bot sees in a backtest; capital checks are BotTradingAPI's own."""
+
+    def __init__(self, exchange: SimulatedExchange, capital_manager: CapitalManager):
+        self.api = exchange
+        self.capital_manager = capital_manager
+
+
+def compute_stats(candles: dict, exchange: SimulatedExchange, capital: float, bars: int):
+    close, times = candles["c"][:bars], candles["t"][:bars]
+    fill_bars = np.array(exchange.fill_bars, dtype=np.int64)
+    sizes = np.array(exchange.fill_sizes)
+    prices = np.array(exchange.fill_prices)
+    fees = np.array(exchange.fill_fees)
+    realized = np.array(exchange.fill_realized)
+
+    # Cash and position at each bar's close, then marked to the close.
+    cash = capital + np.cumsum(np.bincount(fill_bars, weights=-sizes * prices - fees, minlength=bars))
+    position = np.cumsum(np.bincount(fill_bars, weights=sizes, minlength=bars))
+    equity = cash + position * close
+
+    stats = {"bars": int(bars), "fills": int(len(fill_bars))}
+    if not bars:
+        return stats, equity
+    peak = np.maximum.accumulate(equity)
+    returns = np.diff(equity) / np.where(equity[:-1] == 0, np.nan, equity[:-1])
+    bar_ms = float(np.median(np.diff(times))) if bars > 1 else 0.0
+    std = np.nanstd(returns) if len(returns) else 0.0
+    closing = realized[sizes * np.concatenate(([0.0], np.cumsum(sizes)[:-1])) < 0] if len(sizes) else realized
+    stats.update(
+        start_time=int(times[0]),
+        end_time=int(times[-1]),
+        final_equity=float(equity[-1]),
+        total_return=float(equity[-1] / capital - 1),
+        buy_and_hold_return=float(close[-1] / close[0] - 1),
+        max_drawdown=float(np.max(1 - equity / np.where(peak == 0, np.nan, peak), initial=0)),
+        sharpe=float(np.nanmean(returns) / std * np.sqrt(MS_PER_YEAR / bar_ms)) if std > 0 and bar_ms > 0 else 0.0,
+        fees=float(fees.sum()),
+        volume=float(np.abs(sizes * prices).sum()),
+        exposure=float(np.mean(position != 0)),
+        closing_trades=int(len(closing)),
+        win_rate=float(np.mean(closing > 0)) if len(closing) else 0.0,
+        realized_pnl=float(realized.sum()),
+        final_position=float(position[-1]),
+    )
+    return stats, equity
+
+
+def _names(code) -> set:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, "co_names"):
+            names |= _names(const)
+    return names
+
+
+def check_supported(code):
+    """Refuses bot code that calls a trading_api method backtests cannot simulate, before it runs."""
+    for name in sorted(_names(code) & UNSUPPORTED.keys()):
+        raise Exception(f"This bot uses trading_api.{name}, which backtests do not support: {UNSUPPORTED[name]}.")
+
+
+def run_backtest(bot_code: str, candles: dict, symbol: str, capital_allocation: float, runtime_inputs: dict,
+                 taker_fee_bps: float, maker_fee_bps: float, slippage_bps: float):
+    """Replays candles through a bot that defines `on_candle(candle)`; runs in the calling process."""
+    capital_manager = CapitalManager(capital_allocation)
+    exchange = SimulatedExchange(symbol, candles, capital_manager, taker_fee_bps, maker_fee_bps, slippage_bps)
+    bot_globals = {
+        "__name__": "__backtest__",
+        "runtime_inputs": runtime_inputs,
+        "trading_api": SimulatedTradingAPI(exchange, capital_manager),
+        "print": print,
+    }
+    bars = 0
+    error = None
+    try:
+        code = bot_code_cache.load(bot_code)
+        check_supported(code)
+        exec(code, bot_globals)
+        on_candle = bot_globals.get("on_candle")
+        if on_candle is None:
+            raise Exception("Bot code must define on_candle(candle) to be backtested.")
+        columns = [candles[field].tolist() for field in CANDLE_FIELDS]
+        for bar, values in enumerate(zip(*columns)):
+            exchange.bar = bar
+            if exchange.orders:
+                exchange.match(bar)
+            bars = bar + 1
+            on_candle(dict(zip(CANDLE_FIELDS, values)))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    stats, equity = compute_stats(candles, exchange, capital_allocation, bars)
+    points = np.unique(np.linspace(0, bars - 1, min(bars, settings.backtest_curve_points)).astype(np.int64)) if bars else []
+    return {
+        "error": error,
+        "stats": stats,
+        "equity_curve": [[int(candles["t"][i]), float(equity[i])] for i in points],
+        "fills": [
+            {"bar": bar, "time": int(candles["t"][bar]), "sz": size, "px": price, "fee": fee}
+            for bar, size, price, fee in zip(exchange.fill_bars, exchange.fill_sizes, exchange.fill_prices, exchange.fill_fees)
+        ][-settings.backtest_max_fills:],
+        "open_orders": exchange.get_open_orders() if bars else [],
+    }
+
+
+class _TailWriter(io.TextIOBase):
+    # Keeps only the last lines a bot prints during a backtest.
+    def __init__(self, lines: int):
+        self.lines = deque(maxlen=lines)
+        self._partial = ""
+
+    def write(self, text):
+        *complete, self._partial = (self._partial + text).split("\n")
+        self.lines.extend(complete)
+        return len(text)
+
+    def tail(self):
+        return list(self.lines) + ([self._partial] if self._partial else [])
+
+
+def _backtest_child(conn, args):
+    output = _TailWriter(settings.backtest_log_lines)
+    sys.stdout = sys.stderr = output
+    try:
+        result = run_backtest(*args)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}", "stats": {}, "equity_curve": [], "fills": [], "open_orders": []}
+    result["logs"] = output.tail()
+    conn.send(result)
+    conn.close()
+
+
+def backtest_in_subprocess(*args, timeout: float = None):
+    """run_backtest in a child process, like a live bot, so user code never runs in the API process."""
+    timeout = settings.backtest_timeout_seconds if timeout is None else timeout
+    context = multiprocessing.get_context()
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_backtest_child, args=(child_conn, args), daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(timeout):
+            raise TimeoutError(f"Backtest did not finish within {timeout} seconds")
+        return parent_conn.recv()
+    except EOFError:
+        process.join()
+        raise Exception(f"Backtest process exited with code {process.exitcode}")
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        parent_conn.close()
@@ -0,0 +1,78 @@
+"""Backtest replay speed over a year of synthetic 1-minute candles.
+
+Run with ``python -m backend.benchmarks.bench_backtest``. The candles are a
+seeded random walk, and the bot trades a moving-average crossover through
+`trading_api`, the way a live bot would. Candle fetching is not included.
+``--sweep N`` also times a parameter sweep of N runs across the process pool.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend.backtest import run_backtest
+from backend.sweep import run_sweep
+
+BOT_CODE = """
+from collections import deque
+
+fast, slow = deque(maxlen=runtime_inputs.get("fast", 20)), deque(maxlen=runtime_inputs.get("slow", 100))
+state = {"long": False}
+
+def on_candle(candle):
+    fast.append(candle["c"])
+    slow.append(candle["c"])
+    if len(slow) < slow.maxlen:
+        return
+    above = sum(fast) / len(fast) > sum(slow) / len(slow)
+    if above and not state["long"]:
+        trading_api.place_order("BTC", True, 0.01, candle["c"] * 1.001, {"limit": {"tif": "Ioc"}})
+        state["long"] = True
+    elif not above and state["long"]:
+        trading_api.place_order("BTC", False, 0.01, candle["c"] * 0.999, {"limit": {"tif": "Ioc"}})
+        state["long"] = False
+"""
+
+
+def synthetic_candles(bars: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    close = 50_000 * np.exp(np.cumsum(rng.normal(0, 0.0008, bars)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.0005, bars)) * close
+    return {
+        "t": np.arange(bars) * 60_000.0,
+        "o": open_,
+        "h": np.maximum(open_, close) + spread,
+        "l": np.minimum(open_, close) - spread,
+        "c": close,
+        "v": rng.uniform(1, 10, bars),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=365 * 24 * 60)
+    parser.add_argument("--sweep", type=int, default=0)
+    args = parser.parse_args()
+
+    candles = synthetic_candles(args.bars)
+    started = time.perf_counter()
+    result = run_backtest(BOT_CODE, candles, "BTC", 100_000.0, {}, taker_fee_bps=4.5, maker_fee_bps=1.5, slippage_bps=1.0)
+    elapsed = time.perf_counter() - started
+    stats = result["stats"]
+    print(f"{stats['bars']} bars in {elapsed:.2f}s ({stats['bars'] / elapsed / 1000:.0f}k bars/s), {stats['fills']} fills, "
+          f"return {stats['total_return']:.2%}, max drawdown {stats['max_drawdown']:.2%}, sharpe {stats['sharpe']:.2f}")
+
+    if args.sweep:
+        points = [{"fast": 5 + i % 20, "slow": 50 + 10 * (i // 20)} for i in range(args.sweep)]
+        started = time.perf_counter()
+        for result in run_sweep(BOT_CODE, candles, "BTC", 100_000.0, {}, points, (4.5, 1.5, 1.0)):
+            if result["type"] == "done":
+                best = result["top"][0]
+        elapsed = time.perf_counter() - started
+        print(f"sweep of {args.sweep} runs in {elapsed:.2f}s ({args.sweep / elapsed:.1f} runs/s), "
+              f"best {best['inputs']} return {best['stats']['total_return']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
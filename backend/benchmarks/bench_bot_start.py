@@ -0,0 +1,108 @@
+"""Bot start latency and time-to-first-order, with and without the warm worker pool.
+
+Run with ``python -m backend.benchmarks.bench_bot_start``. The Hyperliquid HTTP
+API is replaced with a stub that sleeps for one round-trip per request, and
+each bot places a single order as its first statement. Time-to-first-order is
+measured from the call to ``BotRunner.start_bot`` until that order reaches
+the stub.
+
+With the fork start method, a fresh bot process inherits the API process's
+imports. Its cold cost is the fork plus fetching exchange metadata to build
+its clients. Pooled workers pay both before any bot is assigned to them.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from backend.bot_runner import BotRunner
+from backend.worker_pool import WorkerPool
+
+PRIVATE_KEY = "0x4929aa0dad4277f6a1a0a7f940d2ace1a503a5fcc90ac9d092c9c9a5939331cf"
+UPSTREAM_RTT_SECONDS = 0.05
+BOT_CODE = 'trading_api.place_order("BTC", True, 0.001, 50000.0, {"limit": {"tif": "Gtc"}})\n'
+
+# Created before any bot process is forked, so every bot can report its first order here.
+orders = multiprocessing.Queue()
+
+
+def stub_post(self, url_path, payload=None):
+    time.sleep(UPSTREAM_RTT_SECONDS)
+    if url_path == "/exchange":
+        orders.put(time.monotonic())
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": [{"resting": {"oid": 1}}]}}}
+    if payload.get("type") == "spotMeta":
+        return {"universe": [], "tokens": []}
+    return {"universe": [{"name": "BTC", "szDecimals": 5}]}
+
+
+class StubFillFeed:
+    def attach(self, bot_id, address, fill_queue=None):
+        return fill_queue or multiprocessing.Queue()
+
+    def detach(self, bot_id):
+        pass
+
+
+def start_one(runner, bot_id):
+    started = time.monotonic()
+    response = runner.start_bot(bot_id, BOT_CODE, {}, PRIVATE_KEY, 1_000_000.0)
+    returned = time.monotonic()
+    assert response["status"] == "success", response
+    first_order = orders.get(timeout=30)
+    # Let the bot finish on its own: terminating a process mid-write to the
+    # shared orders queue would leave the queue's lock held.
+    process = runner.active_bots.get(bot_id)
+    while process is not None and process.is_alive() and bot_id in runner.active_bots:
+        time.sleep(0.005)
+    if bot_id in runner.active_bots:
+        runner.stop_bot(bot_id)
+    return (returned - started) * 1000, (first_order - started) * 1000
+
+
+def wait_until_ready(pool, timeout=30):
+    deadline = time.monotonic() + timeout
+    while pool.stats()["ready"] < pool.size and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        stack.enter_context(patch("hyperliquid.api.API.post", stub_post))
+        stack.enter_context(patch("backend.bot_runner.fill_feed", StubFillFeed()))
+        workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        stack.callback(os.chdir, cwd)
+
+        for label, pool_size in (("before (process per bot)", 0), ("after (warm worker pool)", args.pool_size)):
+            runner = BotRunner()
+            if pool_size:
+                runner.pool = WorkerPool(pool_size, recycle_after=args.bots, on_done=runner._bot_finished)
+                runner.pool.start()
+                stack.callback(runner.pool.shutdown)
+            start_ms, first_order_ms = [], []
+            for bot_id in range(args.bots):
+                if runner.pool is not None:
+                    wait_until_ready(runner.pool)
+                start, first_order = start_one(runner, bot_id)
+                start_ms.append(start)
+                first_order_ms.append(first_order)
+            print(
+                f"{label:26s} start p50={statistics.median(start_ms):7.2f}ms "
+                f"first order p50={statistics.median(first_order_ms):7.2f}ms "
+                f"max={max(first_order_ms):7.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
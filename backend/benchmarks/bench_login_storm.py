@@ -0,0 +1,145 @@
+"""Websocket latency while many users log in at once, with bcrypt on and off the event loop.
+
+Run with ``python -m backend.benchmarks.bench_login_storm``. A ping websocket is
+added to the app and answered by the same event loop as the logins, as in one
+uvicorn worker. Its round-trip times are measured while the storm runs.
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import security
+from backend.app import create_app
+from backend.config import settings
+from backend.database import Base, get_db
+from backend.passwords import verify_password
+
+USERS = 8
+
+
+async def verify_on_loop(plain_password, hashed_password):
+    # How login worked before: bcrypt called straight from the async handler.
+    return verify_password(plain_password, hashed_password)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def make_client(stack):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_local()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = create_app()
+    app.dependency_overrides[get_db] = override_get_db
+
+    @app.websocket("/bench/ping")
+    async def ping(websocket: WebSocket):
+        await websocket.accept()
+        try:
+            while True:
+                await websocket.send_text(await websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+
+    # Ahead of the static files mounted at "/", which would otherwise take the route.
+    app.router.routes.insert(0, app.router.routes.pop())
+    Base.metadata.create_all(bind=engine)
+    # Entering the client keeps one event loop alive, as in a uvicorn worker.
+    client = stack.enter_context(TestClient(app))
+    for i in range(USERS):
+        client.post("/users/", json={"username": f"user{i}", "password": "password"})
+    return client
+
+
+def ping_latencies(client, stop: threading.Event, samples: list):
+    with client.websocket_connect("/bench/ping") as websocket:
+        while not stop.is_set():
+            start = time.perf_counter()
+            websocket.send_text("ping")
+            websocket.receive_text()
+            samples.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.005)
+
+
+def storm(client, logins: int, concurrency: int):
+    def login(i):
+        response = client.post("/users/token", json={"username": f"user{i % USERS}", "password": "password"})
+        assert response.status_code == 200, response.text
+
+    stop = threading.Event()
+    samples = []
+    pinger = threading.Thread(target=ping_latencies, args=(client, stop, samples))
+    pinger.start()
+    time.sleep(0.2)
+    idle = len(samples)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    pinger.join()
+    return samples[idle:], logins / elapsed
+
+
+def authenticated_requests(client, requests: int):
+    token = client.post("/users/token", json={"username": "user0", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get("/users/me/", headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    original_ttl = settings.principal_cache_ttl_seconds
+    settings.fill_ingest_interval_seconds = 0
+    with ExitStack() as stack:
+        client = make_client(stack)
+        try:
+            for label, off_loop in (("before (bcrypt on the loop)", False), ("after (bcrypt executor)", True)):
+                with ExitStack() as mode:
+                    if not off_loop:
+                        mode.enter_context(patch.object(security, "verify_password_async", verify_on_loop))
+                    samples, rate = storm(client, args.logins, args.concurrency)
+                print(
+                    f"{label:30s} ws p50={percentile(samples, 50):7.2f}ms p99={percentile(samples, 99):7.2f}ms "
+                    f"max={max(samples):7.2f}ms logins/s={rate:6.1f}"
+                )
+            for label, ttl in (("before (user query per request)", 0), ("after (principal cache)", original_ttl)):
+                settings.principal_cache_ttl_seconds = ttl
+                security.principal_cache.clear()
+                samples = authenticated_requests(client, args.requests)
+                print(f"{label:30s} GET /users/me p50={percentile(samples, 50):6.2f}ms mean={statistics.mean(samples):6.2f}ms")
+        finally:
+            settings.principal_cache_ttl_seconds = original_ttl
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""POST /trades/ latency with and without pooled exchange clients.
+
+Run with ``python -m backend.benchmarks.bench_order_latency``. The Hyperliquid
+HTTP transport is replaced with a stub that sleeps for a connection handshake
+and an order round-trip, so the numbers only reflect what the backend adds on
+top.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app import create_app
+from backend.client_registry import client_registry
+from backend.config import settings
+from backend.database import Base, get_db
+from backend.market_cache import market_cache
+
+PRIVATE_KEY = "0x4929aa0dad4277f6a1a0a7f940d2ace1a503a5fcc90ac9d092c9c9a5939331cf"
+HANDSHAKE_SECONDS = 0.03
+ORDER_RTT_SECONDS = 0.005
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """Pays a TCP/TLS handshake on its first request, then one round-trip per request."""
+
+    def __init__(self):
+        self.connected = False
+
+    async def handle_async_request(self, request):
+        if not self.connected:
+            await asyncio.sleep(HANDSHAKE_SECONDS)
+            self.connected = True
+        await asyncio.sleep(ORDER_RTT_SECONDS)
+        payload = json.loads(request.content)
+        if payload.get("type") == "meta":
+            return httpx.Response(200, json={"universe": [{"name": "BTC", "szDecimals": 5}]})
+        if payload.get("type") == "spotMeta":
+            return httpx.Response(200, json={"universe": [], "tokens": []})
+        return httpx.Response(200, json={"status": "ok"})
+
+
+def stub_async_client(base_url):
+    return httpx.AsyncClient(base_url=base_url, transport=StubTransport())
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def make_client(stack):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_local()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = create_app()
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    # Entering the client keeps one event loop alive, as in a uvicorn worker.
+    client = stack.enter_context(TestClient(app))
+    client.post("/users/", json={"username": "bench", "password": "bench"})
+    token = client.post("/users/token", json={"username": "bench", "password": "bench"}).json()["access_token"]
+    client.headers = {"Authorization": f"Bearer {token}"}
+    wallet_id = client.post(
+        "/wallets/", json={"name": "bench", "address": "bench_address", "private_key": PRIVATE_KEY}
+    ).json()["id"]
+    return client, wallet_id
+
+
+def run(client, wallet_id, requests):
+    order = {
+        "wallet_id": wallet_id,
+        "symbol": "BTC",
+        "is_buy": True,
+        "sz": 0.1,
+        "limit_px": 50000,
+        "order_type": {"limit": {"tif": "Gtc"}},
+    }
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.post("/trades/", json=order)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(client_registry, "new_async_client", stub_async_client))
+        client, wallet_id = make_client(stack)
+        original = settings.exchange_client_pooling
+        try:
+            for label, pooling in (("before (per-request clients)", False), ("after (pooled clients)", True)):
+                settings.exchange_client_pooling = pooling
+                client_registry.clear()
+                market_cache.clear()
+                run(client, wallet_id, 5)
+                samples = run(client, wallet_id, args.requests)
+                print(
+                    f"{label:32s} p50={percentile(samples, 50):7.2f}ms "
+                    f"p99={percentile(samples, 99):7.2f}ms mean={statistics.mean(samples):7.2f}ms"
+                )
+        finally:
+            settings.exchange_client_pooling = original
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Memory and event-loop lag for many idle bots in shared worker processes.
+
+Run with ``python -m backend.benchmarks.bench_shared_bots``. Each bot is an
+``async def main()`` that wakes once a second, like a strategy waiting on a
+timer. The Hyperliquid HTTP API is stubbed, so no bot touches the network.
+Per-worker RSS and loop lag are read from the metrics the workers report.
+"""
+import argparse
+import os
+import tempfile
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from eth_account import Account
+
+from backend.config import settings
+from backend.shared_workers import SharedWorkerGroup
+
+PRIVATE_KEY = "0x4929aa0dad4277f6a1a0a7f940d2ace1a503a5fcc90ac9d092c9c9a5939331cf"
+BOT_CODE = (
+    "import asyncio\n"
+    "async def main():\n"
+    "    while True:\n"
+    "        await asyncio.sleep(1)\n"
+)
+
+
+def stub_post(self, url_path, payload=None):
+    if payload.get("type") == "spotMeta":
+        return {"universe": [], "tokens": []}
+    return {"universe": [{"name": "BTC", "szDecimals": 5}]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=settings.shared_bot_workers)
+    parser.add_argument("--settle-seconds", type=float, default=10)
+    args = parser.parse_args()
+    settings.shared_worker_report_seconds = 1
+    address = Account.from_key(PRIVATE_KEY).address
+
+    with ExitStack() as stack:
+        stack.enter_context(patch("hyperliquid.api.API.post", stub_post))
+        workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        stack.callback(os.chdir, cwd)
+
+        group = SharedWorkerGroup(args.workers)
+        stack.callback(group.shutdown)
+        started = time.monotonic()
+        for bot_id in range(args.bots):
+            group.launch(group.acquire(bot_id), BOT_CODE, {}, PRIVATE_KEY, 1000.0, address)
+        print(f"started {args.bots} bots on {args.workers} workers in {time.monotonic() - started:.2f}s")
+
+        time.sleep(args.settle_seconds)
+        total_rss = 0
+        for worker in group.stats():
+            total_rss += worker.get("rss_bytes", 0)
+            print(
+                f"worker {worker['pid']}: bots={worker.get('bots', 0):5d} "
+                f"rss={worker.get('rss_bytes', 0) / 2**20:8.1f}MiB "
+                f"loop lag={worker.get('loop_lag_ms', 0):6.2f}ms"
+            )
+        print(f"total rss={total_rss / 2**20:.1f}MiB, {total_rss / max(args.bots, 1) / 2**10:.1f}KiB per bot")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import hashlib
+import inspect
+import marshal
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from .config import settings
+
+
+def code_hash(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def compile_bot(source: str):
+    # Raises SyntaxError (or ValueError for null bytes) for code that can never run.
+    return compile(source, f"<bot {code_hash(source)[:12]}>", "exec")
+
+
+def is_async_bot(code) -> bool:
+    # True when the module defines a top-level `async def main()`.
+    return any(
+        inspect.iscode(const) and const.co_name == "main" and const.co_flags & inspect.CO_COROUTINE
+        for const in code.co_consts
+    ) and "main" in code.co_names
+
+
+class BotCodeCache:
+    """Compiled bot code keyed by the hash of its source, in memory and marshalled on disk."""
+
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        # Marshal output is only readable by the interpreter version that wrote it.
+        return os.path.join(self.directory, f"{digest}.{sys.implementation.cache_tag}.bin")
+
+    def _remember(self, digest: str, code):
+        with self._lock:
+            self._entries[digest] = code
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def store(self, source: str):
+        digest = code_hash(source)
+        code = compile_bot(source)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(tmp_path, path)
+        self._remember(digest, code)
+        return code
+
+    def load(self, source: str):
+        digest = code_hash(source)
+        with self._lock:
+            code = self._entries.get(digest)
+            if code is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return code
+        try:
+            with open(self._path(digest), "rb") as f:
+                code = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            with self._lock:
+                self.misses += 1
+            # Saved before the cache existed, or written by another Python version.
+            return self.store(source)
+        with self._lock:
+            self.hits += 1
+        self._remember(digest, code)
+        return code
+
+
+bot_code_cache = BotCodeCache(settings.bot_code_cache_dir, settings.bot_code_cache_entries)
@@ -0,0 +1,234 @@
+import os
+import resource
+import threading
+import time
+from array import array
+
+from .config import settings
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Fields of each sample, in ring buffer order.
+FIELDS = ("time", "cpu_seconds", "cpu_percent", "rss_bytes", "threads", "open_fds", "sockets")
+
+
+def sample_process(pid: int):
+    """CPU time, RSS, thread and fd counts of a process, read from /proc. None once it has exited."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, so fields are counted from its closing parenthesis.
+            stat = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        fds = os.listdir(f"/proc/{pid}/fd")
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    sockets = 0
+    for fd in fds:
+        try:
+            if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                sockets += 1
+        except OSError:
+            pass
+    return {
+        "cpu_seconds": (int(stat[11]) + int(stat[12])) / CLOCK_TICKS,
+        "rss_bytes": rss_pages * PAGE_SIZE,
+        "threads": int(stat[17]),
+        "open_fds": len(fds),
+        "sockets": sockets,
+    }
+
+
+class MetricsRing:
+    """Fixed-size ring of samples, stored as doubles in one flat array."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.count = 0
+        self._values = array("d", bytes(8 * size * len(FIELDS)))
+
+    def append(self, sample: dict):
+        at = (self.count % self.size) * len(FIELDS)
+        for offset, field in enumerate(FIELDS):
+            self._values[at + offset] = sample[field]
+        self.count += 1
+
+    def samples(self, limit: int = None):
+        available = min(self.count, self.size)
+        if limit is not None:
+            available = min(available, limit)
+        result = []
+        for index in range(self.count - available, self.count):
+            at = (index % self.size) * len(FIELDS)
+            result.append(dict(zip(FIELDS, self._values[at:at + len(FIELDS)])))
+        return result
+
+    def latest(self):
+        return self.samples(1)[0] if self.count else None
+
+
+def limits():
+    return {
+        "rss_soft_bytes": settings.bot_rss_soft_limit_mb * 2**20,
+        "rss_hard_bytes": settings.bot_rss_hard_limit_mb * 2**20,
+        "cpu_soft_percent": settings.bot_cpu_soft_limit_percent,
+        "cpu_hard_percent": settings.bot_cpu_hard_limit_percent,
+        "max_open_files": settings.bot_max_open_files,
+    }
+
+
+def _breaches(sample: dict, kind: str):
+    breached = []
+    rss_limit = settings.bot_rss_soft_limit_mb if kind == "soft" else settings.bot_rss_hard_limit_mb
+    cpu_limit = settings.bot_cpu_soft_limit_percent if kind == "soft" else settings.bot_cpu_hard_limit_percent
+    if rss_limit and sample["rss_bytes"] > rss_limit * 2**20:
+        breached.append(f"rss {sample['rss_bytes'] / 2**20:.0f}MB > {rss_limit}MB")
+    if cpu_limit and sample["cpu_percent"] > cpu_limit:
+        breached.append(f"cpu {sample['cpu_percent']:.0f}% > {cpu_limit}%")
+    return breached
+
+
+class _Tracked:
+    def __init__(self, pid: int, shared: bool):
+        self.pid = pid
+        self.shared = shared
+        self.running = True
+        self.ring = MetricsRing(settings.bot_metrics_samples)
+        self.warnings = []
+        self.hard_breaches = 0
+        self.stopped_reason = None
+
+
+class BotMonitor:
+    """Samples each running bot's process from the supervisor and enforces the configured limits."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # Called with (bot_id, reason) when a bot stays over a hard limit.
+        self.on_hard_limit = None
+        self._bots = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._run, name="bot-monitor", daemon=True)
+                self._thread.start()
+
+    def track(self, bot_id: int, pid: int, shared: bool = False):
+        # Bots sharing a worker process can only be measured as that whole process.
+        with self._lock:
+            self._bots[bot_id] = _Tracked(pid, shared)
+        self._ensure_started()
+
+    def untrack(self, bot_id: int):
+        # Samples are kept until the bot runs again, for a look at how it ended.
+        with self._lock:
+            tracked = self._bots.get(bot_id)
+            if tracked is not None:
+                tracked.running = False
+
+    def metrics(self, bot_id: int, limit: int = None):
+        with self._lock:
+            tracked = self._bots.get(bot_id)
+            if tracked is None:
+                return None
+            return {
+                "pid": tracked.pid,
+                "shared_process": tracked.shared,
+                "running": tracked.running,
+                "limits": limits(),
+                "warnings": list(tracked.warnings),
+                "stopped_reason": tracked.stopped_reason,
+                "interval": self.interval,
+                "samples": tracked.ring.samples(limit),
+            }
+
+    def latest(self, bot_id: int):
+        # (sample count, latest sample), so callers can tell when a new sample arrived.
+        with self._lock:
+            tracked = self._bots.get(bot_id)
+            if tracked is None:
+                return 0, None
+            return tracked.ring.count, tracked.ring.latest()
+
+    def sample(self):
+        with self._lock:
+            running = [(bot_id, tracked) for bot_id, tracked in self._bots.items() if tracked.running]
+        now = time.time()
+        stop = []
+        for bot_id, tracked in running:
+            sample = sample_process(tracked.pid)
+            if sample is None:
+                continue
+            previous = tracked.ring.latest()
+            cpu_percent = 0.0
+            if previous is not None and now > previous["time"]:
+                cpu_percent = max(0.0, (sample["cpu_seconds"] - previous["cpu_seconds"]) / (now - previous["time"]) * 100)
+            sample.update(time=now, cpu_percent=cpu_percent)
+            with self._lock:
+                tracked.ring.append(sample)
+                warnings = _breaches(sample, "soft")
+                if warnings and warnings != tracked.warnings:
+                    print(f"Bot {bot_id} is over its soft limits: {', '.join(warnings)}")
+                tracked.warnings = warnings
+                if tracked.shared:
+                    continue
+                # A hard limit has to be exceeded for several samples in a row, so a
+                # single burst of CPU does not stop the bot.
+                breached = _breaches(sample, "hard")
+                tracked.hard_breaches = tracked.hard_breaches + 1 if breached else 0
+                if tracked.hard_breaches >= settings.bot_limit_grace_samples:
+                    tracked.stopped_reason = f"hard limit exceeded: {', '.join(breached)}"
+                    tracked.running = False
+                    stop.append((bot_id, tracked.stopped_reason))
+        for bot_id, reason in stop:
+            print(f"Stopping bot {bot_id}: {reason}")
+            if self.on_hard_limit is not None:
+                self.on_hard_limit(bot_id, reason)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Bot monitor sample failed: {e}")
+
+
+def apply_rlimits():
+    """Kernel-enforced limits for the calling bot process; the supervisor's checks catch the rest."""
+    if settings.bot_max_open_files:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = settings.bot_max_open_files if hard == resource.RLIM_INFINITY else min(hard, settings.bot_max_open_files)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, limit))
+    if settings.bot_rss_hard_limit_mb:
+        # Linux does not enforce RLIMIT_RSS, so address space is capped instead,
+        # with headroom for the interpreter's mapped but untouched memory.
+        limit = settings.bot_rss_hard_limit_mb * 2**20 * settings.bot_address_space_factor
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def join_cgroup(bot_id: int):
+    """Moves the calling process into its own cgroup-v2 group under BOT_CGROUP_ROOT, if configured."""
+    if not settings.bot_cgroup_root:
+        return
+    path = os.path.join(settings.bot_cgroup_root, f"bot_{bot_id}")
+    try:
+        os.makedirs(path, exist_ok=True)
+        if settings.bot_rss_hard_limit_mb:
+            with open(os.path.join(path, "memory.max"), "w") as f:
+                f.write(str(settings.bot_rss_hard_limit_mb * 2**20))
+        if settings.bot_cpu_hard_limit_percent:
+            period = 100000
+            with open(os.path.join(path, "cpu.max"), "w") as f:
+                f.write(f"{int(period * settings.bot_cpu_hard_limit_percent / 100)} {period}")
+        with open(os.path.join(path, "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+    except OSError as e:
+        print(f"Could not place bot {bot_id} in cgroup {path}: {e}")
+
+
+bot_monitor = BotMonitor(settings.bot_metrics_interval_seconds)
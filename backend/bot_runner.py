@@ -1,14 +1,23 @@
 import multiprocessing
+import queue
 import sys
-import json
 import threading
-import asyncio
-import websockets
 import os
-import time
-from .hyperliquid_api import HyperliquidAPI
-from hyperliquid.exchange import Exchange
-from hyperliquid.utils import constants
+from .hyperliquid_api import HyperliquidAPI, per_order_results
+from .async_hyperliquid_api import AsyncHyperliquidAPI
+from .fill_feed import fill_feed
+from .fill_ingest import record_bot_stop
+from .database import SessionLocal
+from .config import settings
+from .status_segment import StatusWriter, segment_path
+from .bot_code_cache import bot_code_cache, is_async_bot
+from .bot_metrics import apply_rlimits, bot_monitor, join_cgroup
+from .worker_pool import WorkerPool
+from .shared_workers import SharedWorkerGroup
+from .order_book import OrderBook
+from .market_impact import estimate_impact
+from . import order_gateway
+from .order_gateway import CANCEL, MODIFY, ORDER
 from eth_account import Account
 
 class CapitalManager:
@@ -27,37 +36,59 @@ class CapitalManager:
         self.positions[symbol] += size if is_buy else -size
 
 
-class WebSocketListener:
-    def __init__(self, user_address, capital_manager):
-        self.user_address = user_address
-        self.capital_manager = capital_manager
-        self.ws_url = "ws" + constants.MAINNET_API_URL[len("http"):] + "/ws"
+def consume_fills(fill_queue, capital_manager, status_writer, stopped):
+    # Fills are pushed by the supervisor's FillFeed, which holds the upstream subscription.
+    while not stopped.is_set():
+        try:
+            fill = fill_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        capital_manager.track_fill(fill['coin'], fill['side'] == 'B', float(fill['sz']), float(fill['px']))
+        status_writer.publish(capital_manager.available_capital, capital_manager.positions)
 
-    async def listen(self):
-        async with websockets.connect(self.ws_url) as ws:
-            await ws.send(json.dumps({"method": "subscribe", "subscription": {"type": "fills", "user": self.user_address}}))
-            while True:
-                message = await ws.recv()
-                data = json.loads(message)
-                if data.get("channel") == "fills":
-                    for fill in data.get("data", []):
-                        self.capital_manager.track_fill(fill['coin'], fill['side'] == 'B', float(fill['sz']), float(fill['px']))
 
-    def run(self):
-        asyncio.run(self.listen())
+def _check_batch_capital(capital_manager, orders: list[dict]):
+    order_value = sum(order["sz"] * order["limit_px"] for order in orders if order["is_buy"])
+    if capital_manager.available_capital < order_value:
+        raise Exception(f"Order value ({order_value}) exceeds available capital ({capital_manager.available_capital}).")
 
 
 class BotTradingAPI:
+    # Orders go through the wallet's order gateway; backtests leave `address` unset and trade directly.
+    address = None
+
     def __init__(self, private_key, capital_manager):
         self.api = HyperliquidAPI(private_key=private_key)
+        self.address = Account.from_key(private_key).address
         self.capital_manager = capital_manager
 
+    def _send(self, kind: int, call, oid: int = None, weight: float = 1):
+        if self.address is None:
+            return call()
+        return order_gateway.submit_sync(self.address, kind, call, oid, weight)
+
     def place_order(self, symbol: str, is_buy: bool, sz: float, limit_px: float, order_type: dict):
         order_value = sz * limit_px
         if self.capital_manager.available_capital < order_value and is_buy:
             raise Exception(f"Order value ({order_value}) exceeds available capital ({self.capital_manager.available_capital}).")
 
-        return self.api.place_order(symbol, is_buy, sz, limit_px, order_type)
+        return self._send(ORDER, lambda: self.api.place_order(symbol, is_buy, sz, limit_px, order_type))
+
+    def modify_order(self, symbol: str, oid: int, sz: float, limit_px: float, order_type: dict, is_buy: bool = None):
+        return self._send(MODIFY, lambda: self.api.modify_order(symbol, oid, sz, limit_px, order_type, is_buy), oid)
+
+    def cancel_order(self, symbol: str, oid: int):
+        return self._send(CANCEL, lambda: self.api.cancel_order(symbol, oid), oid)
+
+    def place_orders(self, orders: list[dict]):
+        # One signed action for the lot; the capital check covers all of its buys together.
+        _check_batch_capital(self.capital_manager, orders)
+        response = self._send(ORDER, lambda: self.api.place_orders_batch(orders), weight=order_gateway.batch_weight(len(orders)))
+        return per_order_results(orders, response)
+
+    def modify_orders(self, modifies: list[dict]):
+        response = self._send(MODIFY, lambda: self.api.modify_orders_batch(modifies), weight=order_gateway.batch_weight(len(modifies)))
+        return per_order_results(modifies, response)
 
     def get_open_orders(self, user_address: str):
         return self.api.get_open_orders(user_address)
@@ -65,42 +96,88 @@ class BotTradingAPI:
     def get_positions(self, user_address: str):
         return self.api.get_positions(user_address)
 
+    def estimate_impact(self, symbol: str, is_buy: bool, sizes=None, notionals=None):
+        # The book comes from the market cache, so calling this every tick costs little.
+        book = OrderBook(symbol)
+        book.apply(self.api.get_l2_book(symbol))
+        return estimate_impact(book, is_buy, sizes, notionals)
+
+
+class AsyncBotTradingAPI:
+    # Handed to bots that define `async def main()`, so their calls don't block a shared worker's loop.
+    def __init__(self, private_key, capital_manager):
+        self.api = AsyncHyperliquidAPI(private_key=private_key)
+        self.address = Account.from_key(private_key).address
+        self.capital_manager = capital_manager
+
+    async def place_order(self, symbol: str, is_buy: bool, sz: float, limit_px: float, order_type: dict):
+        order_value = sz * limit_px
+        if self.capital_manager.available_capital < order_value and is_buy:
+            raise Exception(f"Order value ({order_value}) exceeds available capital ({self.capital_manager.available_capital}).")
+
+        return await order_gateway.submit_async(self.address, ORDER, lambda: self.api.place_order(symbol, is_buy, sz, limit_px, order_type))
+
+    async def modify_order(self, symbol: str, oid: int, sz: float, limit_px: float, order_type: dict, is_buy: bool = None):
+        return await order_gateway.submit_async(self.address, MODIFY, lambda: self.api.modify_order(symbol, oid, sz, limit_px, order_type, is_buy), oid)
 
-def dump_status(capital_manager, status_file):
-    while True:
-        status = {
-            "timestamp": time.time(),
-            "available_capital": capital_manager.available_capital,
-            "positions": capital_manager.positions
-        }
-        with open(status_file, 'w') as f_status:
-            json.dump(status, f_status)
-        time.sleep(5)
+    async def cancel_order(self, symbol: str, oid: int):
+        return await order_gateway.submit_async(self.address, CANCEL, lambda: self.api.cancel_order(symbol, oid), oid)
 
-def run_bot_process(bot_id: int, bot_code: str, runtime_inputs: dict, wallet_private_key: str, capital_allocation: float):
+    async def place_orders(self, orders: list[dict]):
+        _check_batch_capital(self.capital_manager, orders)
+        response = await order_gateway.submit_async(
+            self.address, ORDER, lambda: self.api.place_orders_batch(orders), weight=order_gateway.batch_weight(len(orders))
+        )
+        return per_order_results(orders, response)
+
+    async def modify_orders(self, modifies: list[dict]):
+        response = await order_gateway.submit_async(
+            self.address, MODIFY, lambda: self.api.modify_orders_batch(modifies), weight=order_gateway.batch_weight(len(modifies))
+        )
+        return per_order_results(modifies, response)
+
+    async def get_open_orders(self, user_address: str):
+        return await self.api.get_open_orders(user_address)
+
+    async def get_positions(self, user_address: str):
+        return await self.api.get_positions(user_address)
+
+    async def estimate_impact(self, symbol: str, is_buy: bool, sizes=None, notionals=None):
+        book = OrderBook(symbol)
+        book.apply(await self.api.get_l2_book(symbol))
+        return estimate_impact(book, is_buy, sizes, notionals)
+
+
+def publish_status(capital_manager, status_writer, stopped):
+    while not stopped.wait(settings.bot_status_heartbeat_seconds):
+        status_writer.publish(capital_manager.available_capital, capital_manager.positions)
+
+def run_bot_process(bot_id: int, bot_code: str, runtime_inputs: dict, wallet_private_key: str, capital_allocation: float, fill_queue):
     log_dir = "bot_logs"
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, f"bot_{bot_id}.log")
 
-    status_dir = "bot_status"
-    os.makedirs(status_dir, exist_ok=True)
-    status_file = os.path.join(status_dir, f"bot_{bot_id}.json")
+    # Set when the bot's code returns, so a pooled worker can run the next bot cleanly.
+    stopped = threading.Event()
+    fill_thread = None
 
-
-    with open(log_file, "w") as f:
+    # Line buffered, so dashboards see each line as soon as the bot prints it.
+    with open(log_file, "w", buffering=1) as f:
         sys.stdout = f
         sys.stderr = f
         try:
-            account = Account.from_key(wallet_private_key)
+            join_cgroup(bot_id)
+            apply_rlimits()
             capital_manager = CapitalManager(capital_allocation)
+            status_writer = StatusWriter(segment_path(bot_id))
+            status_writer.publish(capital_manager.available_capital, capital_manager.positions)
 
-            # Start the WebSocket listener in a separate thread
-            ws_listener = WebSocketListener(account.address, capital_manager)
-            ws_thread = threading.Thread(target=ws_listener.run, daemon=True)
-            ws_thread.start()
+            # Start the fill consumer in a separate thread
+            fill_thread = threading.Thread(target=consume_fills, args=(fill_queue, capital_manager, status_writer, stopped), daemon=True)
+            fill_thread.start()
 
-            # Start the status dumper thread
-            status_thread = threading.Thread(target=dump_status, args=(capital_manager, status_file), daemon=True)
+            # Start the status heartbeat thread
+            status_thread = threading.Thread(target=publish_status, args=(capital_manager, status_writer, stopped), daemon=True)
             status_thread.start()
 
             trading_api = BotTradingAPI(wallet_private_key, capital_manager)
@@ -111,40 +188,95 @@ def run_bot_process(bot_id: int, bot_code: str, runtime_inputs: dict, wallet_pri
                 "print": print,
             }
 
-            exec(bot_code, bot_globals)
+            exec(bot_code_cache.load(bot_code), bot_globals)
 
         except Exception as e:
             print(f"Error executing bot: {e}")
+        finally:
+            stopped.set()
+            if fill_thread is not None:
+                fill_thread.join()
 
 
 class BotRunner:
     def __init__(self):
         self.active_bots = {}
-
-    def start_bot(self, bot_id: int, bot_code: str, runtime_inputs: dict, wallet_private_key: str, capital_allocation: float):
-        if bot_id in self.active_bots:
-            return {"status": "error", "message": "Bot is already running"}
-
-        process = multiprocessing.Process(
-            target=run_bot_process,
-            args=(bot_id, bot_code, runtime_inputs, wallet_private_key, capital_allocation)
-        )
-        process.start()
-
-        self.active_bots[bot_id] = process
+        # Taken by everything that changes active_bots: requests, pool and shared-worker callbacks, the bot monitor.
+        self._lock = threading.Lock()
+        # Optional pool of pre-forked, warmed-up processes that bots are handed to.
+        self.pool = None
+        if settings.bot_worker_pool_size > 0:
+            self.pool = WorkerPool(settings.bot_worker_pool_size, settings.bot_worker_recycle_after, on_done=self._bot_finished)
+        # Worker processes that run many bots each, for runs started with execution_mode="shared".
+        self.shared = SharedWorkerGroup(settings.shared_bot_workers, on_done=self._bot_finished)
+        bot_monitor.on_hard_limit = self._stop_over_limit
+
+    def start_bot(self, bot_id: int, bot_code: str, runtime_inputs: dict, wallet_private_key: str, capital_allocation: float, execution_mode: str = "process"):
+        address = Account.from_key(wallet_private_key).address
+        if execution_mode == "shared" and not is_async_bot(bot_code_cache.load(bot_code)):
+            # Only bots with `async def main()` can be stopped inside a shared worker.
+            execution_mode = "process"
+
+        # Held until the bot is registered, so a bot that finishes at once is only reported after that.
+        with self._lock:
+            if bot_id in self.active_bots:
+                return {"status": "error", "message": "Bot is already running"}
+
+            if execution_mode == "shared":
+                process = self.shared.acquire(bot_id)
+                fill_feed.attach(bot_id, address, process.worker.fill_queue)
+                self.shared.launch(process, bot_code, runtime_inputs, wallet_private_key, capital_allocation, address)
+            elif self.pool is not None:
+                worker = self.pool.acquire()
+                worker.drain_fills()
+                fill_feed.attach(bot_id, address, worker.fill_queue)
+                worker.assign(bot_id, (bot_id, bot_code, runtime_inputs, wallet_private_key, capital_allocation))
+                process = worker.process
+            else:
+                fill_queue = fill_feed.attach(bot_id, address)
+                process = multiprocessing.Process(
+                    target=run_bot_process,
+                    args=(bot_id, bot_code, runtime_inputs, wallet_private_key, capital_allocation, fill_queue)
+                )
+                process.start()
+
+            self.active_bots[bot_id] = process
+            bot_monitor.track(bot_id, process.pid, shared=execution_mode == "shared")
 
         return {"status": "success", "message": f"Bot {bot_id} started with PID {process.pid}"}
 
     def stop_bot(self, bot_id: int):
-        if bot_id not in self.active_bots:
-            return {"status": "error", "message": "Bot is not running"}
-
-        process = self.active_bots[bot_id]
+        # Safe to call more than once and from any thread; only the first call stops the bot.
+        with self._lock:
+            process = self.active_bots.pop(bot_id, None)
+            if process is None:
+                return {"status": "error", "message": "Bot is not running"}
+            fill_feed.detach(bot_id)
+            bot_monitor.untrack(bot_id)
+
+        # Outside the lock: a pooled worker reports its exit through _bot_finished.
         process.terminate()
         process.join()
 
-        del self.active_bots[bot_id]
-
         return {"status": "success", "message": f"Bot {bot_id} stopped"}
 
+    def _stop_over_limit(self, bot_id: int, reason: str):
+        # Called from the monitor thread; the same stop as POST /bots/{id}/stop, so racing it stops the bot once.
+        if self.stop_bot(bot_id)["status"] != "success":
+            return
+        db = SessionLocal()
+        try:
+            record_bot_stop(db, bot_id)
+        finally:
+            db.close()
+
+    def _bot_finished(self, bot_id: int, process):
+        # A pooled worker finished its bot, or died, and may be handed another one.
+        with self._lock:
+            if self.active_bots.get(bot_id) is not process:
+                return
+            del self.active_bots[bot_id]
+            fill_feed.detach(bot_id)
+            bot_monitor.untrack(bot_id)
+
 bot_runner = BotRunner()
@@ -0,0 +1,328 @@
+import asyncio
+import ctypes
+import os
+import struct
+import time
+
+from .config import settings
+from .bot_metrics import bot_monitor
+from .status_segment import open_reader
+
+
+LOG_DIR = "bot_logs"
+
+# Most bytes read from a log in one go; a larger burst is read in several chunks.
+MAX_READ_BYTES = 1 << 20
+
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Non-blocking Linux inotify descriptor watching directories for file writes."""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not supported on this platform")
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for directory in directories:
+            if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+                errno = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(errno, f"Cannot watch {directory}")
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def read_names(self) -> set:
+        # Drains every queued event and returns the names of the files they concern.
+        names = set()
+        while True:
+            try:
+                buffer = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return names
+            position = 0
+            while position < len(buffer):
+                _, _, _, length = _EVENT_HEADER.unpack_from(buffer, position)
+                position += _EVENT_HEADER.size
+                names.add(buffer[position:position + length].rstrip(b"\0").decode())
+                position += length
+
+    def close(self):
+        os.close(self._fd)
+
+
+def log_frames(start: int, data: bytes, final: bool):
+    # Cuts log bytes read from offset `start` into frames of at most
+    # bot_tail_batch_lines whole lines. A trailing partial line is only
+    # included when `final`; otherwise it is left for the next read.
+    lines = data.split(b"\n")
+    tail = lines.pop()
+    sized = [(line, len(line) + 1) for line in lines]
+    if final and tail:
+        sized.append((tail, len(tail)))
+    frames = []
+    position = start
+    for i in range(0, len(sized), settings.bot_tail_batch_lines):
+        batch = sized[i:i + settings.bot_tail_batch_lines]
+        end = position + sum(size for _, size in batch)
+        frames.append({
+            "type": "logs",
+            "start": position,
+            "offset": end,
+            "data": [line.decode("utf-8", "replace").rstrip("\r") for line, _ in batch],
+        })
+        position = end
+    return frames, position - start
+
+
+def read_log(path: str, start: int, end: int):
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+    except FileNotFoundError:
+        return b""
+
+
+class Viewer:
+    def __init__(self, offset: int, max_queue: int):
+        self.offset = offset
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=max_queue)
+
+    def push(self, frame: dict):
+        # A viewer that falls behind loses queued frames; the gap is re-read from the file.
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(frame)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class BotTailer:
+    """Watches one bot's log file and status segment on behalf of every dashboard viewing it."""
+
+    def __init__(self, bot_id: int):
+        self.bot_id = bot_id
+        self.log_path = os.path.join(LOG_DIR, f"bot_{bot_id}.log")
+        self.viewers = set()
+        self.status = None
+        self.offset = self._log_size()
+        self._last_size = self.offset
+        self._status_reader = None
+        self._status_seq = None
+        self._read_status()
+        self._metrics_count, self.metrics = bot_monitor.latest(bot_id)
+        self._task = asyncio.create_task(self._run())
+
+    def _log_size(self) -> int:
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    async def _run(self):
+        if settings.bot_tail_use_inotify:
+            try:
+                os.makedirs(LOG_DIR, exist_ok=True)
+                inotify = Inotify([LOG_DIR])
+            except OSError as e:
+                print(f"inotify unavailable for bot {self.bot_id}, polling instead: {e}")
+            else:
+                await self._watch(inotify)
+                return
+
+        # Status is polled every bot_status_poll_seconds. The log is checked quickly
+        # while the bot is writing and less often while it is quiet.
+        loop = asyncio.get_running_loop()
+        interval = settings.bot_tail_batch_ms / 1000
+        next_log_check = loop.time()
+        while True:
+            self._read_status()
+            self._read_metrics()
+            now = loop.time()
+            if now >= next_log_check:
+                if self._read_log():
+                    interval = settings.bot_tail_batch_ms / 1000
+                else:
+                    interval = min(interval * 2, settings.bot_tail_poll_max_seconds)
+                next_log_check = now + interval
+            await asyncio.sleep(min(settings.bot_status_poll_seconds, next_log_check - now))
+
+    async def _watch(self, inotify):
+        name = os.path.basename(self.log_path)
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(inotify.fileno(), ready.set)
+        next_poll = loop.time() + settings.bot_status_poll_seconds
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(ready.wait(), max(0.0, next_poll - loop.time()))
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    ready.clear()
+                    if name in inotify.read_names():
+                        # Let a chatty bot write a little more so its lines go out in one frame.
+                        await asyncio.sleep(settings.bot_tail_batch_ms / 1000)
+                        inotify.read_names()
+                        ready.clear()
+                        self.check()
+                if loop.time() >= next_poll:
+                    # The status segment is memory mapped, so its writes raise no
+                    # events; it is polled here, on its own deadline since other
+                    # bots' logs wake this loop too. Re-checking an idle log also
+                    # flushes a final partial line.
+                    self.check()
+                    next_poll = loop.time() + settings.bot_status_poll_seconds
+        finally:
+            loop.remove_reader(inotify.fileno())
+            inotify.close()
+
+    def check(self) -> bool:
+        changed = self._read_status()
+        changed = self._read_metrics() or changed
+        return self._read_log() or changed
+
+    def _read_metrics(self) -> bool:
+        count, sample = bot_monitor.latest(self.bot_id)
+        if count == self._metrics_count:
+            return False
+        self._metrics_count, self.metrics = count, sample
+        self._broadcast({"type": "metrics", "data": sample})
+        return True
+
+    def _read_status(self) -> bool:
+        if self._status_reader is None:
+            self._status_reader = open_reader(self.bot_id)
+            if self._status_reader is None:
+                return False
+        seq = self._status_reader.sequence()
+        if seq == self._status_seq:
+            if self.status is None or self.status["stale"] or time.time() - self.status["heartbeat"] <= 3 * settings.bot_status_heartbeat_seconds:
+                return False
+            # The bot stopped sending heartbeats.
+            status = {**self.status, "stale": True}
+        else:
+            status = self._status_reader.read()
+            if status is None:
+                return False
+            self._status_seq = seq
+            # Heartbeats alone do not make a new status.
+            if self.status is not None and {**status, "heartbeat": None} == {**self.status, "heartbeat": None}:
+                return False
+        self.status = status
+        self._broadcast({"type": "status", "data": status})
+        return True
+
+    def _read_log(self) -> bool:
+        size = self._log_size()
+        if size < self.offset:
+            # The bot was restarted and its log truncated.
+            self.offset = self._last_size = 0
+            self._broadcast({"type": "reset"})
+        # A trailing partial line is held back until the file stops growing.
+        final = size == self._last_size
+        self._last_size = size
+        start = self.offset
+        while self.offset < size:
+            data = read_log(self.log_path, self.offset, min(size, self.offset + MAX_READ_BYTES))
+            frames, consumed = log_frames(self.offset, data, final and self.offset + len(data) == size)
+            if not consumed:
+                break
+            self.offset += consumed
+            for frame in frames:
+                self._broadcast(frame)
+        return self.offset != start
+
+    def _broadcast(self, frame: dict):
+        for viewer in self.viewers:
+            viewer.push(frame)
+
+    async def backlog(self, start: int, end: int):
+        # Frames for [start, end) read straight from the file, limited to the last
+        # bot_tail_backlog_bytes and starting on a line boundary.
+        if end - start > settings.bot_tail_backlog_bytes:
+            start = end - settings.bot_tail_backlog_bytes
+            data = await asyncio.to_thread(read_log, self.log_path, start, end)
+            skip = data.find(b"\n") + 1
+            start, data = start + skip, data[skip:]
+        else:
+            data = await asyncio.to_thread(read_log, self.log_path, start, end)
+        frames, _ = log_frames(start, data, True)
+        return frames
+
+    async def frames(self, viewer: Viewer):
+        if self.status is not None:
+            yield {"type": "status", "data": self.status}
+        if self.metrics is not None:
+            yield {"type": "metrics", "data": self.metrics}
+        if viewer.offset > self.offset:
+            # The client's offset is past the end of the log, which has been truncated since.
+            viewer.offset = 0
+            yield {"type": "reset"}
+        # Frames broadcast from here on are queued for the viewer, so the file only
+        # needs reading up to the current offset.
+        caught_up = self.offset
+        for frame in await self.backlog(viewer.offset, caught_up):
+            yield frame
+        viewer.offset = caught_up
+        while True:
+            frame = await viewer.get()
+            if frame["type"] == "reset":
+                viewer.offset = 0
+            elif frame["type"] == "logs":
+                if frame["offset"] <= viewer.offset:
+                    continue
+                if frame["start"] != viewer.offset:
+                    # Frames were dropped or overlap what was sent from the file; fill the gap from the file.
+                    for gap_frame in await self.backlog(viewer.offset, frame["offset"]):
+                        viewer.offset = gap_frame["offset"]
+                        yield gap_frame
+                    viewer.offset = frame["offset"]
+                    continue
+                viewer.offset = frame["offset"]
+            yield frame
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if self._status_reader is not None:
+            self._status_reader.close()
+
+
+# (event loop, bot id) -> BotTailer; tailers own asyncio primitives.
+_tailers = {}
+
+
+def open_viewer(bot_id: int, offset: int = 0):
+    key = (asyncio.get_running_loop(), bot_id)
+    tailer = _tailers.get(key)
+    if tailer is None:
+        tailer = _tailers[key] = BotTailer(bot_id)
+    viewer = Viewer(offset, settings.ws_client_queue_size)
+    tailer.viewers.add(viewer)
+    return tailer, viewer
+
+
+async def close_viewer(tailer: BotTailer, viewer: Viewer):
+    tailer.viewers.discard(viewer)
+    if not tailer.viewers:
+        del _tailers[(asyncio.get_running_loop(), tailer.bot_id)]
+        await tailer.close()
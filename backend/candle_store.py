@@ -0,0 +1,158 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import settings
+
+INTERVAL_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "8h": 28_800_000, "12h": 43_200_000,
+    "1d": 86_400_000, "3d": 259_200_000, "1w": 604_800_000, "1M": 2_678_400_000,
+}
+
+
+class CandleStore:
+    """Candles kept on disk per (symbol, interval), with the time ranges already fetched from upstream.
+
+    Only the gaps in a requested range go upstream. They are split into page-sized chunks and
+    fetched concurrently. A candle still forming is served but never recorded as fetched.
+    """
+
+    def __init__(self, path: str, page_size: int, concurrency: int):
+        self.path = path
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.upstream_chunks = 0
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the store does not create its file.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_tables(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _create_tables(conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS candles ("
+            "symbol TEXT NOT NULL, interval TEXT NOT NULL, t INTEGER NOT NULL, close_time INTEGER NOT NULL, "
+            "o REAL NOT NULL, h REAL NOT NULL, l REAL NOT NULL, c REAL NOT NULL, v REAL NOT NULL, n INTEGER NOT NULL, "
+            "PRIMARY KEY (symbol, interval, t)) WITHOUT ROWID"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS candle_coverage ("
+            "symbol TEXT NOT NULL, interval TEXT NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL, "
+            "PRIMARY KEY (symbol, interval, start))"
+        )
+
+    def missing_chunks(self, symbol: str, interval: str, start_time: int, end_time: int):
+        """Page-sized [start, end] ranges within the request that have not been fetched yet."""
+        step = INTERVAL_MS[interval]
+        covered = self._conn().execute(
+            "SELECT start, end FROM candle_coverage WHERE symbol = ? AND interval = ? AND end >= ? AND start <= ? ORDER BY start",
+            (symbol, interval, start_time, end_time),
+        ).fetchall()
+        gaps = []
+        cursor = start_time
+        for start, end in covered:
+            if start > cursor:
+                gaps.append((cursor, start - 1))
+            cursor = max(cursor, end + 1)
+        if cursor <= end_time:
+            gaps.append((cursor, end_time))
+        span = self.page_size * step
+        return [(chunk, min(chunk + span - 1, end)) for start, end in gaps for chunk in range(start, end + 1, span)]
+
+    def _store(self, symbol: str, interval: str, start_time: int, end_time: int, candles: list):
+        # Candles that opened less than one interval ago may still change, so the
+        # range recorded as fetched stops before them.
+        closed_until = min(end_time, int(time.time() * 1000) - INTERVAL_MS[interval])
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO candles (symbol, interval, t, close_time, o, h, l, c, v, n) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (symbol, interval, int(c["t"]), int(c["T"]), float(c["o"]), float(c["h"]), float(c["l"]), float(c["c"]), float(c["v"]), int(c["n"]))
+                    for c in candles
+                ],
+            )
+            if closed_until >= start_time:
+                self._cover(conn, symbol, interval, start_time, closed_until)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _cover(self, conn, symbol: str, interval: str, start_time: int, end_time: int):
+        # Merge with every range it overlaps or touches, so coverage stays a few rows.
+        rows = conn.execute(
+            "SELECT start, end FROM candle_coverage WHERE symbol = ? AND interval = ? AND end >= ? AND start <= ?",
+            (symbol, interval, start_time - 1, end_time + 1),
+        ).fetchall()
+        start = min([start_time] + [row[0] for row in rows])
+        end = max([end_time] + [row[1] for row in rows])
+        conn.executemany(
+            "DELETE FROM candle_coverage WHERE symbol = ? AND interval = ? AND start = ?",
+            [(symbol, interval, row[0]) for row in rows],
+        )
+        conn.execute("INSERT INTO candle_coverage (symbol, interval, start, end) VALUES (?, ?, ?, ?)", (symbol, interval, start, end))
+
+    def read(self, symbol: str, interval: str, start_time: int, end_time: int):
+        rows = self._conn().execute(
+            "SELECT t, close_time, o, h, l, c, v, n FROM candles WHERE symbol = ? AND interval = ? AND t BETWEEN ? AND ? ORDER BY t",
+            (symbol, interval, start_time, end_time),
+        ).fetchall()
+        # Same shape as candleSnapshot, so callers cannot tell where the candles came from.
+        return [
+            {"t": t, "T": close_time, "s": symbol, "i": interval, "o": str(o), "c": str(c), "h": str(h), "l": str(l), "v": str(v), "n": n}
+            for t, close_time, o, h, l, c, v, n in rows
+        ]
+
+    async def get_candles(self, hl_api, symbol: str, interval: str, start_time: int, end_time: int):
+        if interval not in INTERVAL_MS:
+            return await hl_api.get_candles(symbol=symbol, interval=interval, start_time=start_time, end_time=end_time)
+        chunks = await asyncio.to_thread(self.missing_chunks, symbol, interval, start_time, end_time)
+        if chunks:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def fetch(chunk):
+                async with semaphore:
+                    candles = await hl_api.get_candles(symbol=symbol, interval=interval, start_time=chunk[0], end_time=chunk[1])
+                await asyncio.to_thread(self._store, symbol, interval, chunk[0], chunk[1], candles)
+
+            self.upstream_chunks += len(chunks)
+            await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+        return await asyncio.to_thread(self.read, symbol, interval, start_time, end_time)
+
+    def get_candles_sync(self, hl_api, symbol: str, interval: str, start_time: int, end_time: int):
+        # For callers outside the event loop, such as backtests; chunks are fetched on threads.
+        if interval not in INTERVAL_MS:
+            return hl_api.get_candles(symbol, interval, start_time, end_time)
+        chunks = self.missing_chunks(symbol, interval, start_time, end_time)
+        if chunks:
+            self.upstream_chunks += len(chunks)
+            with ThreadPoolExecutor(self.concurrency) as pool:
+                fetched = pool.map(lambda chunk: (chunk, hl_api.get_candles(symbol, interval, chunk[0], chunk[1])), chunks)
+                for chunk, candles in fetched:
+                    self._store(symbol, interval, chunk[0], chunk[1], candles)
+        return self.read(symbol, interval, start_time, end_time)
+
+    def stats(self):
+        conn = self._conn()
+        return {
+            "path": self.path,
+            "candles": conn.execute("SELECT COUNT(*) FROM candles").fetchone()[0],
+            "ranges": conn.execute("SELECT COUNT(*) FROM candle_coverage").fetchone()[0],
+            "upstream_chunks": self.upstream_chunks,
+        }
+
+
+candle_store = CandleStore(settings.candle_store_path, settings.candle_page_size, settings.candle_fetch_concurrency)
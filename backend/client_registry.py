@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import threading
+import time
+
+import httpx
+from eth_account import Account
+from hyperliquid.exchange import Exchange
+from hyperliquid.info import Info
+
+from .config import settings
+
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class _Entry:
+    __slots__ = ("address", "client", "created_at", "last_used")
+
+    def __init__(self, address, client):
+        self.address = address
+        self.client = client
+        self.created_at = self.last_used = time.monotonic()
+
+
+async def _closed_with_loop(client: httpx.AsyncClient):
+    # Left suspended for as long as the loop runs. asyncio.run() finalizes the async generators
+    # that are still alive before it closes the loop, so the client is closed on its own loop.
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+class ClientRegistry:
+    """Long-lived exchange clients: one Info and one async HTTP pool per network, one signer per wallet."""
+
+    def __init__(self, idle_timeout: float, meta_refresh: float):
+        self.idle_timeout = idle_timeout
+        self.meta_refresh = meta_refresh
+        self._infos = {}
+        self._metas = {}
+        self._signers = {}
+        self._exchanges = {}
+        self._async_clients = {}
+        self._closers = {}  # same keys as _async_clients; kept referenced so they are finalized with their loop
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _fingerprint(private_key: str) -> str:
+        return hashlib.sha256(private_key.encode()).hexdigest()
+
+    def get_info(self, base_url: str) -> Info:
+        with self._lock:
+            info = self._infos.get(base_url)
+            if info is None:
+                info = Info(base_url, skip_ws=True)
+                self._infos[base_url] = info
+            return info
+
+    def _get_metas(self, base_url: str):
+        cached = self._metas.get(base_url)
+        if cached is None or time.monotonic() - cached[0] > self.meta_refresh:
+            info = self.get_info(base_url)
+            cached = (time.monotonic(), info.meta(), info.spot_meta())
+            self._metas[base_url] = cached
+        return cached[1], cached[2]
+
+    def warm(self, base_url: str):
+        # Fetches network metadata ahead of the first exchange client.
+        with self._lock:
+            self._get_metas(base_url)
+
+    def new_async_client(self, base_url: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            http2=HTTP2_AVAILABLE,
+            timeout=settings.exchange_http_timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=settings.exchange_http_max_connections,
+                max_keepalive_connections=settings.exchange_http_max_connections,
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+
+    def get_async_client(self, base_url: str) -> httpx.AsyncClient:
+        # httpx pools are bound to the event loop they were first used on.
+        loop = asyncio.get_running_loop()
+        key = (base_url, loop)
+        with self._lock:
+            client = self._async_clients.get(key)
+            if client is None or client.is_closed:
+                # Their loops closed them on the way out; only the references are left to drop.
+                for stale_key in [k for k in self._async_clients if k[1].is_closed()]:
+                    del self._async_clients[stale_key]
+                    self._closers.pop(stale_key, None)
+                client = self._async_clients[key] = self.new_async_client(base_url)
+                closer = self._closers[key] = _closed_with_loop(client)
+                loop.create_task(self._start_closer(closer))
+            return client
+
+    @staticmethod
+    async def _start_closer(closer):
+        await closer.__anext__()
+
+    def get_signer(self, private_key: str):
+        key = self._fingerprint(private_key)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._signers.get(key)
+            if entry is None:
+                account = Account.from_key(private_key)
+                entry = self._signers[key] = _Entry(account.address, account)
+            entry.last_used = now
+            return entry.client
+
+    def get_exchange(self, private_key: str, base_url: str) -> Exchange:
+        key = (base_url, self._fingerprint(private_key))
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._exchanges.get(key)
+            if entry is not None and now - entry.created_at <= self.meta_refresh:
+                entry.last_used = now
+                return entry.client
+
+            account = self.get_signer(private_key)
+            meta, spot_meta = self._get_metas(base_url)
+            exchange = Exchange(account, base_url, meta=meta, spot_meta=spot_meta)
+            self._exchanges[key] = _Entry(account.address, exchange)
+            return exchange
+
+    def _evict_idle(self, now: float):
+        for entries in (self._signers, self._exchanges):
+            expired = [key for key, entry in entries.items() if now - entry.last_used > self.idle_timeout]
+            for key in expired:
+                del entries[key]
+
+    def invalidate(self, private_key: str):
+        # Called when a wallet is deleted or re-imported so a stale signer is never reused. Matched by
+        # the key itself: a wallet's stored address is not the signer's for an agent (API wallet) key.
+        fingerprint = self._fingerprint(private_key)
+        with self._lock:
+            self._signers.pop(fingerprint, None)
+            for key in [key for key in self._exchanges if key[1] == fingerprint]:
+                del self._exchanges[key]
+
+    def clear(self):
+        with self._lock:
+            self._infos.clear()
+            self._metas.clear()
+            self._signers.clear()
+            self._exchanges.clear()
+            # Closers stay referenced: one dropped after a fork would be finalized through the parent's loop.
+            self._async_clients.clear()
+
+    def __len__(self):
+        return len(self._exchanges)
+
+
+client_registry = ClientRegistry(
+    idle_timeout=settings.exchange_client_idle_seconds,
+    meta_refresh=settings.exchange_meta_refresh_seconds,
+)
@@ -8,6 +8,74 @@ class Settings(BaseSettings):
     encryption_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    market_cache_backend: str = "memory"
+    market_cache_path: str = "market_cache.sqlite3"
+    market_cache_max_entries: int = 1024
+    market_cache_ttls: dict[str, float] = {}
+    exchange_client_pooling: bool = True
+    exchange_client_idle_seconds: float = 900
+    exchange_meta_refresh_seconds: float = 3600
+    exchange_http_timeout_seconds: float = 10
+    exchange_http_max_connections: int = 100
+    upstream_concurrency_limit: int = 8
+    upstream_call_timeout_seconds: float = 5
+    ws_client_queue_size: int = 100
+    fill_feed_linger_seconds: float = 60
+    fill_feed_linger_buffer: int = 1000
+    bot_tail_use_inotify: bool = True
+    bot_tail_batch_ms: int = 100
+    bot_tail_batch_lines: int = 500
+    bot_tail_poll_max_seconds: float = 1
+    bot_tail_backlog_bytes: int = 262144
+    bot_status_heartbeat_seconds: float = 0.5
+    bot_status_poll_seconds: float = 0.25
+    bot_worker_pool_size: int = 0
+    bot_worker_recycle_after: int = 20
+    shared_bot_workers: int = 2
+    shared_worker_report_seconds: float = 5
+    bot_code_cache_dir: str = "bot_code_cache"
+    bot_code_cache_entries: int = 256
+    bot_metrics_interval_seconds: float = 2
+    bot_metrics_samples: int = 300
+    bot_rss_soft_limit_mb: int = 0
+    bot_rss_hard_limit_mb: int = 0
+    bot_cpu_soft_limit_percent: float = 0
+    bot_cpu_hard_limit_percent: float = 0
+    bot_limit_grace_samples: int = 3
+    bot_max_open_files: int = 0
+    bot_address_space_factor: int = 4
+    bot_cgroup_root: str = ""
+    backtest_timeout_seconds: float = 120
+    backtest_curve_points: int = 1000
+    backtest_max_fills: int = 1000
+    backtest_log_lines: int = 200
+    sweep_workers: int = 0
+    sweep_max_runs: int = 2000
+    sweep_timeout_seconds: float = 600
+    sweep_scratch_dir: str = ""
+    candle_store_path: str = "candles.sqlite3"
+    candle_page_size: int = 5000
+    candle_fetch_concurrency: int = 4
+    fill_ingest_interval_seconds: float = 60
+    fill_ingest_batch_size: int = 500
+    fill_ingest_lookback_days: int = 90
+    fill_ingest_overlap_ms: int = 60_000
+    fill_ingest_lock_path: str = "fill_ingest.lock"
+    trade_history_max_page: int = 2000
+    book_idle_seconds: float = 60
+    order_gateway_rate_per_second: float = 10
+    order_gateway_burst: float = 50
+    order_gateway_sync_seconds: float = 60
+    order_gateway_threads: int = 8
+    order_gateway_bucket_path: str = "order_gateway.sqlite3"
+    order_gateway_idle_seconds: float = 300
+    key_cache_ttl_seconds: float = 300
+    key_cache_size: int = 256
+    wallet_import_chunk_size: int = 500
+    wallet_import_threads: int = 4
+    principal_cache_ttl_seconds: float = 30
+    principal_cache_size: int = 10_000
+    password_hash_threads: int = 2
 
     class Config:
         env_file = ".env"
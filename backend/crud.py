@@ -1,18 +1,20 @@
 from sqlalchemy.orm import Session
 from cryptography.fernet import Fernet
 from . import models, schemas
-from .passwords import get_password_hash
 from .config import settings
+from .client_registry import client_registry
+from .bot_code_cache import bot_code_cache
+from .key_cache import KeyCache
 
 f = Fernet(settings.encryption_key.encode())
+key_cache = KeyCache(lambda ciphertext: f.decrypt(ciphertext.encode()), settings.key_cache_ttl_seconds, settings.key_cache_size)
 
 
 def get_user(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
@@ -20,18 +22,21 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
+# Wallets are returned with their key still encrypted; wallet_private_key decrypts it for a signer.
 def get_wallets(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    wallets = db.query(models.Wallet).filter(models.Wallet.owner_id == user_id).offset(skip).limit(limit).all()
-    for wallet in wallets:
-        wallet.private_key = f.decrypt(wallet.private_key.encode()).decode()
-    return wallets
+    return db.query(models.Wallet).filter(models.Wallet.owner_id == user_id).offset(skip).limit(limit).all()
 
 
 def get_wallet(db: Session, wallet_id: int, user_id: int):
-    wallet = db.query(models.Wallet).filter(models.Wallet.id == wallet_id, models.Wallet.owner_id == user_id).first()
-    if wallet:
-        wallet.private_key = f.decrypt(wallet.private_key.encode()).decode()
-    return wallet
+    return db.query(models.Wallet).filter(models.Wallet.id == wallet_id, models.Wallet.owner_id == user_id).first()
+
+
+def get_wallet_by_address(db: Session, address: str, user_id: int):
+    return db.query(models.Wallet).filter(models.Wallet.address == address, models.Wallet.owner_id == user_id).first()
+
+
+def wallet_private_key(wallet: models.Wallet) -> str:
+    return key_cache.get(wallet.private_key)
 
 
 def create_wallet(db: Session, wallet: schemas.WalletCreate, user_id: int):
@@ -45,7 +50,22 @@ def create_wallet(db: Session, wallet: schemas.WalletCreate, user_id: int):
     db.add(db_wallet)
     db.commit()
     db.refresh(db_wallet)
-    db_wallet.private_key = wallet.private_key
+    client_registry.invalidate(wallet.private_key)
+    return db_wallet
+
+
+def delete_wallet(db: Session, wallet_id: int, user_id: int):
+    db_wallet = db.query(models.Wallet).filter(models.Wallet.id == wallet_id, models.Wallet.owner_id == user_id).first()
+    if db_wallet:
+        for model in (models.PnlLot, models.PnlAggregate, models.PnlCursor, models.FundingPayment, models.FillWatermark):
+            db.query(model).filter(model.wallet_id == wallet_id).delete()
+        db.query(models.BotRun).filter(models.BotRun.wallet_id == wallet_id).delete()
+        db.query(models.Trade).filter(models.Trade.wallet_id == wallet_id).delete()
+        private_key = wallet_private_key(db_wallet)
+        db.delete(db_wallet)
+        db.commit()
+        client_registry.invalidate(private_key)
+        key_cache.invalidate(db_wallet.private_key)
     return db_wallet
 
 
@@ -54,6 +74,8 @@ def get_bots(db: Session, user_id: int, skip: int = 0, limit: int = 100):
 
 
 def create_bot(db: Session, bot: schemas.BotCreate, user_id: int):
+    # Compiling here rejects code that cannot run and warms the cache the runner loads from.
+    bot_code_cache.store(bot.code)
     db_bot = models.Bot(**bot.dict(), owner_id=user_id)
     db.add(db_bot)
     db.commit()
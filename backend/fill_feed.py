@@ -0,0 +1,129 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+from .config import settings
+from .ws_hub import get_hub
+
+
+class _SeenFills:
+    def __init__(self, size: int = 4096):
+        self._order = deque(maxlen=size)
+        self._tids = set()
+
+    def add(self, tid) -> bool:
+        if tid in self._tids:
+            return False
+        if len(self._order) == self._order.maxlen:
+            self._tids.discard(self._order[0])
+        self._order.append(tid)
+        self._tids.add(tid)
+        return True
+
+
+class FillFeed:
+    """Supervisor-side fills feed: one upstream subscription per wallet, fanned out to bot processes."""
+
+    def __init__(self, linger: float):
+        self.linger = linger
+        self._channels = {}  # bot_id -> (address, multiprocessing.Queue, whether the feed created it)
+        self._watchers = {}  # address -> pump task
+        self._lingering = {}  # address -> TimerHandle
+        self._held = {}  # address -> fills that arrived with no bot attached, replayed to the next one
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="fill-feed", daemon=True)
+                self._thread.start()
+
+    def attach(self, bot_id: int, address: str, fill_queue=None):
+        # The subscription is in place before the bot process starts, so nothing
+        # filled while the bot boots is lost. Pooled workers bring their own queue.
+        address = address.lower()
+        owned = fill_queue is None
+        if owned:
+            fill_queue = multiprocessing.Queue()
+        self._ensure_started()
+        with self._lock:
+            self._channels[bot_id] = (address, fill_queue, owned)
+        asyncio.run_coroutine_threadsafe(self._watch(address), self._loop).result(timeout=10)
+        return fill_queue
+
+    def detach(self, bot_id: int):
+        with self._lock:
+            channel = self._channels.pop(bot_id, None)
+            still_used = channel is not None and any(address == channel[0] for address, _, _ in self._channels.values())
+        if channel is None:
+            return
+        if channel[2]:
+            channel[1].close()
+        if not still_used:
+            # Keep the upstream subscription briefly so a restarting bot reattaches to it.
+            self._loop.call_soon_threadsafe(self._schedule_unwatch, channel[0])
+
+    async def _watch(self, address: str):
+        handle = self._lingering.pop(address, None)
+        if handle is not None:
+            handle.cancel()
+        held = self._held.pop(address, None)
+        if held:
+            for fill in held:
+                self._deliver(address, fill)
+        if address not in self._watchers:
+            hub = get_hub()
+            started = int(time.time() * 1000)
+            subscriber = await hub.subscribe({"type": "userFills", "user": address})
+            self._watchers[address] = asyncio.create_task(self._pump(address, hub, subscriber, started))
+
+    def _schedule_unwatch(self, address: str):
+        if address in self._watchers and address not in self._lingering:
+            self._lingering[address] = self._loop.call_later(self.linger, self._unwatch, address)
+
+    def _unwatch(self, address: str):
+        self._lingering.pop(address, None)
+        with self._lock:
+            if any(bot_address == address for bot_address, _, _ in self._channels.values()):
+                return
+        self._held.pop(address, None)
+        task = self._watchers.pop(address, None)
+        if task is not None:
+            task.cancel()
+
+    async def _pump(self, address: str, hub, subscriber, started: int):
+        seen = _SeenFills()
+        try:
+            while True:
+                data = (await subscriber.get()).get("data", {})
+                # The snapshot sent on (re)subscribe repeats history; only fills made
+                # since the feed started and not yet delivered are passed on.
+                is_snapshot = data.get("isSnapshot", False)
+                for fill in data.get("fills", []):
+                    if not seen.add(fill.get("tid", (fill.get("hash"), fill.get("oid"), fill.get("time")))):
+                        continue
+                    if is_snapshot and fill.get("time", 0) < started:
+                        continue
+                    self._deliver(address, fill)
+        finally:
+            await hub.unsubscribe(subscriber)
+
+    def _deliver(self, address: str, fill: dict):
+        # Bots in a shared worker share its queue, so each queue gets a fill once,
+        # tagged with the wallet for the worker to route it.
+        with self._lock:
+            queues = {id(fill_queue): fill_queue for bot_address, fill_queue, _ in self._channels.values() if bot_address == address}
+        if not queues:
+            # The subscription is lingering after the last bot detached; keep the fill for a restart.
+            self._held.setdefault(address, deque(maxlen=settings.fill_feed_linger_buffer)).append(fill)
+            return
+        for fill_queue in queues.values():
+            fill_queue.put({**fill, "user": address})
+
+
+fill_feed = FillFeed(linger=settings.fill_feed_linger_seconds)
@@ -0,0 +1,260 @@
+import asyncio
+import fcntl
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, pnl
+from .config import settings
+from .database import SessionLocal
+from .hyperliquid_api import HyperliquidAPI
+
+# userFillsByTime and userFunding return at most this many entries per call, oldest first.
+FILLS_PAGE_LIMIT = 2000
+FUNDING_PAGE_LIMIT = 500
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _bot_for(runs, time_ms: int):
+    # Only attributed when exactly one bot was running on the wallet at the time;
+    # a wallet shared by concurrent bots cannot be split from the fill alone.
+    bot_ids = {run.bot_id for run in runs if run.started_at_ms <= time_ms and (run.stopped_at_ms is None or time_ms <= run.stopped_at_ms)}
+    return bot_ids.pop() if len(bot_ids) == 1 else None
+
+
+def _trade_row(wallet_id: int, fill: dict, runs):
+    time_ms = int(fill["time"])
+    return {
+        "wallet_id": wallet_id,
+        "bot_id": _bot_for(runs, time_ms),
+        "symbol": fill["coin"],
+        "side": "buy" if fill["side"] == "B" else "sell",
+        "price": float(fill["px"]),
+        "quantity": float(fill["sz"]),
+        "timestamp": datetime.fromtimestamp(time_ms / 1000, tz=timezone.utc),
+        "time_ms": time_ms,
+        "tid": int(fill["tid"]),
+        "oid": int(fill["oid"]) if fill.get("oid") is not None else None,
+        "fee": float(fill.get("fee", 0)),
+        "closed_pnl": float(fill.get("closedPnl", 0)),
+        "direction": fill.get("dir"),
+        "hash": fill.get("hash"),
+    }
+
+
+def _insert_batch(db: Session, wallet_id: int, fills: list, runs):
+    tids = {int(fill["tid"]) for fill in fills}
+    while True:
+        existing = set(db.scalars(select(models.Trade.tid).where(models.Trade.wallet_id == wallet_id, models.Trade.tid.in_(tids))))
+        rows = {}
+        for fill in fills:
+            tid = int(fill["tid"])
+            if tid not in existing and tid not in rows:
+                rows[tid] = _trade_row(wallet_id, fill, runs)
+        try:
+            if rows:
+                db.execute(insert(models.Trade), list(rows.values()))
+            db.commit()
+            return len(rows)
+        except IntegrityError:
+            # The background pass and an on-demand ingestion of the wallet raced, and the
+            # other stored some of these fills first; the batch is retried without them.
+            db.rollback()
+
+
+def _pages(fetch, address: str, start: int, end: int, page_limit: int):
+    while True:
+        page = fetch(address, start, end) or []
+        yield page
+        if not page:
+            return
+        newest = max(int(entry["time"]) for entry in page)
+        # A full page may have more entries after it. The next page starts at the newest
+        # entry's millisecond, since entries sharing it can straddle the page boundary.
+        if len(page) < page_limit:
+            return
+        if newest <= start:
+            # A whole page in one millisecond: the API pages by time only, so the rest of that
+            # millisecond cannot be asked for. Carry on from the next one rather than stop.
+            print(f"More than {page_limit} entries for {address} at {start}; some of them may be missing")
+            newest = start + 1
+        start = newest
+
+
+def _start(last_ms: int, now_ms: int):
+    if last_ms is None:
+        return now_ms - settings.fill_ingest_lookback_days * 86_400_000
+    return max(0, last_ms - settings.fill_ingest_overlap_ms)
+
+
+def ingest_wallet(db: Session, wallet: models.Wallet, fetch_fills, now_ms: int = None):
+    """Pulls a wallet's fills since its watermark into the trades table; returns how many were new.
+
+    `fetch_fills(address, start_ms, end_ms)` is `HyperliquidAPI.get_user_fills_by_time`. The
+    watermark is re-read with some overlap, and fills already stored are skipped by tid.
+    """
+    now_ms = now_ms or _now_ms()
+    watermark = db.get(models.FillWatermark, wallet.id)
+    start = _start(watermark and watermark.last_fill_ms, now_ms)
+    latest = watermark.last_fill_ms if watermark is not None else start
+    runs = db.scalars(select(models.BotRun).where(models.BotRun.wallet_id == wallet.id)).all()
+
+    inserted = 0
+    for page in _pages(fetch_fills, wallet.address, start, now_ms, FILLS_PAGE_LIMIT):
+        for at in range(0, len(page), settings.fill_ingest_batch_size):
+            inserted += _insert_batch(db, wallet.id, page[at:at + settings.fill_ingest_batch_size], runs)
+        latest = max([latest] + [int(fill["time"]) for fill in page])
+
+    try:
+        if watermark is None:
+            db.add(models.FillWatermark(wallet_id=wallet.id, last_fill_ms=latest))
+        else:
+            watermark.last_fill_ms = latest
+        db.commit()
+    except IntegrityError:
+        # Created by the other ingestion in the meantime.
+        db.rollback()
+        watermark = db.get(models.FillWatermark, wallet.id)
+        watermark.last_fill_ms = max(watermark.last_fill_ms or 0, latest)
+        db.commit()
+    return inserted
+
+
+def ingest_wallet_in_session(bind, wallet_id: int, fetch_fills):
+    """ingest_wallet in a session of its own, for callers that hand the work to another thread."""
+    db = Session(bind=bind, autoflush=False)
+    try:
+        return ingest_wallet(db, db.get(models.Wallet, wallet_id), fetch_fills)
+    finally:
+        db.close()
+
+
+def ingest_funding(db: Session, wallet: models.Wallet, fetch_funding, now_ms: int = None):
+    """Like ingest_wallet, for the wallet's funding payments; one per symbol and funding time."""
+    now_ms = now_ms or _now_ms()
+    watermark = db.get(models.FillWatermark, wallet.id)
+    last_ms = watermark.last_funding_ms if watermark is not None else None
+    start = _start(last_ms, now_ms)
+    latest = last_ms if last_ms is not None else start
+
+    inserted = 0
+    for page in _pages(fetch_funding, wallet.address, start, now_ms, FUNDING_PAGE_LIMIT):
+        payments = {}
+        for entry in page:
+            delta = entry["delta"]
+            if delta.get("type") == "funding":
+                payments[(delta["coin"], int(entry["time"]))] = delta
+        times = {time_ms for _, time_ms in payments}
+        existing = set(db.execute(
+            select(models.FundingPayment.symbol, models.FundingPayment.time_ms)
+            .where(models.FundingPayment.wallet_id == wallet.id, models.FundingPayment.time_ms.in_(times))
+        ).tuples()) if times else set()
+        rows = [
+            {"wallet_id": wallet.id, "symbol": coin, "time_ms": time_ms, "usdc": float(delta["usdc"]),
+             "position_size": float(delta.get("szi", 0)), "rate": float(delta.get("fundingRate", 0))}
+            for (coin, time_ms), delta in payments.items() if (coin, time_ms) not in existing
+        ]
+        if rows:
+            db.execute(insert(models.FundingPayment), rows)
+        db.commit()
+        inserted += len(rows)
+        latest = max([latest] + [int(entry["time"]) for entry in page])
+
+    if watermark is None:
+        watermark = models.FillWatermark(wallet_id=wallet.id, last_fill_ms=start)
+        db.add(watermark)
+    watermark.last_funding_ms = latest
+    db.commit()
+    return inserted
+
+
+def ingest_all(api: HyperliquidAPI = None):
+    api = api or HyperliquidAPI()
+    db = SessionLocal()
+    try:
+        for wallet in db.scalars(select(models.Wallet)).all():
+            try:
+                ingest_wallet(db, wallet, api.get_user_fills_by_time)
+                ingest_funding(db, wallet, api.get_user_funding)
+                pnl.update_wallet(db, wallet.id)
+            except Exception as e:
+                db.rollback()
+                print(f"Fill ingestion failed for wallet {wallet.id}: {e}")
+    finally:
+        db.close()
+
+
+def _take_ingest_lock():
+    # Held until the process exits, when the OS releases it for another worker to take.
+    lock_file = open(settings.fill_ingest_lock_path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+async def run_fill_ingestion():
+    # Started by every API worker, but only the one holding the lock file runs passes; the
+    # others check again each interval. Each pass is a blocking job on a thread.
+    lock = None
+    while True:
+        if lock is None:
+            lock = _take_ingest_lock()
+        if lock is not None:
+            try:
+                await asyncio.to_thread(ingest_all)
+            except Exception as e:
+                print(f"Fill ingestion pass failed: {e}")
+        await asyncio.sleep(settings.fill_ingest_interval_seconds)
+
+
+def record_bot_start(db: Session, bot_id: int, wallet_id: int):
+    db.add(models.BotRun(bot_id=bot_id, wallet_id=wallet_id, started_at_ms=_now_ms()))
+    db.commit()
+
+
+def record_bot_stop(db: Session, bot_id: int):
+    for run in db.scalars(select(models.BotRun).where(models.BotRun.bot_id == bot_id, models.BotRun.stopped_at_ms.is_(None))):
+        run.stopped_at_ms = _now_ms()
+    db.commit()
+
+
+def trade_history(db: Session, wallet_id: int, limit: int, before: tuple = None, bot_id: int = None, coin: str = None):
+    """A page of stored fills, newest first, after the (time_ms, id) keyset cursor `before`."""
+    query = select(models.Trade).where(models.Trade.wallet_id == wallet_id, models.Trade.time_ms.is_not(None))
+    if before is not None:
+        time_ms, trade_id = before
+        query = query.where(or_(models.Trade.time_ms < time_ms, and_(models.Trade.time_ms == time_ms, models.Trade.id < trade_id)))
+    if bot_id is not None:
+        query = query.where(models.Trade.bot_id == bot_id)
+    if coin is not None:
+        query = query.where(models.Trade.symbol == coin)
+    trades = db.scalars(query.order_by(models.Trade.time_ms.desc(), models.Trade.id.desc()).limit(limit)).all()
+    next_cursor = f"{trades[-1].time_ms}:{trades[-1].id}" if len(trades) == limit else None
+    return trades, next_cursor
+
+
+def as_fill(trade: models.Trade):
+    # Same fields as the exchange's userFills, so clients read either alike.
+    return {
+        "coin": trade.symbol,
+        "side": "B" if trade.side == "buy" else "A",
+        "px": str(trade.price),
+        "sz": str(trade.quantity),
+        "time": trade.time_ms,
+        "fee": str(trade.fee),
+        "closedPnl": str(trade.closed_pnl),
+        "dir": trade.direction,
+        "oid": trade.oid,
+        "tid": trade.tid,
+        "hash": trade.hash,
+        "bot_id": trade.bot_id,
+    }
@@ -2,14 +2,55 @@ from hyperliquid.info import Info
 from hyperliquid.exchange import Exchange
 from hyperliquid.utils import constants
 from .exchange_interface import ExchangeInterface
+from .market_cache import cached
+from .client_registry import client_registry
+from .config import settings
 from eth_account import Account
 
+
+def _order_request(order: dict, is_buy: bool = None):
+    return {
+        "coin": order["symbol"],
+        "is_buy": order["is_buy"] if is_buy is None else is_buy,
+        "sz": order["sz"],
+        "limit_px": order["limit_px"],
+        "order_type": order["order_type"],
+        "reduce_only": order.get("reduce_only", False),
+    }
+
+
+def resting_side(status, oid: int) -> bool:
+    """Whether the order an orderStatus response describes is a buy."""
+    order = status.get("order") if isinstance(status, dict) else None
+    if not order:
+        reason = status.get("status") if isinstance(status, dict) else status
+        raise ValueError(f"Order {oid} was not found on the exchange ({reason}); give is_buy to modify it.")
+    return order["order"]["side"] == "B"
+
+
+def per_order_results(orders: list, response):
+    """Pairs each order of a bulk action with its status; the exchange returns them in request order.
+
+    A rejection of the whole action is repeated for every order.
+    """
+    if not isinstance(response, dict) or response.get("status") != "ok":
+        error = response.get("response") if isinstance(response, dict) else response
+        return [{"index": index, "order": order, "status": {"error": error}} for index, order in enumerate(orders)]
+    statuses = (response.get("response", {}).get("data") or {}).get("statuses") or ["success"] * len(orders)
+    return [{"index": index, "order": order, "status": status} for index, (order, status) in enumerate(zip(orders, statuses))]
+
+
 class HyperliquidAPI(ExchangeInterface):
     def __init__(self, private_key=None, is_mainnet=True):
-        self.info = Info(constants.MAINNET_API_URL if is_mainnet else constants.TESTNET_API_URL)
+        self.base_url = constants.MAINNET_API_URL if is_mainnet else constants.TESTNET_API_URL
+        if settings.exchange_client_pooling:
+            self.info = client_registry.get_info(self.base_url)
+            self.exchange = client_registry.get_exchange(private_key, self.base_url) if private_key else None
+            return
+        self.info = Info(self.base_url)
         if private_key:
             account = Account.from_key(private_key)
-            self.exchange = Exchange(account, constants.MAINNET_API_URL if is_mainnet else constants.TESTNET_API_URL)
+            self.exchange = Exchange(account, self.base_url)
         else:
             self.exchange = None
 
@@ -19,12 +60,15 @@ class HyperliquidAPI(ExchangeInterface):
     def get_sub_accounts(self, user_address: str):
         return self.info.sub_accounts(user_address)
 
+    @cached
     def get_all_mids(self):
         return self.info.all_mids()
 
+    @cached
     def get_meta(self):
         return self.info.meta()
 
+    @cached
     def get_vault_meta(self):
         return self.info.vault_meta()
 
@@ -43,10 +87,13 @@ class HyperliquidAPI(ExchangeInterface):
             raise Exception("Exchange not initialized. Provide a private key.")
         return self.exchange.order(symbol, is_buy, sz, limit_px, order_type)
 
-    def modify_order(self, symbol: str, oid: int, sz: float, limit_px: float, order_type: dict):
+    def modify_order(self, symbol: str, oid: int, sz: float, limit_px: float, order_type: dict, is_buy: bool | None = None):
         if not self.exchange:
             raise Exception("Exchange not initialized. Provide a private key.")
-        return self.exchange.modify_order(symbol, oid, sz, limit_px, order_type)
+        if is_buy is None:
+            # The exchange needs the side of the replacement; keep the resting order's.
+            is_buy = resting_side(self.query_order_status(self.exchange.wallet.address, oid), oid)
+        return self.exchange.modify_order(oid=oid, name=symbol, is_buy=is_buy, sz=sz, limit_px=limit_px, order_type=order_type)
 
     def cancel_order(self, symbol: str, oid: int):
         if not self.exchange:
@@ -58,6 +105,24 @@ class HyperliquidAPI(ExchangeInterface):
             raise Exception("Exchange not initialized. Provide a private key.")
         return self.exchange.cancel_batch(cancellations)
 
+    def place_orders_batch(self, orders: list[dict]):
+        # One signed action for every order; `orders` are dicts of place_order's arguments.
+        if not self.exchange:
+            raise Exception("Exchange not initialized. Provide a private key.")
+        return self.exchange.bulk_orders([_order_request(order) for order in orders])
+
+    def modify_orders_batch(self, modifies: list[dict]):
+        # Like place_orders_batch, each with the `oid` it replaces; a missing side is read from the resting order.
+        if not self.exchange:
+            raise Exception("Exchange not initialized. Provide a private key.")
+        requests = []
+        for modify in modifies:
+            is_buy = modify.get("is_buy")
+            if is_buy is None:
+                is_buy = resting_side(self.query_order_status(self.exchange.wallet.address, modify["oid"]), modify["oid"])
+            requests.append({"oid": modify["oid"], "order": _order_request(modify, is_buy)})
+        return self.exchange.bulk_modify_orders_new(requests)
+
     def get_open_orders(self, user_address: str):
         return self.info.frontend_open_orders(user_address)
 
@@ -68,11 +133,13 @@ class HyperliquidAPI(ExchangeInterface):
     def get_user_vault_equity(self, user_address: str):
         return self.info.user_vault_equities(user_address)
 
+    @cached
     def get_vault_details(self, vault_address: str):
         # The SDK's info.vault_details method requires a user address.
         # We can pass the zero address for public vault data.
         return self.info.vault_details(user=constants.ZERO_ADDRESS, vault_address=vault_address)
 
+    @cached
     def get_validators(self):
         return self.info.validators()
 
@@ -103,6 +170,9 @@ class HyperliquidAPI(ExchangeInterface):
     def get_user_fills_by_time(self, user_address: str, start_time: int, end_time: int):
         return self.info.user_fills_by_time(user_address, start_time, end_time)
 
+    def get_user_funding(self, user_address: str, start_time: int, end_time: int):
+        return self.info.user_funding_history(user_address, start_time, end_time)
+
     def get_historical_portfolio_value(self, user_address: str, start_time: int, end_time: int):
         return self.info.user_portfolio_history(user_address, start_time, end_time)
 
@@ -115,12 +185,15 @@ class HyperliquidAPI(ExchangeInterface):
         user_state = self.info.user_state(user_address)
         return user_state.get("spotAssetPositions", [])
 
+    @cached
     def get_funding_history(self, symbol: str, start_time: int, end_time: int):
         return self.info.funding_history(symbol, start_time, end_time)
 
+    @cached
     def get_candles(self, symbol: str, interval: str, start_time: int, end_time: int):
         return self.info.candles_snapshot(symbol, interval, start_time, end_time)
 
+    @cached
     def get_l2_book(self, symbol: str):
         return self.info.l2_book(symbol)
 
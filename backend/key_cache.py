@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class KeyCache:
+    """Decrypted wallet keys, keyed by their ciphertext, for at most `ttl` seconds and `max_size` wallets.
+
+    Keys are held in bytearrays that are overwritten with zeros when they leave the cache.
+    The strings handed to signers are immutable and live as long as their callers hold them.
+    """
+
+    def __init__(self, decrypt, ttl: float, max_size: int):
+        self.decrypt = decrypt
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # ciphertext -> (key bytes, decrypted at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ciphertext: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(ciphertext)
+            if entry is not None:
+                self._entries.move_to_end(ciphertext)
+                self.hits += 1
+                return entry[0].decode()
+        key = bytearray(self.decrypt(ciphertext))
+        plaintext = key.decode()
+        if self.ttl <= 0 or self.max_size <= 0:
+            _zero(key)
+            return plaintext
+        with self._lock:
+            self.misses += 1
+            if ciphertext in self._entries:
+                _zero(key)
+            else:
+                self._entries[ciphertext] = (key, now)
+                while len(self._entries) > self.max_size:
+                    _zero(self._entries.popitem(last=False)[1][0])
+        return plaintext
+
+    def _expire(self, now: float):
+        for ciphertext in [c for c, (_, decrypted_at) in self._entries.items() if now - decrypted_at > self.ttl]:
+            _zero(self._entries.pop(ciphertext)[0])
+
+    def invalidate(self, ciphertext: str):
+        with self._lock:
+            entry = self._entries.pop(ciphertext, None)
+            if entry is not None:
+                _zero(entry[0])
+
+    def clear(self):
+        with self._lock:
+            for key, _ in self._entries.values():
+                _zero(key)
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _zero(key: bytearray):
+    key[:] = bytes(len(key))
@@ -0,0 +1,208 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from .config import settings
+
+# Seconds each read-only HyperliquidAPI method may be served from the cache.
+# Methods not listed here (or with a TTL of 0) always go upstream.
+DEFAULT_TTLS = {
+    "get_all_mids": 1.0,
+    "get_meta": 60.0,
+    "get_spot_meta": 60.0,
+    "get_vault_meta": 30.0,
+    "get_l2_book": 0.5,
+    "get_candles": 10.0,
+    "get_funding_history": 60.0,
+    "get_vault_details": 10.0,
+    "get_validators": 60.0,
+}
+
+MISS = object()
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Cache shared by every worker process that points at the same file."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS market_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at FROM market_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return MISS
+        now = time.time()
+        if row[1] <= now:
+            conn.execute("DELETE FROM market_cache WHERE key = ? AND expires_at <= ?", (key, now))
+            return MISS
+        conn.execute("UPDATE market_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO market_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now),
+        )
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM market_cache WHERE key IN "
+                "(SELECT key FROM market_cache ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def clear(self):
+        self._conn().execute("DELETE FROM market_cache")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM market_cache").fetchone()[0]
+
+
+class MarketDataCache:
+    def __init__(self, backend, ttls: dict | None = None):
+        self.backend = backend
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key: str, ttl: float, fetch):
+        value = self.backend.get(key)
+        if value is not MISS:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        value = fetch()
+        self.backend.set(key, value, ttl)
+        return value
+
+    async def aget_or_fetch(self, key: str, ttl: float, fetch):
+        value = self.backend.get(key)
+        if value is not MISS:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        value = await fetch()
+        self.backend.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "size": len(self.backend),
+            "max_entries": self.backend.max_entries,
+            "ttls": self.ttls,
+        }
+
+
+def create_backend():
+    if settings.market_cache_backend == "sqlite":
+        return SQLiteBackend(settings.market_cache_path, settings.market_cache_max_entries)
+    return MemoryBackend(settings.market_cache_max_entries)
+
+
+market_cache = MarketDataCache(create_backend(), settings.market_cache_ttls)
+
+
+def cache_key(base_url: str, method_name: str, args: tuple, kwargs: dict) -> str:
+    return json.dumps([base_url, method_name, list(args), kwargs], sort_keys=True, default=str)
+
+
+def cached(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        ttl = market_cache.ttls.get(method.__name__)
+        if not ttl:
+            return method(self, *args, **kwargs)
+        key = cache_key(self.base_url, method.__name__, args, kwargs)
+        return market_cache.get_or_fetch(key, ttl, lambda: method(self, *args, **kwargs))
+
+    return wrapper
+
+
+def acached(method):
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        ttl = market_cache.ttls.get(method.__name__)
+        if not ttl:
+            return await method(self, *args, **kwargs)
+        key = cache_key(self.base_url, method.__name__, args, kwargs)
+        return await market_cache.aget_or_fetch(key, ttl, lambda: method(self, *args, **kwargs))
+
+    return wrapper
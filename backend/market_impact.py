@@ -0,0 +1,78 @@
+import numpy as np
+
+from .order_book import OrderBook
+
+
+def walk_book(px, sz, amounts, by_notional: bool = False):
+    """Fills each amount, in size or in quote notional, against one side of a book, best level first.
+
+    All amounts are walked at once: cumulative depth plus a binary search for the level
+    each one ends on. Amounts deeper than the book fill what there is and are not `complete`.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    cum_sz = np.cumsum(sz)
+    cum_notional = np.cumsum(px * sz)
+    last = np.searchsorted(cum_notional if by_notional else cum_sz, amounts, side="left")
+    complete = last < len(px)
+    last = np.minimum(last, len(px) - 1)
+    before_sz = np.where(last > 0, cum_sz[last - 1], 0.0)
+    before_notional = np.where(last > 0, cum_notional[last - 1], 0.0)
+    if by_notional:
+        filled_sz = np.where(complete, before_sz + (amounts - before_notional) / px[last], cum_sz[-1])
+        notional = np.where(complete, amounts, cum_notional[-1])
+    else:
+        filled_sz = np.where(complete, amounts, cum_sz[-1])
+        notional = before_notional + (filled_sz - before_sz) * px[last]
+    return {
+        "filled_size": filled_sz,
+        "notional": notional,
+        "vwap": notional / filled_sz,
+        "worst_px": px[last],
+        "levels": last + 1,
+        "complete": complete,
+    }
+
+
+def estimate_impact(book: OrderBook, is_buy: bool, sizes=None, notionals=None):
+    """Expected average price and slippage of market orders of each size (or notional) against `book`."""
+    if (sizes is None) == (notionals is None):
+        raise ValueError("Give either sizes or notionals.")
+    amounts = np.asarray(sizes if sizes is not None else notionals, dtype=float)
+    if not len(amounts) or np.any(amounts <= 0):
+        raise ValueError("Sizes and notionals must be positive.")
+    (bid_px, bid_sz, _), (ask_px, ask_sz, _) = book.levels()
+    px, sz = (ask_px, ask_sz) if is_buy else (bid_px, bid_sz)
+    if not len(px):
+        raise ValueError(f"No {'asks' if is_buy else 'bids'} in the {book.symbol} book.")
+
+    walked = walk_book(px, sz, amounts, by_notional=sizes is None)
+    best = px[0]
+    mid = (bid_px[0] + ask_px[0]) / 2 if len(bid_px) and len(ask_px) else None
+    # Positive bps are worse for the order: paid above the reference when buying, received below it when selling.
+    sign = 1 if is_buy else -1
+    slippage_bps = sign * (walked["vwap"] - best) / best * 10_000
+    impact_bps = sign * (walked["vwap"] - mid) / mid * 10_000 if mid else np.full(len(amounts), np.nan)
+    return {
+        "symbol": book.symbol,
+        "is_buy": is_buy,
+        "time": book.time,
+        "best_px": float(best),
+        "mid": float(mid) if mid else None,
+        "estimates": [
+            {
+                "amount": float(amount),
+                "filled_size": float(filled),
+                "notional": float(notional),
+                "vwap": float(vwap),
+                "worst_px": float(worst),
+                "levels": int(levels),
+                "slippage_bps": float(slippage),
+                "impact_bps": float(impact) if mid else None,
+                "complete": bool(complete),
+            }
+            for amount, filled, notional, vwap, worst, levels, slippage, impact, complete in zip(
+                amounts, walked["filled_size"], walked["notional"], walked["vwap"], walked["worst_px"],
+                walked["levels"], slippage_bps, impact_bps, walked["complete"],
+            )
+        ],
+    }
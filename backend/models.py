@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float, Text, JSON
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Float, Text, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -53,6 +53,98 @@ class Trade(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     wallet_id = Column(Integer, ForeignKey("wallets.id"))
     bot_id = Column(Integer, ForeignKey("bots.id"), nullable=True)
+    # Filled in by fill ingestion from the exchange's fill records.
+    tid = Column(BigInteger, nullable=True)
+    oid = Column(BigInteger, nullable=True)
+    time_ms = Column(BigInteger, nullable=True)
+    fee = Column(Float, nullable=True)
+    closed_pnl = Column(Float, nullable=True)
+    direction = Column(String, nullable=True)
+    hash = Column(String, nullable=True)
 
     wallet = relationship("Wallet", back_populates="trades")
     bot = relationship("Bot", back_populates="trades")
+
+    __table_args__ = (
+        UniqueConstraint("wallet_id", "tid", name="uq_trades_wallet_tid"),
+        # Trade history pages are read newest first by (time_ms, id) per wallet.
+        Index("ix_trades_wallet_time", "wallet_id", "time_ms", "id"),
+    )
+
+
+class FillWatermark(Base):
+    __tablename__ = "fill_watermarks"
+
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    last_fill_ms = Column(BigInteger, nullable=False)
+    last_funding_ms = Column(BigInteger, nullable=True)
+    synced_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class BotRun(Base):
+    __tablename__ = "bot_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bot_id = Column(Integer, ForeignKey("bots.id"), index=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), index=True)
+    started_at_ms = Column(BigInteger, nullable=False)
+    stopped_at_ms = Column(BigInteger, nullable=True)
+
+
+class FundingPayment(Base):
+    __tablename__ = "funding_payments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"))
+    symbol = Column(String)
+    time_ms = Column(BigInteger)
+    usdc = Column(Float)
+    position_size = Column(Float)
+    rate = Column(Float)
+
+    __table_args__ = (UniqueConstraint("wallet_id", "symbol", "time_ms", name="uq_funding_wallet_symbol_time"),)
+
+
+class PnlLot(Base):
+    # An open FIFO lot: the unmatched part of one fill, signed long (+) or short (-).
+    __tablename__ = "pnl_lots"
+    __table_args__ = (UniqueConstraint("wallet_id", "trade_id", name="uq_pnl_lots_wallet_trade"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), index=True)
+    symbol = Column(String)
+    bot_id = Column(Integer, nullable=True)
+    trade_id = Column(Integer, ForeignKey("trades.id"))
+    quantity = Column(Float)
+    price = Column(Float)
+    opened_ms = Column(BigInteger)
+
+
+class PnlAggregate(Base):
+    # Running totals for one scope of a wallet: the whole wallet, one symbol, one bot,
+    # or one bot in one symbol. bot_id is 0 and symbol "" where they do not apply.
+    __tablename__ = "pnl_aggregates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"))
+    scope = Column(String)
+    bot_id = Column(Integer, default=0)
+    symbol = Column(String, default="")
+    realized_pnl = Column(Float, default=0.0)
+    fees = Column(Float, default=0.0)
+    funding = Column(Float, default=0.0)
+    volume = Column(Float, default=0.0)
+    fills = Column(Integer, default=0)
+    position = Column(Float, default=0.0)
+    cost_basis = Column(Float, default=0.0)
+
+    __table_args__ = (UniqueConstraint("wallet_id", "scope", "bot_id", "symbol", name="uq_pnl_aggregate_scope"),)
+
+
+class PnlCursor(Base):
+    # The last trade and funding row each wallet's aggregates include.
+    __tablename__ = "pnl_cursors"
+
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    last_trade_id = Column(Integer, default=0)
+    last_funding_id = Column(Integer, default=0)
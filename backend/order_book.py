@@ -0,0 +1,196 @@
+import asyncio
+import time
+
+import numpy as np
+
+from .config import settings
+from .ws_hub import get_hub
+
+_EMPTY = (np.empty(0), np.empty(0), np.empty(0, dtype=np.int64))
+
+
+def _fmt(value: float) -> str:
+    return format(float(value), ".12g")
+
+
+def _side(levels: list):
+    if not levels:
+        return _EMPTY
+    return (
+        np.array([float(level["px"]) for level in levels]),
+        np.array([float(level["sz"]) for level in levels]),
+        np.array([int(level["n"]) for level in levels], dtype=np.int64),
+    )
+
+
+def group_levels(px, sz, n, tick: float, is_bid: bool):
+    """Sums levels into buckets of `tick`; bids round down to their bucket, asks up."""
+    if not tick or not len(px):
+        return px, sz, n
+    # The small nudge keeps prices already on the grid, like 0.3 at tick 0.1, in their own bucket.
+    buckets = np.floor(px / tick + 1e-9) if is_bid else np.ceil(px / tick - 1e-9)
+    keys, inverse = np.unique(buckets, return_inverse=True)
+    grouped_sz = np.bincount(inverse, weights=sz)
+    grouped_n = np.bincount(inverse, weights=n).astype(np.int64)
+    grouped_px = keys * tick
+    if is_bid:
+        return grouped_px[::-1], grouped_sz[::-1], grouped_n[::-1]
+    return grouped_px, grouped_sz, grouped_n
+
+
+class OrderBook:
+    """One symbol's L2 book, each side as sorted price, size and order-count arrays, best level first."""
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.time = 0
+        self.updates = 0
+        self.bids = _EMPTY
+        self.asks = _EMPTY
+
+    def apply(self, data: dict) -> bool:
+        # l2Book messages carry the whole top of the book, so each one replaces it.
+        if data.get("time", 0) < self.time:
+            return False
+        bids, asks = data["levels"]
+        self.bids, self.asks = _side(bids), _side(asks)
+        self.time = data.get("time", 0)
+        self.updates += 1
+        return True
+
+    def levels(self, depth: int = None, tick: float = None):
+        bids = group_levels(*self.bids, tick, True)
+        asks = group_levels(*self.asks, tick, False)
+        if depth:
+            bids = tuple(array[:depth] for array in bids)
+            asks = tuple(array[:depth] for array in asks)
+        return bids, asks
+
+    def snapshot(self, depth: int = None, tick: float = None):
+        # Same shape as the l2Book REST response.
+        return {
+            "coin": self.symbol,
+            "time": self.time,
+            "levels": [
+                [{"px": _fmt(p), "sz": _fmt(s), "n": int(c)} for p, s, c in zip(*side)]
+                for side in self.levels(depth, tick)
+            ],
+        }
+
+
+def book_delta(old: dict, new: dict):
+    """Levels of `new` that differ from `old`, as [px, sz] pairs; a size of "0" removes the level."""
+    delta = {"time": new["time"]}
+    for name, before, after in zip(("bids", "asks"), old["levels"], new["levels"]):
+        previous = {level["px"]: level["sz"] for level in before}
+        current = {level["px"]: level["sz"] for level in after}
+        changes = [[px, sz] for px, sz in current.items() if previous.get(px) != sz]
+        changes += [[px, "0"] for px in previous if px not in current]
+        delta[name] = changes
+    return delta
+
+
+class _Watched:
+    def __init__(self, symbol: str):
+        self.book = OrderBook(symbol)
+        self.listeners = set()  # asyncio.Events set on every update
+        self.last_used = time.monotonic()
+        self.ready = asyncio.Event()
+        self.subscriber = None
+        self.task = None
+
+
+class BookManager:
+    """Books kept in memory from the l2Book stream for the symbols someone is watching.
+
+    A book is seeded from REST the first time it is asked for, then follows the stream.
+    Books with no listeners that have not been read for `idle_seconds` are dropped.
+    """
+
+    def __init__(self, hub, idle_seconds: float):
+        self.hub = hub
+        self.idle_seconds = idle_seconds
+        self._books = {}
+        self._lock = asyncio.Lock()
+        self._sweeper = None
+
+    async def get(self, symbol: str, hl_api=None) -> OrderBook:
+        watched = await self._watch(symbol)
+        watched.last_used = time.monotonic()
+        if not watched.ready.is_set() and hl_api is not None:
+            data = await hl_api.get_l2_book(symbol=symbol)
+            if data:
+                self._update(watched, data)
+        return watched.book
+
+    async def listen(self, symbol: str, hl_api=None):
+        book = await self.get(symbol, hl_api)
+        event = asyncio.Event()
+        self._books[symbol].listeners.add(event)
+        return book, event
+
+    def unlisten(self, symbol: str, event: asyncio.Event):
+        watched = self._books.get(symbol)
+        if watched is not None:
+            watched.listeners.discard(event)
+            watched.last_used = time.monotonic()
+
+    async def _watch(self, symbol: str) -> _Watched:
+        async with self._lock:
+            watched = self._books.get(symbol)
+            if watched is None:
+                watched = self._books[symbol] = _Watched(symbol)
+                watched.subscriber = await self.hub.subscribe({"type": "l2Book", "coin": symbol})
+                watched.task = asyncio.create_task(self._consume(watched))
+            if self._sweeper is None and self.idle_seconds > 0:
+                self._sweeper = asyncio.create_task(self._sweep())
+            return watched
+
+    def _update(self, watched: _Watched, data: dict):
+        if watched.book.apply(data):
+            watched.ready.set()
+            for event in watched.listeners:
+                event.set()
+
+    async def _consume(self, watched: _Watched):
+        while True:
+            message = await watched.subscriber.get()
+            data = message.get("data")
+            if isinstance(data, dict) and "levels" in data:
+                self._update(watched, data)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(max(self.idle_seconds / 2, 0.01))
+            now = time.monotonic()
+            for symbol, watched in list(self._books.items()):
+                if not watched.listeners and now - watched.last_used > self.idle_seconds:
+                    await self.drop(symbol)
+
+    async def drop(self, symbol: str):
+        async with self._lock:
+            watched = self._books.pop(symbol, None)
+            if watched is None:
+                return
+            watched.task.cancel()
+            await self.hub.unsubscribe(watched.subscriber)
+
+    def stats(self):
+        return {
+            symbol: {"updates": watched.book.updates, "time": watched.book.time, "listeners": len(watched.listeners)}
+            for symbol, watched in self._books.items()
+        }
+
+
+# Managers hold the loop's hub subscriptions, so there is one per event loop.
+_managers = {}
+
+
+def get_book_manager() -> BookManager:
+    loop = asyncio.get_running_loop()
+    manager = _managers.get(loop)
+    if manager is None:
+        for stale in [other for other in _managers if other.is_closed()]:
+            del _managers[stale]
+        manager = _managers[loop] = BookManager(get_hub(), settings.book_idle_seconds)
+    return manager
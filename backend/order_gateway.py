@@ -0,0 +1,365 @@
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .config import settings
+
+CANCEL, MODIFY, ORDER = 0, 1, 2
+KINDS = {CANCEL: "cancel", MODIFY: "modify", ORDER: "order"}
+# Once an address has used up its request budget, Hyperliquid allows one request every 10 seconds.
+EXHAUSTED_INTERVAL = 10.0
+
+
+class TokenBucket:
+    """Request budget of one address: a local rate limit, capped by what the exchange says is left."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.budget = None  # requests left according to the exchange; None until synced
+        self.last_taken = float("-inf")
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, weight: float, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.budget is not None and self.budget < weight:
+            return max(0.0, self.last_taken + EXHAUSTED_INTERVAL - now)
+        needed = min(weight, self.capacity)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self, weight: float, now: float = None):
+        self.tokens -= weight
+        if self.budget is not None:
+            self.budget -= weight
+        self.last_taken = time.monotonic() if now is None else now
+
+    def acquire(self, weight: float, now: float = None) -> float:
+        """Takes `weight` if it is available and returns 0, or returns how long to wait for it."""
+        wait = self.wait_time(weight, now)
+        if wait == 0:
+            self.take(weight, now)
+        return wait
+
+    def sync(self, remaining: float):
+        self.budget = remaining
+
+
+class SharedTokenBucket(TokenBucket):
+    """A TokenBucket kept in a SQLite file, so every process sending for the address draws on the same one.
+
+    Each acquire or sync loads the row, applies the change and writes it back in one
+    write transaction. Times are monotonic, which on one host all processes share.
+    """
+
+    def __init__(self, path: str, address: str, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.path = path
+        self.address = address.lower()
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS order_gateway_buckets ("
+            "address TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, budget REAL, last_taken REAL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _shared(self, change):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, budget, last_taken FROM order_gateway_buckets WHERE address = ?", (self.address,)
+            ).fetchone()
+            if row is not None:
+                self.tokens, self._updated, self.budget = row[0], row[1], row[2]
+                self.last_taken = float("-inf") if row[3] is None else row[3]
+            result = change()
+            conn.execute(
+                "INSERT OR REPLACE INTO order_gateway_buckets (address, tokens, updated, budget, last_taken) VALUES (?, ?, ?, ?, ?)",
+                (self.address, self.tokens, self._updated, self.budget, None if self.last_taken == float("-inf") else self.last_taken),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def acquire(self, weight: float, now: float = None) -> float:
+        return self._shared(lambda: super(SharedTokenBucket, self).acquire(weight, now))
+
+    def sync(self, remaining: float):
+        self._shared(lambda: super(SharedTokenBucket, self).sync(remaining))
+
+
+def _bucket(address: str) -> TokenBucket:
+    if settings.order_gateway_bucket_path:
+        return SharedTokenBucket(
+            settings.order_gateway_bucket_path, address, settings.order_gateway_rate_per_second, settings.order_gateway_burst
+        )
+    return TokenBucket(settings.order_gateway_rate_per_second, settings.order_gateway_burst)
+
+
+class _Action:
+    def __init__(self, priority: int, seq: int, start, oid, weight: float):
+        self.priority = priority
+        self.seq = seq
+        self.start = start
+        self.oid = oid
+        self.weight = weight
+        self.futures = [Future()]
+        self.enqueued_at = time.monotonic()
+        self.done = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def cancelled(self) -> bool:
+        # Every caller gave up waiting, e.g. its request was cancelled, so there is nothing to send.
+        return all(future.cancelled() for future in self.futures)
+
+    def resolve(self, started: Future):
+        for future in self.futures:
+            if started.exception() is not None:
+                future.set_exception(started.exception())
+            else:
+                future.set_result(started.result())
+
+
+class OrderGateway:
+    """Sends one address's exchange actions in priority order within its request budget.
+
+    Cancels go before modifies, and modifies before new orders. A modify queued for an oid
+    that already has one waiting replaces it, and both callers get the result of the one sent.
+    The budget is re-read from `rate_limits()` (the exchange's userRateLimit) periodically.
+    Actions whose callers have all cancelled are dropped unsent. A gateway left idle for
+    `order_gateway_idle_seconds` stops its thread and is removed.
+    """
+
+    def __init__(self, address: str, rate_limits=None):
+        self.address = address
+        self.rate_limits = rate_limits
+        self.bucket = _bucket(address)
+        self._queue = []
+        self._modifies = {}  # oid -> queued modify
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._synced_at = float("-inf")
+        self._syncing = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.waits = deque(maxlen=1000)
+        self.closed = False
+        self._thread = threading.Thread(target=self._run, name=f"order-gateway-{address[:10]}", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: int, start, oid: int = None, weight: float = 1) -> Future:
+        """Queues an action; `start()` sends it and returns a concurrent Future of the response."""
+        with self._cond:
+            if kind == MODIFY and oid is not None and oid in self._modifies:
+                action = self._modifies[oid]
+                action.start = start
+                action.weight = weight
+                action.futures.append(Future())
+                self.coalesced += 1
+                return action.futures[-1]
+            if kind == CANCEL and oid is not None and oid in self._modifies:
+                # Modifying an order that is about to be cancelled would only be rejected.
+                superseded = self._modifies.pop(oid)
+                superseded.done = True
+                self.dropped += 1
+                for future in superseded.futures:
+                    if future.set_running_or_notify_cancel():
+                        future.set_result({"status": "err", "response": f"Order {oid} was cancelled before this modify was sent."})
+            action = _Action(kind, next(self._seq), start, oid, weight)
+            heapq.heappush(self._queue, action)
+            if kind == MODIFY and oid is not None:
+                self._modifies[oid] = action
+            self._cond.notify()
+            return action.futures[0]
+
+    def _unqueue(self, action: _Action):
+        heapq.heappop(self._queue)
+        action.done = True
+        if action.oid is not None and self._modifies.get(action.oid) is action:
+            del self._modifies[action.oid]
+
+    def _next(self):
+        # Returns None once the gateway has been idle long enough to retire.
+        with self._cond:
+            while True:
+                while self._queue and (self._queue[0].done or self._queue[0].cancelled()):
+                    self._unqueue(self._queue[0])
+                if not self._queue:
+                    if not self._cond.wait(settings.order_gateway_idle_seconds or None):
+                        return None
+                    continue
+                action = self._queue[0]
+                wait = self.bucket.acquire(action.weight)
+                if wait > 0:
+                    # Woken early by new actions, which may outrank this one.
+                    self._cond.wait(wait)
+                    continue
+                self._unqueue(action)
+                # From here the callers can no longer cancel; those that already did are left out.
+                action.futures = [future for future in action.futures if future.set_running_or_notify_cancel()]
+                if action.futures:
+                    return action
+
+    def _retire(self) -> bool:
+        # Under the module lock, so no submit can reach this gateway once it is gone.
+        with _lock:
+            with self._cond:
+                if any(not action.done for action in self._queue):
+                    return False
+                self.closed = True
+                if _gateways.get(self.address.lower()) is self:
+                    del _gateways[self.address.lower()]
+                return True
+
+    def _run(self):
+        while True:
+            action = self._next()
+            if action is None:
+                if self._retire():
+                    return
+                continue
+            self.waits.append(time.monotonic() - action.enqueued_at)
+            self.sent += 1
+            try:
+                started = action.start()
+            except Exception as e:
+                started = Future()
+                started.set_exception(e)
+            started.add_done_callback(action.resolve)
+            self._maybe_sync()
+
+    def _maybe_sync(self):
+        if self.rate_limits is None or not settings.order_gateway_sync_seconds or self._syncing:
+            return
+        if time.monotonic() - self._synced_at < settings.order_gateway_sync_seconds:
+            return
+        self._syncing = True
+        threading.Thread(target=self._sync, daemon=True).start()
+
+    def _sync(self):
+        try:
+            limits = self.rate_limits()
+            remaining = float(limits["nRequestsCap"]) - float(limits["nRequestsUsed"])
+            with self._cond:
+                self.bucket.sync(remaining)
+                self._cond.notify()
+        except Exception as e:
+            print(f"Order gateway for {self.address} could not read its rate limits: {e}")
+        finally:
+            self._synced_at = time.monotonic()
+            self._syncing = False
+
+    def stats(self):
+        with self._cond:
+            depth = {name: 0 for name in KINDS.values()}
+            for action in self._queue:
+                if not action.done:
+                    depth[KINDS[action.priority]] += 1
+            waits = sorted(self.waits)
+        return {
+            "queued": depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "tokens": round(self.bucket.tokens, 3),
+            "budget": self.bucket.budget,
+            "wait_seconds": {
+                "mean": sum(waits) / len(waits) if waits else 0.0,
+                "p50": waits[len(waits) // 2] if waits else 0.0,
+                "p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "max": waits[-1] if waits else 0.0,
+            },
+        }
+
+
+_gateways = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def _after_fork_in_child():
+    # Bot processes and workers are forked from the API process, whose gateway threads are not
+    # copied into them; a copied gateway would queue actions that are never sent.
+    global _gateways, _lock, _executor
+    _gateways, _lock, _executor = {}, threading.Lock(), None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _gateway(address: str) -> OrderGateway:
+    gateway = _gateways.get(address.lower())
+    if gateway is None:
+        from .hyperliquid_api import HyperliquidAPI
+        gateway = _gateways[address.lower()] = OrderGateway(address, lambda: HyperliquidAPI().query_user_rate_limits(address))
+    return gateway
+
+
+def gateway_for(address: str) -> OrderGateway:
+    # One queue per address and process; their buckets are shared through order_gateway_bucket_path.
+    with _lock:
+        return _gateway(address)
+
+
+def _submit(address: str, kind: int, start, oid: int, weight: float) -> Future:
+    with _lock:
+        return _gateway(address).submit(kind, start, oid, weight)
+
+
+def _sync_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.order_gateway_threads, thread_name_prefix="order-gateway-call")
+        return _executor
+
+
+def submit_sync(address: str, kind: int, call, oid: int = None, weight: float = 1):
+    """Runs the blocking `call()` when the gateway sends it, and returns its result."""
+    return _submit(address, kind, lambda: _sync_executor().submit(call), oid, weight).result()
+
+
+async def submit_async(address: str, kind: int, call, oid: int = None, weight: float = 1):
+    """Awaits the coroutine `call()`, run on the caller's loop, when the gateway sends it.
+
+    Cancelling the caller before the gateway gets to the action means it is never sent.
+    """
+    loop = asyncio.get_running_loop()
+    future = _submit(address, kind, lambda: asyncio.run_coroutine_threadsafe(call(), loop), oid, weight)
+    return await asyncio.wrap_future(future)
+
+
+def batch_weight(count: int) -> float:
+    # Every order or cancel in a batch uses one request of the address's budget.
+    return max(1, count)
+
+
+def stats():
+    with _lock:
+        gateways = list(_gateways.values())
+    return {gateway.address: gateway.stats() for gateway in gateways}
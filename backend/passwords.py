@@ -1,10 +1,32 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from passlib.context import CryptContext
 
+from .config import settings
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+_executor = None
+_lock = threading.Lock()
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
+
+def _hash_executor() -> ThreadPoolExecutor:
+    # bcrypt is slow on purpose; a few threads keep a login storm from taking every core.
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.password_hash_threads, thread_name_prefix="bcrypt")
+        return _executor
+
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor(), verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor(), get_password_hash, password)
@@ -0,0 +1,345 @@
+import argparse
+import sys
+import threading
+from collections import defaultdict, deque
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+WALLET, SYMBOL, BOT, BOT_SYMBOL = "wallet", "symbol", "bot", "bot_symbol"
+TOTAL_FIELDS = ("realized_pnl", "fees", "funding", "volume", "fills", "position", "cost_basis")
+# Size below which a lot counts as fully closed; fill sizes are rounded to the asset's size decimals.
+EPSILON = 1e-9
+
+
+class PnlBook:
+    """FIFO lots and running aggregates of one wallet, updated one fill at a time.
+
+    Works on the ORM rows it is given, so applying new fills to rows loaded from the
+    database and flushing is the incremental update. A realized match is credited to
+    the bot that opened the lot, fees to the bot whose fill paid them.
+    """
+
+    def __init__(self, wallet_id: int, lots=(), aggregates=()):
+        self.wallet_id = wallet_id
+        self.lots = defaultdict(deque)  # symbol -> open lots, oldest first
+        for lot in lots:
+            self.lots[lot.symbol].append(lot)
+        self.aggregates = {(row.scope, row.bot_id, row.symbol): row for row in aggregates}
+        self.last_trade_id = 0
+        self.last_funding_id = 0
+
+    def _row(self, scope: str, bot_id: int = 0, symbol: str = ""):
+        key = (scope, bot_id, symbol)
+        row = self.aggregates.get(key)
+        if row is None:
+            row = models.PnlAggregate(wallet_id=self.wallet_id, scope=scope, bot_id=bot_id, symbol=symbol, **{field: 0 for field in TOTAL_FIELDS})
+            self.aggregates[key] = row
+        return row
+
+    def _rows(self, symbol: str, bot_id: int):
+        rows = [self._row(WALLET), self._row(SYMBOL, symbol=symbol)]
+        if bot_id:
+            rows += [self._row(BOT, bot_id), self._row(BOT_SYMBOL, bot_id, symbol)]
+        return rows
+
+    def _positions(self, symbol: str, bot_id: int):
+        # Positions are only meaningful per symbol.
+        rows = [self._row(SYMBOL, symbol=symbol)]
+        if bot_id:
+            rows.append(self._row(BOT_SYMBOL, bot_id, symbol))
+        return rows
+
+    def apply_trade(self, trade: models.Trade):
+        symbol, price = trade.symbol, trade.price
+        direction = 1 if trade.side == "buy" else -1
+        for row in self._rows(symbol, trade.bot_id):
+            row.fees += trade.fee or 0.0
+            row.volume += trade.quantity * price
+            row.fills += 1
+
+        remaining = trade.quantity
+        queue = self.lots[symbol]
+        while remaining > EPSILON and queue and (queue[0].quantity > 0) != (direction > 0):
+            lot = queue[0]
+            lot_direction = 1 if lot.quantity > 0 else -1
+            matched = min(remaining, abs(lot.quantity))
+            realized = matched * (price - lot.price) * lot_direction
+            for row in self._rows(symbol, lot.bot_id):
+                row.realized_pnl += realized
+            for row in self._positions(symbol, lot.bot_id):
+                row.position -= lot_direction * matched
+                row.cost_basis -= lot_direction * matched * lot.price
+            lot.quantity -= lot_direction * matched
+            remaining -= matched
+            if abs(lot.quantity) <= EPSILON:
+                queue.popleft()
+                lot.quantity = 0.0
+
+        if remaining > EPSILON:
+            queue.append(models.PnlLot(
+                wallet_id=self.wallet_id, symbol=symbol, bot_id=trade.bot_id, trade_id=trade.id,
+                quantity=direction * remaining, price=price, opened_ms=trade.time_ms,
+            ))
+            for row in self._positions(symbol, trade.bot_id):
+                row.position += direction * remaining
+                row.cost_basis += direction * remaining * price
+        self.last_trade_id = max(self.last_trade_id, trade.id)
+
+    def apply_funding(self, payment: models.FundingPayment):
+        # Funding is charged on the wallet's whole position, so it is not split between bots.
+        for row in self._rows(payment.symbol, None):
+            row.funding += payment.usdc
+        self.last_funding_id = max(self.last_funding_id, payment.id)
+
+    def open_lots(self):
+        return [lot for queue in self.lots.values() for lot in queue]
+
+
+def _new_trades(db: Session, wallet_id: int, after_id: int):
+    # Stored in the order they were fetched, which is not always the order they traded in.
+    return db.scalars(
+        select(models.Trade)
+        .where(models.Trade.wallet_id == wallet_id, models.Trade.id > after_id, models.Trade.time_ms.is_not(None))
+        .order_by(models.Trade.time_ms, models.Trade.tid, models.Trade.id)
+        .execution_options(yield_per=1000)
+    )
+
+
+def _new_funding(db: Session, wallet_id: int, after_id: int):
+    return db.scalars(
+        select(models.FundingPayment)
+        .where(models.FundingPayment.wallet_id == wallet_id, models.FundingPayment.id > after_id)
+        .order_by(models.FundingPayment.id)
+        .execution_options(yield_per=1000)
+    )
+
+
+def _has_new(db: Session, wallet_id: int, cursor: models.PnlCursor):
+    last_trade = db.scalar(select(func.max(models.Trade.id)).where(models.Trade.wallet_id == wallet_id)) or 0
+    last_funding = db.scalar(select(func.max(models.FundingPayment.id)).where(models.FundingPayment.wallet_id == wallet_id)) or 0
+    return last_trade > cursor.last_trade_id or last_funding > cursor.last_funding_id
+
+
+def _trade_position(db: Session, wallet_id: int, cursor: models.PnlCursor, newest: bool):
+    # (time_ms, tid) of the newest trade already folded in, or of the oldest one not yet folded in.
+    query = select(models.Trade.time_ms, models.Trade.tid).where(
+        models.Trade.wallet_id == wallet_id,
+        models.Trade.id <= cursor.last_trade_id if newest else models.Trade.id > cursor.last_trade_id,
+        models.Trade.time_ms.is_not(None),
+    )
+    if newest:
+        query = query.order_by(models.Trade.time_ms.desc(), models.Trade.tid.desc())
+    else:
+        query = query.order_by(models.Trade.time_ms, models.Trade.tid)
+    row = db.execute(query.limit(1)).first()
+    return (row.time_ms, row.tid or 0) if row is not None else None
+
+
+def _arrived_late(db: Session, wallet_id: int, cursor: models.PnlCursor) -> bool:
+    # A fill stored after others that traded later, by the overlap re-read or an on-demand ingestion.
+    folded, new = _trade_position(db, wallet_id, cursor, True), _trade_position(db, wallet_id, cursor, False)
+    return folded is not None and new is not None and new < folded
+
+
+def replay(db: Session, wallet_id: int, book: PnlBook, after_trade_id: int = 0, after_funding_id: int = 0):
+    # Fills in the order they traded, the same order for incremental updates and rebuilds.
+    for trade in _new_trades(db, wallet_id, after_trade_id):
+        book.apply_trade(trade)
+    for payment in _new_funding(db, wallet_id, after_funding_id):
+        book.apply_funding(payment)
+    return book
+
+
+def _save(db: Session, wallet_id: int, book: PnlBook, cursor: models.PnlCursor):
+    for lot in book.open_lots():
+        db.add(lot)
+    for row in book.aggregates.values():
+        db.add(row)
+    db.flush()
+    db.execute(delete(models.PnlLot).where(models.PnlLot.wallet_id == wallet_id, models.PnlLot.quantity == 0))
+    cursor.last_trade_id = max(cursor.last_trade_id, book.last_trade_id)
+    cursor.last_funding_id = max(cursor.last_funding_id, book.last_funding_id)
+    db.commit()
+
+
+_wallet_locks = defaultdict(threading.RLock)
+_locks_lock = threading.Lock()
+
+
+def _wallet_lock(wallet_id: int):
+    with _locks_lock:
+        return _wallet_locks[wallet_id]
+
+
+def _lock_cursor(db: Session, wallet_id: int) -> models.PnlCursor:
+    # The row lock keeps other processes out until this transaction ends; SQLite has none, and relies on _wallet_lock.
+    query = select(models.PnlCursor).where(models.PnlCursor.wallet_id == wallet_id).with_for_update().execution_options(populate_existing=True)
+    cursor = db.scalar(query)
+    if cursor is None:
+        try:
+            db.add(models.PnlCursor(wallet_id=wallet_id, last_trade_id=0, last_funding_id=0))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        cursor = db.scalar(query)
+    return cursor
+
+
+def update_wallet(db: Session, wallet_id: int):
+    """Folds the wallet's trades and funding payments stored since the last update into its aggregates.
+
+    One update runs per wallet at a time, so two of them never fold the same fills in twice.
+    """
+    with _wallet_lock(wallet_id):
+        _update_locked(db, wallet_id)
+
+
+def _update_locked(db: Session, wallet_id: int):
+    cursor = _lock_cursor(db, wallet_id)
+    if not _has_new(db, wallet_id, cursor):
+        db.commit()
+        return
+    if _arrived_late(db, wallet_id, cursor):
+        # FIFO matching changes from that fill on, so the lots are matched again from the start.
+        _replace(db, wallet_id, replay(db, wallet_id, PnlBook(wallet_id)), cursor)
+        return
+    lots = db.scalars(select(models.PnlLot).where(models.PnlLot.wallet_id == wallet_id).order_by(models.PnlLot.id)).all()
+    aggregates = db.scalars(select(models.PnlAggregate).where(models.PnlAggregate.wallet_id == wallet_id)).all()
+    book = replay(db, wallet_id, PnlBook(wallet_id, lots, aggregates), cursor.last_trade_id, cursor.last_funding_id)
+    # Lots closed by this update are written with size 0 and then deleted.
+    _save(db, wallet_id, book, cursor)
+
+
+def _differences(stored: PnlBook, rebuilt: PnlBook, tolerance: float = 1e-6):
+    differences = []
+    for key in sorted(set(stored.aggregates) | set(rebuilt.aggregates)):
+        old, new = stored.aggregates.get(key), rebuilt.aggregates.get(key)
+        for field in TOTAL_FIELDS:
+            a = getattr(old, field) if old is not None else 0
+            b = getattr(new, field) if new is not None else 0
+            if abs(a - b) > tolerance * max(1.0, abs(a), abs(b)):
+                differences.append(f"{key}: {field} is {a}, rebuilt {b}")
+    old_lots = [(lot.symbol, lot.trade_id, round(lot.quantity, 9)) for lot in stored.open_lots() if lot.quantity]
+    new_lots = [(lot.symbol, lot.trade_id, round(lot.quantity, 9)) for lot in rebuilt.open_lots()]
+    if sorted(old_lots) != sorted(new_lots):
+        differences.append(f"open lots are {sorted(old_lots)}, rebuilt {sorted(new_lots)}")
+    return differences
+
+
+def rebuild_wallet(db: Session, wallet_id: int, replace: bool = True):
+    """Recomputes a wallet's PnL from all of its fills and returns where the stored state differed."""
+    with _wallet_lock(wallet_id):
+        return _rebuild_locked(db, wallet_id, replace)
+
+
+def _rebuild_locked(db: Session, wallet_id: int, replace: bool):
+    _update_locked(db, wallet_id)
+    cursor = _lock_cursor(db, wallet_id)
+    stored = PnlBook(
+        wallet_id,
+        db.scalars(select(models.PnlLot).where(models.PnlLot.wallet_id == wallet_id).order_by(models.PnlLot.id)).all(),
+        db.scalars(select(models.PnlAggregate).where(models.PnlAggregate.wallet_id == wallet_id)).all(),
+    )
+    rebuilt = replay(db, wallet_id, PnlBook(wallet_id))
+    differences = _differences(stored, rebuilt)
+    if replace:
+        _replace(db, wallet_id, rebuilt, cursor)
+    else:
+        db.commit()
+    return differences
+
+
+def _replace(db: Session, wallet_id: int, book: PnlBook, cursor: models.PnlCursor):
+    db.execute(delete(models.PnlLot).where(models.PnlLot.wallet_id == wallet_id))
+    db.execute(delete(models.PnlAggregate).where(models.PnlAggregate.wallet_id == wallet_id))
+    cursor.last_trade_id = cursor.last_funding_id = 0
+    _save(db, wallet_id, book, cursor)
+
+
+def _summary(row: models.PnlAggregate, unrealized: float):
+    net = row.realized_pnl + row.funding - row.fees
+    return {
+        "realized_pnl": row.realized_pnl,
+        "fees": row.fees,
+        "funding": row.funding,
+        "net_realized_pnl": net,
+        "unrealized_pnl": unrealized,
+        "total_pnl": net + unrealized,
+        "volume": row.volume,
+        "fills": row.fills,
+    }
+
+
+def _symbol_summary(row: models.PnlAggregate, mids: dict):
+    mark = float(mids[row.symbol]) if row.symbol in mids else None
+    unrealized = row.position * mark - row.cost_basis if mark is not None and row.position else 0.0
+    summary = _summary(row, unrealized)
+    summary.update(
+        symbol=row.symbol,
+        position=row.position,
+        average_entry=row.cost_basis / row.position if row.position else None,
+        mark=mark,
+    )
+    return summary
+
+
+def wallet_pnl(db: Session, wallet_id: int, mids: dict):
+    """Wallet, per-symbol and per-bot PnL read from the aggregates, open lots marked to `mids`."""
+    rows = db.scalars(select(models.PnlAggregate).where(models.PnlAggregate.wallet_id == wallet_id)).all()
+    symbols = [_symbol_summary(row, mids) for row in rows if row.scope == SYMBOL]
+    bot_symbols = defaultdict(list)
+    for row in rows:
+        if row.scope == BOT_SYMBOL:
+            bot_symbols[row.bot_id].append(_symbol_summary(row, mids))
+    wallet = next((row for row in rows if row.scope == WALLET), None)
+    return {
+        "wallet": _summary(wallet, sum(s["unrealized_pnl"] for s in symbols)) if wallet is not None else None,
+        "symbols": symbols,
+        "bots": [
+            {"bot_id": row.bot_id, **_summary(row, sum(s["unrealized_pnl"] for s in bot_symbols[row.bot_id])), "symbols": bot_symbols[row.bot_id]}
+            for row in rows if row.scope == BOT
+        ],
+    }
+
+
+def bot_pnl(db: Session, bot_id: int, mids: dict):
+    """A bot's PnL on every wallet it has traded."""
+    rows = db.scalars(select(models.PnlAggregate).where(models.PnlAggregate.bot_id == bot_id, models.PnlAggregate.scope.in_((BOT, BOT_SYMBOL)))).all()
+    wallets = []
+    for row in rows:
+        if row.scope == BOT:
+            symbols = [_symbol_summary(r, mids) for r in rows if r.scope == BOT_SYMBOL and r.wallet_id == row.wallet_id]
+            wallets.append({"wallet_id": row.wallet_id, **_summary(row, sum(s["unrealized_pnl"] for s in symbols)), "symbols": symbols})
+    return {"bot_id": bot_id, "wallets": wallets}
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m backend.pnl", description="Recompute PnL aggregates from stored fills.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--wallet", type=int, help="Only this wallet id")
+    parser.add_argument("--check", action="store_true", help="Only compare with the incremental state; change nothing")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        wallet_ids = [args.wallet] if args.wallet else db.scalars(select(models.Wallet.id)).all()
+        mismatched = 0
+        for wallet_id in wallet_ids:
+            differences = rebuild_wallet(db, wallet_id, replace=not args.check)
+            mismatched += bool(differences)
+            print(f"wallet {wallet_id}: {'ok' if not differences else f'{len(differences)} differences'}")
+            for difference in differences:
+                print(f"  {difference}")
+    finally:
+        db.close()
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,53 +1,32 @@
 import asyncio
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-import os
-import json
+from ..bot_tail import open_viewer, close_viewer
 
 router = APIRouter()
 
-async def log_and_status_generator(bot_id: int):
-    log_file = f"bot_logs/bot_{bot_id}.log"
-    status_file = f"bot_status/bot_{bot_id}.json"
-
-    # Ensure files exist to avoid immediate errors
-    if not os.path.exists(log_file):
-        with open(log_file, 'w') as f:
-            f.write("Log file created.")
-
-    if not os.path.exists(status_file):
-        with open(status_file, 'w') as f:
-            json.dump({"status": "initializing"}, f)
+@router.websocket("/ws/bots/{bot_id}/dashboard")
+async def websocket_bot_dashboard(websocket: WebSocket, bot_id: int, offset: int = 0):
+    # `offset` is the byte offset of the last log frame a reconnecting client received.
+    await websocket.accept()
+    tailer, viewer = open_viewer(bot_id, max(offset, 0))
 
-    log_f = open(log_file, 'r')
-    status_f = open(status_file, 'r')
+    async def forward():
+        async for frame in tailer.frames(viewer):
+            await websocket.send_json(frame)
 
+    forwarder = asyncio.create_task(forward())
+    receive = asyncio.create_task(websocket.receive_text())
     try:
         while True:
-            # Check for new log lines
-            log_line = log_f.readline()
-            if log_line:
-                yield json.dumps({"type": "log", "data": log_line.strip()})
-
-            # Check for new status updates
-            status_f.seek(0)
-            status_content = status_f.read()
-            if status_content:
-                try:
-                    status_data = json.loads(status_content)
-                    yield json.dumps({"type": "status", "data": status_data})
-                except json.JSONDecodeError:
-                    pass # Ignore if file is being written
-
-            await asyncio.sleep(1)
-    finally:
-        log_f.close()
-        status_f.close()
-
-@router.websocket("/ws/bots/{bot_id}/dashboard")
-async def websocket_bot_dashboard(websocket: WebSocket, bot_id: int):
-    await websocket.accept()
-    try:
-        async for message in log_and_status_generator(bot_id):
-            await websocket.send_text(message)
+            done, _ = await asyncio.wait({forwarder, receive}, return_when=asyncio.FIRST_COMPLETED)
+            if forwarder in done:
+                forwarder.result()
+                break
+            receive.result()
+            receive = asyncio.create_task(websocket.receive_text())
     except WebSocketDisconnect:
         print(f"Client disconnected from bot {bot_id} dashboard")
+    finally:
+        forwarder.cancel()
+        receive.cancel()
+        await close_viewer(tailer, viewer)
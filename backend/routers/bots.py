@@ -1,8 +1,20 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from .. import crud, models, schemas
 from ..database import get_db
 from ..bot_runner import bot_runner
+from ..status_segment import read_status
+from ..bot_metrics import bot_monitor
+from ..backtest import backtest_in_subprocess, fetch_candles
+from ..sweep import expand_grid, run_sweep, sample_ranges
+from ..fill_ingest import record_bot_start, record_bot_stop
+from ..async_hyperliquid_api import AsyncHyperliquidAPI, get_async_api
+from .. import pnl
+from ..config import settings
 from .. import security
 
 router = APIRouter()
@@ -11,7 +23,12 @@ router = APIRouter()
 def create_bot(
     bot: schemas.BotCreate, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    return crud.create_bot(db=db, bot=bot, user_id=current_user.id)
+    try:
+        return crud.create_bot(db=db, bot=bot, user_id=current_user.id)
+    except SyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Bot code does not compile: {e.msg} (line {e.lineno})")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Bot code does not compile: {e}")
 
 @router.get("/", response_model=list[schemas.Bot])
 def read_bots(
@@ -20,6 +37,13 @@ def read_bots(
     bots = crud.get_bots(db, user_id=current_user.id, skip=skip, limit=limit)
     return bots
 
+@router.get("/workers")
+def get_bot_workers(current_user: models.User = Depends(security.get_current_user)):
+    return {
+        "shared": bot_runner.shared.stats(),
+        "pool": bot_runner.pool.stats() if bot_runner.pool is not None else None,
+    }
+
 @router.post("/{bot_id}/run")
 def run_bot(
     bot_id: int, run_request: schemas.BotRunRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
@@ -32,19 +56,114 @@ def run_bot(
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    return bot_runner.start_bot(
+    result = bot_runner.start_bot(
         bot_id=bot.id,
         bot_code=bot.code,
         runtime_inputs=run_request.runtime_inputs,
-        wallet_private_key=wallet.private_key,
+        wallet_private_key=crud.wallet_private_key(wallet),
         capital_allocation=run_request.capital_allocation,
+        execution_mode=run_request.execution_mode,
     )
+    if result["status"] == "success":
+        # Lets fill ingestion attribute this wallet's fills to the bot.
+        record_bot_start(db, bot.id, wallet.id)
+    return result
+
+@router.post("/{bot_id}/backtest")
+def backtest_bot(
+    bot_id: int, request: schemas.BacktestRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+):
+    bot = crud.get_bot(db, bot_id=bot_id, user_id=current_user.id)
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if request.end_time <= request.start_time:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+
+    candles = fetch_candles(request.symbol, request.interval, request.start_time, request.end_time)
+    if not len(candles["t"]):
+        raise HTTPException(status_code=404, detail="No candles available for this range")
+    try:
+        return backtest_in_subprocess(
+            bot.code, candles, request.symbol, request.capital_allocation, request.runtime_inputs,
+            request.taker_fee_bps, request.maker_fee_bps, request.slippage_bps,
+        )
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+@router.post("/{bot_id}/sweep")
+def sweep_bot(
+    bot_id: int, request: schemas.SweepRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+):
+    bot = crud.get_bot(db, bot_id=bot_id, user_id=current_user.id)
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if (request.grid is None) == (request.ranges is None):
+        raise HTTPException(status_code=400, detail="Provide either grid or ranges")
+    swept = request.grid if request.grid is not None else request.ranges
+    unknown = set(swept) - set(bot.input_schema) if bot.input_schema else set()
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Not in the bot's input_schema: {', '.join(sorted(unknown))}")
+    try:
+        points = expand_grid(request.grid) if request.grid is not None else sample_ranges(request.ranges, request.samples, request.seed)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ranges: {e}")
+    if not points or len(points) > settings.sweep_max_runs:
+        raise HTTPException(status_code=400, detail=f"A sweep must have between 1 and {settings.sweep_max_runs} runs, not {len(points)}")
+
+    candles = fetch_candles(request.symbol, request.interval, request.start_time, request.end_time)
+    if not len(candles["t"]):
+        raise HTTPException(status_code=404, detail="No candles available for this range")
+    results = run_sweep(
+        bot.code, candles, request.symbol, request.capital_allocation, request.runtime_inputs, points,
+        (request.taker_fee_bps, request.maker_fee_bps, request.slippage_bps),
+        rank_by=request.rank_by, workers=request.workers, top=request.top,
+    )
+    # One JSON object per line, sent as each backtest finishes.
+    return StreamingResponse((json.dumps(result) + "\n" for result in results), media_type="application/x-ndjson")
 
 @router.post("/{bot_id}/stop")
 def stop_bot(
-    bot_id: int, current_user: models.User = Depends(security.get_current_user)
+    bot_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+):
+    result = bot_runner.stop_bot(bot_id=bot_id)
+    if result["status"] == "success":
+        record_bot_stop(db, bot_id)
+    return result
+
+@router.get("/{bot_id}/status")
+def get_bot_status(bot_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
+    if not crud.get_bot(db, bot_id=bot_id, user_id=current_user.id):
+        raise HTTPException(status_code=404, detail="Bot not found")
+    status = read_status(bot_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No status published for this bot")
+    return status
+
+@router.get("/{bot_id}/metrics")
+def get_bot_metrics(
+    bot_id: int, limit: int = None, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+):
+    if not crud.get_bot(db, bot_id=bot_id, user_id=current_user.id):
+        raise HTTPException(status_code=404, detail="Bot not found")
+    metrics = bot_monitor.metrics(bot_id, limit)
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="No metrics recorded for this bot")
+    return metrics
+
+@router.get("/{bot_id}/pnl")
+async def get_bot_pnl(
+    bot_id: int, db: Session = Depends(get_db), hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
-    return bot_runner.stop_bot(bot_id=bot_id)
+    def update():
+        if not crud.get_bot(db, bot_id=bot_id, user_id=current_user.id):
+            raise HTTPException(status_code=404, detail="Bot not found")
+        for wallet_id in db.scalars(select(models.BotRun.wallet_id).where(models.BotRun.bot_id == bot_id).distinct()).all():
+            pnl.update_wallet(db, wallet_id)
+
+    # The database work runs off the event loop; only the mids are awaited on it.
+    await run_in_threadpool(update)
+    mids = await hl_api.get_all_mids()
+    return await run_in_threadpool(pnl.bot_pnl, db, bot_id, mids)
 
 @router.get("/{bot_id}/logs")
 def get_bot_logs(bot_id: int, current_user: models.User = Depends(security.get_current_user)):
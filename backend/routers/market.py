@@ -1,17 +1,32 @@
-
 from fastapi import APIRouter, Depends
-from ..hyperliquid_api import HyperliquidAPI
+from ..async_hyperliquid_api import AsyncHyperliquidAPI, get_async_api
+from ..market_cache import market_cache
+from ..candle_store import candle_store
+from ..order_book import get_book_manager
 
 router = APIRouter()
 
 @router.get("/funding-history")
-def get_funding_history(symbol: str, start_time: int, end_time: int, hl_api: HyperliquidAPI = Depends(HyperliquidAPI)):
-    return hl_api.get_funding_history(symbol=symbol, start_time=start_time, end_time=end_time)
+async def get_funding_history(symbol: str, start_time: int, end_time: int, hl_api: AsyncHyperliquidAPI = Depends(get_async_api)):
+    return await hl_api.get_funding_history(symbol=symbol, start_time=start_time, end_time=end_time)
 
 @router.get("/candles")
-def get_candles(symbol: str, interval: str, start_time: int, end_time: int, hl_api: HyperliquidAPI = Depends(HyperliquidAPI)):
-    return hl_api.get_candles(symbol=symbol, interval=interval, start_time=start_time, end_time=end_time)
+async def get_candles(symbol: str, interval: str, start_time: int, end_time: int, hl_api: AsyncHyperliquidAPI = Depends(get_async_api)):
+    return await candle_store.get_candles(hl_api, symbol, interval, start_time, end_time)
 
 @router.get("/depth")
-def get_depth(symbol: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI)):
-    return hl_api.get_l2_book(symbol=symbol)
+async def get_depth(symbol: str, depth: int = None, tick: float = None, hl_api: AsyncHyperliquidAPI = Depends(get_async_api)):
+    book = await get_book_manager().get(symbol, hl_api)
+    return book.snapshot(depth, tick)
+
+@router.get("/book-stats")
+async def get_book_stats():
+    return get_book_manager().stats()
+
+@router.get("/cache-stats")
+def get_cache_stats():
+    return market_cache.stats()
+
+@router.get("/candle-store-stats")
+def get_candle_store_stats():
+    return candle_store.stats()
@@ -1,82 +1,146 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from .. import crud, models, schemas
 from ..database import get_db
-from ..hyperliquid_api import HyperliquidAPI
+from ..async_hyperliquid_api import AsyncHyperliquidAPI
+from ..hyperliquid_api import per_order_results
+from ..market_impact import estimate_impact
+from ..order_book import get_book_manager
+from .. import order_gateway
+from ..order_gateway import CANCEL, MODIFY, ORDER
 from .. import security
 
 router = APIRouter()
 
 @router.post("/")
-def place_order(
+async def place_order(
     order: schemas.OrderRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    wallet = crud.get_wallet(db, wallet_id=order.wallet_id, user_id=current_user.id)
+    wallet = await run_in_threadpool(crud.get_wallet, db, wallet_id=order.wallet_id, user_id=current_user.id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    hl_api = HyperliquidAPI(private_key=wallet.private_key)
-    return hl_api.place_order(
+    hl_api = AsyncHyperliquidAPI(private_key=crud.wallet_private_key(wallet))
+    return await order_gateway.submit_async(wallet.address, ORDER, lambda: hl_api.place_order(
         symbol=order.symbol,
         is_buy=order.is_buy,
         sz=order.sz,
         limit_px=order.limit_px,
         order_type=order.order_type,
+    ))
+
+@router.post("/batch")
+async def place_orders_batch(
+    request: schemas.BatchOrderRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+):
+    if not request.orders:
+        raise HTTPException(status_code=400, detail="No orders given")
+    wallet = await run_in_threadpool(crud.get_wallet, db, wallet_id=request.wallet_id, user_id=current_user.id)
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    orders = [order.model_dump() for order in request.orders]
+    hl_api = AsyncHyperliquidAPI(private_key=crud.wallet_private_key(wallet))
+    response = await order_gateway.submit_async(
+        wallet.address, ORDER, lambda: hl_api.place_orders_batch(orders), weight=order_gateway.batch_weight(len(orders))
     )
+    return per_order_results(orders, response)
+
+@router.put("/batch")
+async def modify_orders_batch(
+    request: schemas.BatchModifyRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+):
+    if not request.modifies:
+        raise HTTPException(status_code=400, detail="No orders given")
+    wallet = await run_in_threadpool(crud.get_wallet, db, wallet_id=request.wallet_id, user_id=current_user.id)
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    modifies = [modify.model_dump() for modify in request.modifies]
+    hl_api = AsyncHyperliquidAPI(private_key=crud.wallet_private_key(wallet))
+    try:
+        response = await order_gateway.submit_async(
+            wallet.address, MODIFY, lambda: hl_api.modify_orders_batch(modifies), weight=order_gateway.batch_weight(len(modifies))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return per_order_results(modifies, response)
+
+@router.post("/impact")
+async def estimate_order_impact(
+    request: schemas.ImpactRequest, current_user: models.User = Depends(security.get_current_user)
+):
+    book = await get_book_manager().get(request.symbol, AsyncHyperliquidAPI())
+    try:
+        return estimate_impact(book, request.is_buy, request.sizes, request.notionals)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/gateway-stats")
+async def get_gateway_stats(current_user: models.User = Depends(security.get_current_user)):
+    owned = await run_in_threadpool(lambda: {wallet.address.lower() for wallet in current_user.wallets})
+    return {address: stats for address, stats in order_gateway.stats().items() if address.lower() in owned}
 
 @router.put("/{order_id}")
-def modify_order(
+async def modify_order(
     order_id: int, order: schemas.ModifyOrderRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    wallet = crud.get_wallet(db, wallet_id=order.wallet_id, user_id=current_user.id)
+    wallet = await run_in_threadpool(crud.get_wallet, db, wallet_id=order.wallet_id, user_id=current_user.id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    hl_api = HyperliquidAPI(private_key=wallet.private_key)
-    return hl_api.modify_order(
-        symbol=order.symbol,
-        oid=order_id,
-        sz=order.sz,
-        limit_px=order.limit_px,
-        order_type=order.order_type,
-    )
+    hl_api = AsyncHyperliquidAPI(private_key=crud.wallet_private_key(wallet))
+    try:
+        return await order_gateway.submit_async(wallet.address, MODIFY, lambda: hl_api.modify_order(
+            symbol=order.symbol,
+            oid=order_id,
+            sz=order.sz,
+            limit_px=order.limit_px,
+            order_type=order.order_type,
+            is_buy=order.is_buy,
+        ), oid=order_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/cancel")
-def cancel_order(
+async def cancel_order(
     cancel_request: schemas.CancelOrderRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
     # We need to find the wallet in the DB to get the private key for signing
-    wallet = db.query(models.Wallet).filter(models.Wallet.address == cancel_request.wallet_address, models.Wallet.owner_id == current_user.id).first()
+    wallet = await run_in_threadpool(crud.get_wallet_by_address, db, address=cancel_request.wallet_address, user_id=current_user.id)
     if not wallet:
         # We need to check if this is a subaccount of a managed wallet
         # This logic can be complex, for now, we assume only master accounts can cancel
         raise HTTPException(status_code=404, detail="Wallet not found or you are not the owner")
 
-    hl_api = HyperliquidAPI(private_key=wallet.private_key)
-    return hl_api.cancel_order(symbol=cancel_request.symbol, oid=cancel_request.oid)
+    hl_api = AsyncHyperliquidAPI(private_key=crud.wallet_private_key(wallet))
+    return await order_gateway.submit_async(
+        wallet.address, CANCEL, lambda: hl_api.cancel_order(symbol=cancel_request.symbol, oid=cancel_request.oid), oid=cancel_request.oid
+    )
 
 @router.get("/{order_id}")
-def get_order_status(
+async def get_order_status(
     order_id: int, wallet_address: str, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
     # Wallet address is required by the API to fetch order status
-    wallet = db.query(models.Wallet).filter(models.Wallet.address == wallet_address, models.Wallet.owner_id == current_user.id).first()
+    wallet = await run_in_threadpool(crud.get_wallet_by_address, db, address=wallet_address, user_id=current_user.id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found or you are not the owner")
 
-    hl_api = HyperliquidAPI()  # No private key needed for this read-only operation
-    return hl_api.query_order_status(user_address=wallet_address, oid=order_id)
+    hl_api = AsyncHyperliquidAPI()  # No private key needed for this read-only operation
+    return await hl_api.query_order_status(user_address=wallet_address, oid=order_id)
 
 @router.delete("/cancel-all/{wallet_address}")
-def cancel_all_orders(
+async def cancel_all_orders(
     wallet_address: str, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    wallet = db.query(models.Wallet).filter(models.Wallet.address == wallet_address, models.Wallet.owner_id == current_user.id).first()
+    wallet = await run_in_threadpool(crud.get_wallet_by_address, db, address=wallet_address, user_id=current_user.id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found or you are not the owner")
 
-    hl_api = HyperliquidAPI(private_key=wallet.private_key)
-    open_orders = hl_api.get_open_orders(user_address=wallet.address)
+    hl_api = AsyncHyperliquidAPI(private_key=crud.wallet_private_key(wallet))
+    open_orders = await hl_api.get_open_orders(user_address=wallet.address)
 
     if not open_orders:
         return {"status": "success", "message": "No open orders to cancel."}
@@ -85,21 +149,23 @@ def cancel_all_orders(
         {"coin": order["order"]["coin"], "oid": order["order"]["oid"]} for order in open_orders
     ]
 
-    return hl_api.cancel_orders_batch(cancellations)
+    return await order_gateway.submit_async(
+        wallet.address, CANCEL, lambda: hl_api.cancel_orders_batch(cancellations), weight=order_gateway.batch_weight(len(cancellations))
+    )
 
 @router.post("/spot")
-def place_spot_order(
+async def place_spot_order(
     order: schemas.SpotOrderRequest, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    wallet = crud.get_wallet(db, wallet_id=order.wallet_id, user_id=current_user.id)
+    wallet = await run_in_threadpool(crud.get_wallet, db, wallet_id=order.wallet_id, user_id=current_user.id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    hl_api = HyperliquidAPI(private_key=wallet.private_key)
-    return hl_api.place_spot_order(
+    hl_api = AsyncHyperliquidAPI(private_key=crud.wallet_private_key(wallet))
+    return await order_gateway.submit_async(wallet.address, ORDER, lambda: hl_api.place_spot_order(
         symbol=order.symbol,
         is_buy=order.is_buy,
         sz=order.sz,
         limit_px=order.limit_px,
         order_type=order.order_type,
-    )
+    ))
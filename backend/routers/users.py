@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from .. import crud, models, schemas, security, database
@@ -7,8 +8,8 @@ router = APIRouter()
 
 @router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(form_data: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    user = crud.get_user(db, username=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(crud.get_user, db, username=form_data.username)
+    if not user or not await security.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -20,11 +21,16 @@ async def login_for_access_token(form_data: schemas.UserCreate, db: Session = De
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = crud.get_user(db, username=user.username)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+    db_user = await run_in_threadpool(crud.get_user, db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    # Hashed on the bcrypt threads; the database calls run in the thread pool.
+    hashed_password = await security.get_password_hash_async(user.password)
+    db_user = await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
+    # A token for an earlier user of the same name must not resolve to the old id.
+    security.invalidate_principal(db_user.username)
+    return db_user
 
 from .. import security
 
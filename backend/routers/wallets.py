@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from .. import crud, models, schemas
 from ..database import get_db
+from ..config import settings
+from ..async_hyperliquid_api import AsyncHyperliquidAPI, get_async_api
+from ..fill_ingest import as_fill, ingest_wallet_in_session, trade_history
 from ..hyperliquid_api import HyperliquidAPI
-from .. import security
+from .. import pnl, security, wallet_import
 
 router = APIRouter()
 
@@ -28,103 +34,174 @@ def export_wallets(
     return wallets
 
 @router.post("/import")
-def import_wallets(
-    wallets: list[schemas.WalletImport], db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+async def import_wallets(
+    request: Request, mode: str = "atomic", db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    for wallet in wallets:
-        crud.create_wallet(db=db, wallet=wallet, user_id=current_user.id)
-    return {"status": "success"}
+    # The body is a JSON array or newline-delimited JSON, parsed as it streams in.
+    if mode not in ("atomic", "best_effort"):
+        raise HTTPException(status_code=400, detail="mode must be atomic or best_effort")
+    try:
+        report = await wallet_import.import_wallets(db, current_user.id, wallet_import.iter_rows(request.stream()), atomic=mode == "atomic")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if mode == "atomic" and report["failed"]:
+        return JSONResponse(status_code=400, content=report)
+    return report
+
+@router.delete("/{wallet_id}", response_model=schemas.Wallet)
+def delete_wallet(
+    wallet_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
+):
+    wallet = crud.delete_wallet(db, wallet_id=wallet_id, user_id=current_user.id)
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return wallet
 
 @router.get("/{wallet_address}/balance")
-def get_wallet_balance(wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI)):
+async def get_wallet_balance(wallet_address: str, hl_api: AsyncHyperliquidAPI = Depends(get_async_api)):
     try:
-        user_state = hl_api.get_user_state(wallet_address)
+        user_state = await hl_api.get_user_state(wallet_address)
         balance = user_state.get("marginSummary", {}).get("accountValue", "0")
         return {"balance": balance}
     except Exception as e:
         return {"balance": "0"}
 
 @router.get("/{wallet_id}/open-orders")
-def get_open_orders(
+async def get_open_orders(
     wallet_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    wallet = crud.get_wallet(db, wallet_id=wallet_id, user_id=current_user.id)
+    wallet = await run_in_threadpool(crud.get_wallet, db, wallet_id=wallet_id, user_id=current_user.id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    hl_api = HyperliquidAPI(private_key=wallet.private_key)
-    return hl_api.get_open_orders(user_address=wallet.address)
+    hl_api = AsyncHyperliquidAPI()  # A read needs no signer, so the key stays encrypted
+    return await hl_api.get_open_orders(user_address=wallet.address)
 
 @router.get("/{wallet_id}/positions")
-def get_positions(
+async def get_positions(
     wallet_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)
 ):
-    wallet = crud.get_wallet(db, wallet_id=wallet_id, user_id=current_user.id)
+    wallet = await run_in_threadpool(crud.get_wallet, db, wallet_id=wallet_id, user_id=current_user.id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    hl_api = HyperliquidAPI(private_key=wallet.private_key)
-    return hl_api.get_positions(user_address=wallet.address)
+    hl_api = AsyncHyperliquidAPI()  # A read needs no signer, so the key stays encrypted
+    return await hl_api.get_positions(user_address=wallet.address)
+
+@router.get("/{wallet_id}/pnl")
+async def get_wallet_pnl(
+    wallet_id: int, db: Session = Depends(get_db), hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
+):
+    def update():
+        if not crud.get_wallet(db, wallet_id=wallet_id, user_id=current_user.id):
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        # Only fills stored since the last update are folded in; the rest is read from the aggregates.
+        pnl.update_wallet(db, wallet_id)
+
+    await run_in_threadpool(update)
+    mids = await hl_api.get_all_mids()
+    return await run_in_threadpool(pnl.wallet_pnl, db, wallet_id, mids)
 
 @router.get("/{wallet_address}/vault-equity")
-def get_vault_equity(
-    wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI), current_user: models.User = Depends(security.get_current_user)
+async def get_vault_equity(
+    wallet_address: str, hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
     # We don't need to check the wallet ownership here, as the API call is read-only
     # and doesn't require a private key. We just need to make sure the user is authenticated.
-    return hl_api.get_user_vault_equity(user_address=wallet_address)
+    return await hl_api.get_user_vault_equity(user_address=wallet_address)
 
 @router.get("/state/{wallet_address}")
-def get_address_state(
-    wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI), current_user: models.User = Depends(security.get_current_user)
+async def get_address_state(
+    wallet_address: str, hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
-    open_orders = hl_api.get_open_orders(user_address=wallet_address)
-    positions = hl_api.get_positions(user_address=wallet_address)
-    spot_balances = hl_api.get_spot_balances(user_address=wallet_address)
+    open_orders = await hl_api.get_open_orders(user_address=wallet_address)
+    positions = await hl_api.get_positions(user_address=wallet_address)
+    spot_balances = await hl_api.get_spot_balances(user_address=wallet_address)
 
     return {"open_orders": open_orders, "positions": positions, "spot_balances": spot_balances}
 
 @router.get("/order-history/{wallet_address}")
-def get_order_history(
-    wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI), current_user: models.User = Depends(security.get_current_user)
+async def get_order_history(
+    wallet_address: str, hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
-    return hl_api.get_historical_orders(user_address=wallet_address)
+    return await hl_api.get_historical_orders(user_address=wallet_address)
 
 @router.get("/trade-history/{wallet_address}")
-def get_trade_history(
-    wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI), current_user: models.User = Depends(security.get_current_user)
+async def get_trade_history(
+    wallet_address: str, response: Response, limit: int = None, before: str = None, bot_id: int = None, coin: str = None,
+    db: Session = Depends(get_db), hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
-    return hl_api.get_user_fills(user_address=wallet_address)
+    wallet = await run_in_threadpool(crud.get_wallet_by_address, db, address=wallet_address, user_id=current_user.id)
+    if not wallet:
+        # Addresses the user does not hold are not ingested; ask the exchange directly.
+        return await hl_api.get_user_fills(user_address=wallet_address)
+    cursor = None
+    if before is not None:
+        try:
+            time_ms, trade_id = before.split(":")
+            cursor = (int(time_ms), int(trade_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="before must be a cursor of the form <time_ms>:<id>")
+    if await run_in_threadpool(db.get, models.FillWatermark, wallet.id) is None:
+        # Never ingested yet, e.g. a wallet added since the last ingestion pass. The thread gets
+        # its own session; this request's is not safe to share with it.
+        await asyncio.to_thread(ingest_wallet_in_session, db.get_bind(), wallet.id, HyperliquidAPI().get_user_fills_by_time)
+    # Without a limit the whole first page is returned, as many fills as the exchange's userFills gives.
+    limit = settings.trade_history_max_page if limit is None else max(1, min(limit, settings.trade_history_max_page))
+    trades, next_cursor = await run_in_threadpool(trade_history, db, wallet.id, limit, cursor, bot_id, coin)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [as_fill(trade) for trade in trades]
 
 @router.get("/portfolio-history/{wallet_address}")
-def get_portfolio_history(
-    wallet_address: str, start_time: int, end_time: int, hl_api: HyperliquidAPI = Depends(HyperliquidAPI), current_user: models.User = Depends(security.get_current_user)
+async def get_portfolio_history(
+    wallet_address: str, start_time: int, end_time: int, hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
-    return hl_api.get_historical_portfolio_value(user_address=wallet_address, start_time=start_time, end_time=end_time)
+    return await hl_api.get_historical_portfolio_value(user_address=wallet_address, start_time=start_time, end_time=end_time)
 
 @router.get("/{wallet_address}/subaccounts")
-def get_subaccounts(
-    wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI), current_user: models.User = Depends(security.get_current_user)
+async def get_subaccounts(
+    wallet_address: str, hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
-    return hl_api.get_sub_accounts(user_address=wallet_address)
+    return await hl_api.get_sub_accounts(user_address=wallet_address)
+
+async def _gather_limited(calls, limit: int, timeout: float):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(call):
+        async with semaphore:
+            return await asyncio.wait_for(call(), timeout)
+
+    return await asyncio.gather(*(run(call) for call in calls), return_exceptions=True)
 
 @router.get("/{wallet_address}/consolidated-state")
-def get_consolidated_state(
-    wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI), current_user: models.User = Depends(security.get_current_user)
+async def get_consolidated_state(
+    wallet_address: str, hl_api: AsyncHyperliquidAPI = Depends(get_async_api), current_user: models.User = Depends(security.get_current_user)
 ):
-    subaccounts = hl_api.get_sub_accounts(user_address=wallet_address)
-    all_addresses = [wallet_address] + [sub["subAccountUser"] for sub in subaccounts]
+    subaccounts = await hl_api.get_sub_accounts(user_address=wallet_address)
+    all_addresses = [wallet_address] + [sub["subAccountUser"] for sub in subaccounts or []]
+
+    calls = []
+    for address in all_addresses:
+        calls.append(lambda address=address: hl_api.get_user_state(address))
+        calls.append(lambda address=address: hl_api.get_open_orders(user_address=address))
+    results = await _gather_limited(calls, settings.upstream_concurrency_limit, settings.upstream_call_timeout_seconds)
 
     consolidated_state = {
         "open_orders": [],
         "positions": [],
         "spot_balances": [],
         "total_account_value": 0,
+        "errors": {},
     }
 
-    for address in all_addresses:
-        user_state = hl_api.get_user_state(address)
-        consolidated_state["open_orders"].extend(hl_api.get_open_orders(user_address=address))
+    for index, address in enumerate(all_addresses):
+        user_state, open_orders = results[2 * index], results[2 * index + 1]
+        failure = next((result for result in (user_state, open_orders) if isinstance(result, BaseException)), None)
+        if failure is not None:
+            consolidated_state["errors"][address] = str(failure) or type(failure).__name__
+            continue
+        consolidated_state["open_orders"].extend(open_orders)
         consolidated_state["positions"].extend(user_state.get("assetPositions", []))
         consolidated_state["spot_balances"].extend(user_state.get("spotAssetPositions", []))
         consolidated_state["total_account_value"] += float(user_state.get("marginSummary", {}).get("accountValue", "0"))
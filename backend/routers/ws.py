@@ -1,23 +1,75 @@
-from fastapi import APIRouter, WebSocket, Depends, WebSocketDisconnect
-from ..hyperliquid_api import HyperliquidAPI
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from ..ws_hub import get_hub
+from ..async_hyperliquid_api import get_async_api
+from ..order_book import book_delta, get_book_manager
 import asyncio
 
 router = APIRouter()
 
 @router.websocket("/ws/updates/{wallet_address}")
-async def websocket_endpoint(websocket: WebSocket, wallet_address: str, hl_api: HyperliquidAPI = Depends(HyperliquidAPI)):
+async def websocket_endpoint(websocket: WebSocket, wallet_address: str):
     await websocket.accept()
 
-    async def callback(event):
-        await websocket.send_json(event)
+    hub = get_hub()
+    subscriber = await hub.subscribe({"type": "userEvents", "user": wallet_address})
 
+    async def forward():
+        while True:
+            await websocket.send_json(await subscriber.get())
+
+    forwarder = asyncio.create_task(forward())
     try:
-        await hl_api.subscribe_to_user_events(wallet_address, callback)
-        # Keep the connection alive while subscribed
+        # Keep the connection open until the client goes away or forwarding fails
+        receive = asyncio.create_task(websocket.receive_text())
         while True:
-            await asyncio.sleep(1)
+            done, _ = await asyncio.wait({forwarder, receive}, return_when=asyncio.FIRST_COMPLETED)
+            if forwarder in done:
+                forwarder.result()
+                break
+            receive.result()
+            receive = asyncio.create_task(websocket.receive_text())
     except WebSocketDisconnect:
         print(f"Client disconnected from wallet: {wallet_address}")
     except Exception as e:
         print(f"An error occurred in websocket for {wallet_address}: {e}")
         await websocket.close(code=1011)
+    finally:
+        forwarder.cancel()
+        receive.cancel()
+        await hub.unsubscribe(subscriber)
+
+@router.websocket("/ws/market/{symbol}/book")
+async def websocket_book(websocket: WebSocket, symbol: str, depth: int = None, tick: float = None):
+    # Sends a snapshot, then only the levels that changed since the last message.
+    await websocket.accept()
+    manager = get_book_manager()
+    book, updated = await manager.listen(symbol, get_async_api())
+
+    async def forward():
+        last = book.snapshot(depth, tick)
+        await websocket.send_json({"type": "snapshot", **last})
+        while True:
+            await updated.wait()
+            updated.clear()
+            current = book.snapshot(depth, tick)
+            delta = book_delta(last, current)
+            if delta["bids"] or delta["asks"]:
+                await websocket.send_json({"type": "delta", **delta})
+            last = current
+
+    forwarder = asyncio.create_task(forward())
+    receive = asyncio.create_task(websocket.receive_text())
+    try:
+        while True:
+            done, _ = await asyncio.wait({forwarder, receive}, return_when=asyncio.FIRST_COMPLETED)
+            if forwarder in done:
+                forwarder.result()
+                break
+            receive.result()
+            receive = asyncio.create_task(websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        receive.cancel()
+        manager.unlisten(symbol, updated)
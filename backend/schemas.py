@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 
 class Token(BaseModel):
     access_token: str
@@ -51,9 +51,46 @@ class OrderRequest(BaseModel):
     cloid: Optional[str] = None
 
 
+class BatchOrder(BaseModel):
+    symbol: str
+    is_buy: bool
+    sz: float
+    limit_px: float
+    order_type: dict
+    reduce_only: bool = False
+
+
+class BatchOrderRequest(BaseModel):
+    wallet_id: int
+    orders: list[BatchOrder]
+
+
+class BatchModify(BaseModel):
+    oid: int
+    symbol: str
+    is_buy: Optional[bool] = None
+    sz: float
+    limit_px: float
+    order_type: dict
+    reduce_only: bool = False
+
+
+class BatchModifyRequest(BaseModel):
+    wallet_id: int
+    modifies: list[BatchModify]
+
+
+class ImpactRequest(BaseModel):
+    symbol: str
+    is_buy: bool
+    sizes: Optional[list[float]] = None
+    notionals: Optional[list[float]] = None
+
+
 class ModifyOrderRequest(BaseModel):
     wallet_id: int
     symbol: str
+    is_buy: Optional[bool] = None
     sz: float
     limit_px: float
     order_type: dict
@@ -85,6 +122,30 @@ class BotRunRequest(BaseModel):
     wallet_id: int
     capital_allocation: float
     runtime_inputs: dict
+    execution_mode: Literal["process", "shared"] = "process"
+
+
+class BacktestRequest(BaseModel):
+    symbol: str
+    interval: str = "1m"
+    start_time: int
+    end_time: int
+    capital_allocation: float
+    runtime_inputs: dict = {}
+    taker_fee_bps: float = 4.5
+    maker_fee_bps: float = 1.5
+    slippage_bps: float = 1.0
+
+
+class SweepRequest(BacktestRequest):
+    # Either a grid of values per input, or ranges sampled `samples` times.
+    grid: Optional[dict[str, list]] = None
+    ranges: Optional[dict[str, dict]] = None
+    samples: int = 50
+    seed: Optional[int] = None
+    rank_by: str = "total_return"
+    workers: Optional[int] = None
+    top: int = 10
 
 
 class VaultDepositRequest(BaseModel):
@@ -1,14 +1,22 @@
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from . import crud, models, schemas, database
 from .config import settings
-from .passwords import verify_password, get_password_hash
+from .passwords import verify_password, verify_password_async, get_password_hash, get_password_hash_async
+from .market_cache import MISS, MemoryBackend
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# User ids by token subject, so an authenticated request does not query the users table.
+principal_cache = MemoryBackend(settings.principal_cache_size)
+
+def invalidate_principal(username: str):
+    principal_cache.delete(username)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -33,7 +41,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = crud.get_user(db, username=token_data.username)
+    user_id = principal_cache.get(token_data.username)
+    if user_id is not MISS:
+        # Attached to this request's session without a query; other columns and relationships load on use.
+        user = models.User(id=user_id, username=token_data.username)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+    # Queried in the thread pool, so a burst of cache misses does not hold up the event loop.
+    user = await run_in_threadpool(crud.get_user, db, username=token_data.username)
     if user is None:
         raise credentials_exception
+    if settings.principal_cache_ttl_seconds > 0:
+        principal_cache.set(token_data.username, user.id, settings.principal_cache_ttl_seconds)
     return user
@@ -0,0 +1,304 @@
+import asyncio
+import contextvars
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import resource
+import sys
+import threading
+import time
+
+from .bot_code_cache import bot_code_cache, is_async_bot
+from .config import settings
+from .status_segment import StatusWriter, segment_path
+
+# The log file of the bot whose code is running in the current task.
+_bot_log = contextvars.ContextVar("bot_log", default=None)
+
+
+class _RoutedStream:
+    """Stands in for sys.stdout/stderr so each bot's prints land in its own log."""
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+
+    def write(self, text):
+        return (_bot_log.get() or self._fallback).write(text)
+
+    def flush(self):
+        (_bot_log.get() or self._fallback).flush()
+
+    def __getattr__(self, name):
+        return getattr(self._fallback, name)
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS where /proc is unavailable.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _SharedBot:
+    def __init__(self, bot_id: int, address: str, capital_allocation: float):
+        from .bot_runner import CapitalManager
+
+        self.bot_id = bot_id
+        self.address = address
+        self.capital_manager = CapitalManager(capital_allocation)
+        self.status_writer = StatusWriter(segment_path(bot_id))
+        os.makedirs("bot_logs", exist_ok=True)
+        self.log = open(os.path.join("bot_logs", f"bot_{bot_id}.log"), "w", buffering=1)
+        self.task = None
+
+    def publish(self):
+        self.status_writer.publish(self.capital_manager.available_capital, self.capital_manager.positions)
+
+    def close(self):
+        self.log.close()
+        self.status_writer.close()
+
+
+class _WorkerLoop:
+    """Runs many bots as tasks on one event loop inside a shared worker process."""
+
+    def __init__(self, conn, fill_queue):
+        self.conn = conn
+        self.fill_queue = fill_queue
+        self.bots = {}
+        self.loop_lag = 0.0
+        self.stopping = asyncio.Event()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        sys.stdout, sys.stderr = _RoutedStream(sys.stdout), _RoutedStream(sys.stderr)
+        loop.add_reader(self.conn.fileno(), self._on_command)
+        threading.Thread(target=self._read_fills, args=(loop,), daemon=True).start()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await self.stopping.wait()
+        finally:
+            heartbeat.cancel()
+            loop.remove_reader(self.conn.fileno())
+            for bot in list(self.bots.values()):
+                bot.task.cancel()
+
+    def _on_command(self):
+        try:
+            command = self.conn.recv()
+        except EOFError:
+            self.stopping.set()
+            return
+        if command[0] == "start":
+            self._start(*command[1:])
+        elif command[0] == "stop":
+            bot = self.bots.get(command[1])
+            if bot is not None:
+                bot.task.cancel()
+
+    def _start(self, run, bot_id, bot_code, runtime_inputs, wallet_private_key, capital_allocation, address):
+        bot = _SharedBot(bot_id, address.lower(), capital_allocation)
+        bot.run = run
+        self.bots[run] = bot
+        bot.publish()
+        bot.task = asyncio.create_task(self._run_bot(bot, bot_code, runtime_inputs, wallet_private_key))
+        bot.task.add_done_callback(lambda _: self._finished(bot))
+
+    async def _run_bot(self, bot, bot_code, runtime_inputs, wallet_private_key):
+        from .bot_runner import AsyncBotTradingAPI
+
+        _bot_log.set(bot.log)
+        try:
+            code = bot_code_cache.load(bot_code)
+            if not is_async_bot(code):
+                # A blocking bot could not be stopped without stopping the whole worker.
+                print("Error executing bot: shared mode needs an `async def main()`; run this bot in process mode.")
+                return
+            bot_globals = {
+                "__name__": f"bot_{bot.bot_id}",
+                "runtime_inputs": runtime_inputs,
+                "trading_api": AsyncBotTradingAPI(wallet_private_key, bot.capital_manager),
+                "print": print,
+            }
+            # Top-level code only defines things; main() shares the loop cooperatively.
+            exec(code, bot_globals)
+            await bot_globals["main"]()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error executing bot: {e}")
+
+    def _finished(self, bot):
+        self.bots.pop(bot.run, None)
+        bot.close()
+        self.conn.send(("done", bot.run))
+
+    def _read_fills(self, loop):
+        while True:
+            try:
+                fill = self.fill_queue.get()
+            except (EOFError, OSError):
+                return
+            loop.call_soon_threadsafe(self._route_fill, fill)
+
+    def _route_fill(self, fill):
+        for bot in self.bots.values():
+            if bot.address == fill.get("user"):
+                bot.capital_manager.track_fill(fill["coin"], fill["side"] == "B", float(fill["sz"]), float(fill["px"]))
+                bot.publish()
+
+    async def _heartbeat(self):
+        # Also measures how late the loop wakes up, which is how long bots hog it.
+        interval = settings.bot_status_heartbeat_seconds
+        last_report = 0.0
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, time.monotonic() - expected)
+            for bot in self.bots.values():
+                bot.publish()
+            if time.monotonic() - last_report >= settings.shared_worker_report_seconds:
+                last_report = time.monotonic()
+                self.conn.send(("metrics", {"bots": len(self.bots), "rss_bytes": _rss_bytes(), "loop_lag_ms": self.loop_lag * 1000}))
+
+
+def shared_worker_main(conn, fill_queue):
+    from .client_registry import client_registry
+
+    # Clients inherited from the parent share its sockets.
+    client_registry.clear()
+    asyncio.run(_WorkerLoop(conn, fill_queue).serve())
+
+
+class SharedBotHandle:
+    """Stands in for a bot's Process in BotRunner.active_bots when it runs in a shared worker."""
+
+    def __init__(self, group, worker, bot_id: int, run: int):
+        self.group = group
+        self.worker = worker
+        self.bot_id = bot_id
+        self.run = run
+
+    @property
+    def pid(self):
+        return self.worker.process.pid
+
+    def is_alive(self):
+        return self.run in self.worker.bots and self.worker.process.is_alive()
+
+    def terminate(self):
+        self.group.stop_bot(self)
+
+    def join(self, timeout=None):
+        pass
+
+
+class SharedWorker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.fill_queue = context.Queue()
+        self.process = context.Process(target=shared_worker_main, args=(child_conn, self.fill_queue))
+        self.process.start()
+        child_conn.close()
+        self.bots = {}  # run -> SharedBotHandle
+        self.metrics = {}
+
+
+class SharedWorkerGroup:
+    """A few long-lived processes that each run many bots as asyncio tasks."""
+
+    def __init__(self, size: int, on_done=None):
+        self.size = size
+        self.on_done = on_done
+        self._context = multiprocessing.get_context()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = multiprocessing.Pipe(duplex=False)
+        self._monitor = None
+        self._runs = itertools.count()
+        self._closed = False
+
+    def _start(self):
+        if self._monitor is None:
+            self._workers = [SharedWorker(self._context) for _ in range(self.size)]
+            self._monitor = threading.Thread(target=self._watch, name="shared-bot-workers", daemon=True)
+            self._monitor.start()
+
+    def acquire(self, bot_id: int) -> SharedBotHandle:
+        # Reserves a slot on the least loaded worker; the bot starts on `launch`.
+        with self._lock:
+            self._start()
+            for index, worker in enumerate(self._workers):
+                if not worker.process.is_alive():
+                    self._workers[index] = SharedWorker(self._context)
+            worker = min(self._workers, key=lambda w: len(w.bots))
+            handle = SharedBotHandle(self, worker, bot_id, next(self._runs))
+            worker.bots[handle.run] = handle
+        self._wakeup_w.send(None)
+        return handle
+
+    def launch(self, handle: SharedBotHandle, bot_code: str, runtime_inputs: dict, wallet_private_key: str, capital_allocation: float, address: str):
+        with self._lock:
+            handle.worker.conn.send(("start", handle.run, handle.bot_id, bot_code, runtime_inputs, wallet_private_key, capital_allocation, address))
+
+    def stop_bot(self, handle: SharedBotHandle):
+        with self._lock:
+            if handle.run in handle.worker.bots:
+                handle.worker.conn.send(("stop", handle.run))
+
+    def _watch(self):
+        while True:
+            with self._lock:
+                workers = {worker.conn: worker for worker in self._workers}
+            for conn in multiprocessing.connection.wait([self._wakeup_r, *workers]):
+                if conn is self._wakeup_r:
+                    conn.recv()
+                    continue
+                worker = workers[conn]
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    self._lost(worker)
+                    continue
+                if message[0] == "metrics":
+                    worker.metrics = message[1]
+                elif message[0] == "done":
+                    with self._lock:
+                        handle = worker.bots.pop(message[1], None)
+                    if handle is not None and self.on_done is not None:
+                        self.on_done(handle.bot_id, handle)
+
+    def _lost(self, worker: SharedWorker):
+        with self._lock:
+            if self._closed:
+                return
+            handles = list(worker.bots.values())
+            worker.bots.clear()
+            if worker in self._workers:
+                self._workers[self._workers.index(worker)] = SharedWorker(self._context)
+        worker.conn.close()
+        worker.process.join()
+        print(f"Shared bot worker {worker.process.pid} exited with code {worker.process.exitcode}; {len(handles)} bots stopped")
+        if self.on_done is not None:
+            for handle in handles:
+                self.on_done(handle.bot_id, handle)
+        self._wakeup_w.send(None)
+
+    def stats(self):
+        with self._lock:
+            return [
+                {"pid": worker.process.pid, "alive": worker.process.is_alive(), "bots": len(worker.bots), **worker.metrics}
+                for worker in self._workers
+            ]
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.process.terminate()
+        for worker in workers:
+            worker.process.join()
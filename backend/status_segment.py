@@ -0,0 +1,128 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .config import settings
+
+STATUS_DIR = "bot_status"
+
+MAGIC = b"HLBS"
+VERSION = 1
+MAX_POSITIONS = 64
+SYMBOL_BYTES = 32
+
+# Fixed layout, little endian:
+#   0   sequence (u64), odd while the writer is mid-update
+#   8   magic, version, pid, position count (u32 each)
+#   24  started_at, updated_at, heartbeat (unix seconds), available capital (f64 each)
+#   56  MAX_POSITIONS slots of (symbol, size)
+_SEQ = struct.Struct("<Q")
+_HEADER = struct.Struct("<4sIIIdddd")
+_SLOT = struct.Struct(f"<{SYMBOL_BYTES}sd")
+_SLOTS_AT = _SEQ.size + _HEADER.size
+SEGMENT_SIZE = _SLOTS_AT + MAX_POSITIONS * _SLOT.size
+
+
+def segment_path(bot_id: int) -> str:
+    return os.path.join(STATUS_DIR, f"bot_{bot_id}.status")
+
+
+class StatusWriter:
+    """Publishes one bot's status into its segment under a seqlock; used inside the bot process."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # The file is reused rather than recreated, so readers mapped before a
+        # restart keep seeing the same segment.
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != SEGMENT_SIZE:
+                os.ftruncate(fd, SEGMENT_SIZE)
+            self._mm = mmap.mmap(fd, SEGMENT_SIZE, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        self._lock = threading.Lock()
+        self._seq = _SEQ.unpack_from(self._mm, 0)[0] & ~1
+        self._started_at = time.time()
+        self._published = None
+        self._updated_at = None
+
+    def publish(self, available_capital: float, positions: dict):
+        # Called on every fill and as a heartbeat; `updated_at` only moves when the status changes.
+        positions = list(dict(positions).items())
+        now = time.time()
+        with self._lock:
+            if self._published != (available_capital, positions):
+                self._published = (available_capital, positions)
+                self._updated_at = now
+            self._seq += 1
+            _SEQ.pack_into(self._mm, 0, self._seq)
+            _HEADER.pack_into(
+                self._mm, _SEQ.size, MAGIC, VERSION, os.getpid(), len(positions),
+                self._started_at, self._updated_at, now, available_capital,
+            )
+            for slot, (symbol, size) in enumerate(positions[:MAX_POSITIONS]):
+                _SLOT.pack_into(self._mm, _SLOTS_AT + slot * _SLOT.size, symbol.encode()[:SYMBOL_BYTES], size)
+            self._seq += 1
+            _SEQ.pack_into(self._mm, 0, self._seq)
+
+    def close(self):
+        self._mm.close()
+
+
+class StatusReader:
+    """Read-only view of a bot's segment; reads unpack straight from the mapping."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), SEGMENT_SIZE, access=mmap.ACCESS_READ)
+
+    def sequence(self) -> int:
+        return _SEQ.unpack_from(self._mm, 0)[0]
+
+    def read(self, retries: int = 1000):
+        # Seqlock read: retry while a write is in progress or one completed meanwhile.
+        for _ in range(retries):
+            seq = self.sequence()
+            if seq & 1:
+                time.sleep(0)
+                continue
+            magic, _, pid, count, started_at, updated_at, heartbeat, available_capital = _HEADER.unpack_from(self._mm, _SEQ.size)
+            slots = [_SLOT.unpack_from(self._mm, _SLOTS_AT + slot * _SLOT.size) for slot in range(min(count, MAX_POSITIONS))]
+            if self.sequence() != seq:
+                continue
+            if magic != MAGIC:
+                return None
+            return {
+                "pid": pid,
+                "started_at": started_at,
+                "timestamp": updated_at,
+                "heartbeat": heartbeat,
+                "stale": time.time() - heartbeat > 3 * settings.bot_status_heartbeat_seconds,
+                "available_capital": available_capital,
+                "positions": {symbol.rstrip(b"\0").decode(errors="replace"): size for symbol, size in slots},
+                "positions_truncated": count > MAX_POSITIONS,
+            }
+        return None
+
+    def close(self):
+        self._mm.close()
+
+
+def open_reader(bot_id: int):
+    try:
+        return StatusReader(segment_path(bot_id))
+    except (FileNotFoundError, ValueError):
+        return None  # not published yet, or still being sized by the writer
+
+
+def read_status(bot_id: int):
+    reader = open_reader(bot_id)
+    if reader is None:
+        return None
+    try:
+        return reader.read()
+    finally:
+        reader.close()
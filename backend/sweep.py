@@ -0,0 +1,120 @@
+import bisect
+import io
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .backtest import CANDLE_FIELDS, run_backtest
+from .config import settings
+
+# Candle history of the sweep this pool worker belongs to, mapped once per worker.
+_candles = None
+
+
+def expand_grid(grid: dict) -> list[dict]:
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def sample_ranges(ranges: dict, samples: int, seed: int = None) -> list[dict]:
+    """Random points from {"name": {"min", "max", "integer"?, "log"?}} ranges, or {"choices": [...]}."""
+    rng = random.Random(seed)
+    points = []
+    for _ in range(samples):
+        point = {}
+        for key, spec in ranges.items():
+            if "choices" in spec:
+                point[key] = rng.choice(spec["choices"])
+            elif spec.get("integer"):
+                point[key] = rng.randint(int(spec["min"]), int(spec["max"]))
+            elif spec.get("log"):
+                point[key] = float(np.exp(rng.uniform(np.log(spec["min"]), np.log(spec["max"]))))
+            else:
+                point[key] = rng.uniform(spec["min"], spec["max"])
+        points.append(point)
+    return points
+
+
+def write_candles(candles: dict, directory: str = None) -> str:
+    # One (fields x bars) float64 array in an .npy file; workers map it read-only.
+    fd, path = tempfile.mkstemp(prefix="sweep-", suffix=".npy", dir=directory or None)
+    os.close(fd)
+    stacked = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(len(CANDLE_FIELDS), len(candles["t"])))
+    for row, field in enumerate(CANDLE_FIELDS):
+        stacked[row] = candles[field]
+    stacked.flush()
+    del stacked
+    return path
+
+
+def map_candles(path: str) -> dict:
+    stacked = np.load(path, mmap_mode="r")
+    return {field: stacked[row] for row, field in enumerate(CANDLE_FIELDS)}
+
+
+def _init_worker(path: str):
+    global _candles
+    _candles = map_candles(path)
+    # Bots print freely; a sweep only reports statistics.
+    sys.stdout = sys.stderr = io.StringIO()
+
+
+def _run_one(task):
+    index, bot_code, symbol, capital_allocation, inputs, fees = task
+    sys.stdout.seek(0)
+    sys.stdout.truncate()
+    started = time.perf_counter()
+    result = run_backtest(bot_code, _candles, symbol, capital_allocation, inputs, *fees)
+    return {
+        "index": index,
+        "inputs": inputs,
+        "error": result["error"],
+        "stats": result["stats"],
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _score(result: dict, rank_by: str):
+    value = result["stats"].get(rank_by)
+    if result["error"] is not None or value is None:
+        return float("-inf")
+    # Lower is better for drawdown; everything else is ranked highest first.
+    return -value if rank_by == "max_drawdown" else value
+
+
+def run_sweep(bot_code: str, candles: dict, symbol: str, capital_allocation: float, base_inputs: dict, points: list[dict],
+              fees: tuple, rank_by: str = "total_return", workers: int = None, top: int = 10, timeout: float = None):
+    """Backtests every point in parallel and yields each result as it finishes, then a final ranking."""
+    workers = max(1, min(workers or settings.sweep_workers or os.cpu_count() or 1, len(points) or 1))
+    timeout = settings.sweep_timeout_seconds if timeout is None else timeout
+    path = write_candles(candles, settings.sweep_scratch_dir)
+    tasks = [(index, bot_code, symbol, capital_allocation, {**base_inputs, **point}, fees) for index, point in enumerate(points)]
+    pool = multiprocessing.get_context().Pool(workers, initializer=_init_worker, initargs=(path,))
+    scores = []  # ascending, for the rank of each new result
+    finished = []
+    deadline = time.monotonic() + timeout
+    try:
+        results = pool.imap_unordered(_run_one, tasks)
+        for _ in tasks:
+            try:
+                result = results.next(timeout=max(0.0, deadline - time.monotonic()))
+            except multiprocessing.TimeoutError:
+                yield {"type": "timeout", "completed": len(finished), "total": len(tasks)}
+                break
+            score = _score(result, rank_by)
+            bisect.insort(scores, score)
+            finished.append(result)
+            rank = len(scores) - bisect.bisect_right(scores, score) + 1
+            yield {"type": "result", "rank": rank, "completed": len(finished), "total": len(tasks), **result}
+        finished.sort(key=lambda result: _score(result, rank_by), reverse=True)
+        yield {"type": "done", "rank_by": rank_by, "completed": len(finished), "total": len(tasks), "top": finished[:top]}
+    finally:
+        pool.terminate()
+        pool.join()
+        os.unlink(path)
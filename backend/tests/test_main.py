@@ -3,11 +3,12 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from backend.app import create_app
 from backend.database import Base, get_db
 from backend.hyperliquid_api import HyperliquidAPI
+from backend.async_hyperliquid_api import AsyncHyperliquidAPI
 from backend.bot_runner import BotRunner
 
 # Use an in-memory SQLite database for testing
@@ -37,6 +38,26 @@ def client():
     Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def scratch_paths(tmp_path_factory, monkeypatch):
+    # Caches, stores and locks that would otherwise be written to the working tree.
+    import threading
+    from backend.bot_code_cache import bot_code_cache
+    from backend.candle_store import candle_store
+    from backend.config import settings
+
+    scratch = tmp_path_factory.mktemp("scratch")
+    monkeypatch.setattr(settings, "market_cache_path", str(scratch / "market_cache.sqlite3"))
+    monkeypatch.setattr(settings, "candle_store_path", str(scratch / "candles.sqlite3"))
+    monkeypatch.setattr(settings, "order_gateway_bucket_path", str(scratch / "order_gateway.sqlite3"))
+    monkeypatch.setattr(settings, "fill_ingest_lock_path", str(scratch / "fill_ingest.lock"))
+    monkeypatch.setattr(settings, "bot_code_cache_dir", str(scratch / "bot_code_cache"))
+    # The module-level instances were built from the settings at import.
+    monkeypatch.setattr(bot_code_cache, "directory", settings.bot_code_cache_dir)
+    monkeypatch.setattr(candle_store, "path", settings.candle_store_path)
+    monkeypatch.setattr(candle_store, "_local", threading.local())
+
+
 def test_create_user(client: TestClient):
     response = client.post(
         "/users/",
@@ -116,10 +137,34 @@ def test_create_and_read_bot(client: TestClient):
     assert len(read_data) == 1
     assert read_data[0]["name"] == "test_bot"
 
+def test_bot_code_is_compiled_on_save_and_cached(client: TestClient, tmp_path, monkeypatch):
+    from backend.bot_code_cache import BotCodeCache, is_async_bot
+
+    cache = BotCodeCache(str(tmp_path / "code"), max_entries=1)
+    monkeypatch.setattr("backend.crud.bot_code_cache", cache)
+    auth_client = authenticated_client(client)
+
+    response = auth_client.post("/bots/", json={"name": "broken", "code": "x = 1\nif x\n", "input_schema": {}})
+    assert response.status_code == 400
+    assert "line 2" in response.json()["detail"]
+    assert auth_client.get("/bots/").json() == []
+
+    source = "async def main():\n    pass\n"
+    assert auth_client.post("/bots/", json={"name": "ok", "code": source, "input_schema": {}}).status_code == 200
+    assert len(list((tmp_path / "code").iterdir())) == 1
+    assert is_async_bot(cache.load(source)) and cache.hits == 1
+    # A fresh process finds the marshalled code on disk instead of recompiling.
+    fresh = BotCodeCache(str(tmp_path / "code"), max_entries=1)
+    with patch("backend.bot_code_cache.compile_bot") as compile_bot:
+        assert is_async_bot(fresh.load(source))
+    compile_bot.assert_not_called()
+    assert not is_async_bot(fresh.load("def main():\n    pass\nmain()\n"))
+
 def test_place_order(client: TestClient):
-    with patch("backend.routers.trades.HyperliquidAPI") as mock_hl_api_class:
+    with patch("backend.routers.trades.AsyncHyperliquidAPI", autospec=True) as mock_hl_api_class:
         auth_client = authenticated_client(client)
         mock_hl_api_instance = mock_hl_api_class.return_value
+        mock_hl_api_instance.place_order.return_value = {"status": "ok"}
         wallet_response = auth_client.post(
             "/wallets/",
             json={"name": "trading_wallet", "address": "trading_address", "private_key": "0x4929aa0dad4277f6a1a0a7f940d2ace1a503a5fcc90ac9d092c9c9a5939331cf"},
@@ -165,9 +210,1388 @@ def test_run_bot(mock_start_bot, client: TestClient):
     assert run_response.status_code == 200, run_response.text
     mock_start_bot.assert_called_once()
 
-@patch.object(HyperliquidAPI, "get_vault_meta", return_value=[{"name": "Test Vault"}])
+@patch.object(AsyncHyperliquidAPI, "get_vault_meta", new_callable=AsyncMock, return_value=[{"name": "Test Vault"}])
 def test_get_vault_meta(mock_get_vault_meta, client: TestClient):
     auth_client = authenticated_client(client)
     response = auth_client.get("/vaults/meta")
     assert response.status_code == 200
     assert response.json() == [{"name": "Test Vault"}]
+
+def test_market_cache_ttl_and_lru_eviction():
+    from backend.market_cache import MarketDataCache, MemoryBackend
+
+    cache = MarketDataCache(MemoryBackend(max_entries=2))
+    calls = []
+
+    def fetch(value):
+        calls.append(value)
+        return value
+
+    assert cache.get_or_fetch("a", 60, lambda: fetch(1)) == 1
+    assert cache.get_or_fetch("a", 60, lambda: fetch(2)) == 1
+    cache.get_or_fetch("b", 60, lambda: fetch(3))
+    cache.get_or_fetch("c", 60, lambda: fetch(4))
+    assert cache.get_or_fetch("a", 60, lambda: fetch(5)) == 5
+    cache.get_or_fetch("expired", 0, lambda: fetch(6))
+    assert cache.get_or_fetch("expired", 0, lambda: fetch(7)) == 7
+
+    stats = cache.stats()
+    assert calls == [1, 3, 4, 5, 6, 7]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 6
+    assert stats["evictions"] >= 2
+
+def test_market_cache_sqlite_backend_is_shared(tmp_path):
+    from backend.market_cache import MarketDataCache, SQLiteBackend
+
+    path = str(tmp_path / "cache.sqlite3")
+    first = MarketDataCache(SQLiteBackend(path, max_entries=10))
+    second = MarketDataCache(SQLiteBackend(path, max_entries=10))
+    first.get_or_fetch("mids", 60, lambda: {"BTC": "50000"})
+    assert second.get_or_fetch("mids", 60, lambda: {"BTC": "0"}) == {"BTC": "50000"}
+    assert second.stats()["hits"] == 1
+
+TEST_PRIVATE_KEY = "0x4929aa0dad4277f6a1a0a7f940d2ace1a503a5fcc90ac9d092c9c9a5939331cf"
+AGENT_PRIVATE_KEY = "0x" + "11" * 32
+
+@patch("backend.client_registry.Exchange")
+@patch("backend.client_registry.Info")
+def test_client_registry_reuses_and_invalidates_exchange(mock_info_class, mock_exchange_class):
+    from eth_account import Account
+    from backend.client_registry import ClientRegistry
+
+    registry = ClientRegistry(idle_timeout=60, meta_refresh=3600)
+    first = registry.get_exchange(TEST_PRIVATE_KEY, "https://api.example")
+    assert registry.get_exchange(TEST_PRIVATE_KEY, "https://api.example") is first
+    assert registry.get_info("https://api.example") is registry.get_info("https://api.example")
+    assert mock_info_class.call_count == 1
+    assert mock_exchange_class.call_count == 1
+
+    # An agent key signs for another address than the one the wallet is stored under.
+    registry.get_exchange(AGENT_PRIVATE_KEY, "https://api.example")
+    registry.invalidate(TEST_PRIVATE_KEY)
+    assert len(registry) == 1 and registry._signers.keys() == {registry._fingerprint(AGENT_PRIVATE_KEY)}
+    registry.invalidate(AGENT_PRIVATE_KEY)
+    assert len(registry) == 0
+    registry.get_exchange(TEST_PRIVATE_KEY, "https://api.example")
+    assert mock_exchange_class.call_count == 3
+
+    import asyncio
+
+    async def use_client():
+        client = registry.get_async_client("https://api.example")
+        assert registry.get_async_client("https://api.example") is client
+        return client
+
+    # Each loop gets its own pool, closed as the loop shuts down.
+    first_pool, second_pool = asyncio.run(use_client()), asyncio.run(use_client())
+    assert first_pool is not second_pool and first_pool.is_closed and second_pool.is_closed
+    assert len(registry._async_clients) == 1
+
+def test_delete_wallet(client: TestClient):
+    auth_client = authenticated_client(client)
+    wallet_id = auth_client.post(
+        "/wallets/",
+        json={"name": "old_wallet", "address": "old_address", "private_key": "test_key"},
+    ).json()["id"]
+    assert auth_client.delete(f"/wallets/{wallet_id}").status_code == 200
+    assert auth_client.get("/wallets/").json() == []
+    assert auth_client.delete(f"/wallets/{wallet_id}").status_code == 404
+
+    # Stored under the account's address, signed for by an agent key with an address of its own.
+    from backend.client_registry import client_registry
+
+    wallet_id = auth_client.post(
+        "/wallets/",
+        json={"name": "agent_wallet", "address": "0xaccount", "private_key": AGENT_PRIVATE_KEY},
+    ).json()["id"]
+    client_registry.get_signer(AGENT_PRIVATE_KEY)
+    assert auth_client.delete(f"/wallets/{wallet_id}").status_code == 200
+    assert client_registry._fingerprint(AGENT_PRIVATE_KEY) not in client_registry._signers
+
+def test_bot_modify_order_calls_the_sdk_with_its_real_signature():
+    from unittest.mock import create_autospec
+    from hyperliquid.exchange import Exchange
+    from backend.bot_runner import BotTradingAPI, CapitalManager
+
+    trading_api = BotTradingAPI.__new__(BotTradingAPI)
+    trading_api.address = None
+    trading_api.capital_manager = CapitalManager(1000)
+    trading_api.api = HyperliquidAPI.__new__(HyperliquidAPI)
+    # Autospec binds every call against Exchange.modify_order's own parameters.
+    trading_api.api.exchange = exchange = create_autospec(Exchange, instance=True)
+    exchange.wallet = MagicMock(address="0xabc")
+    trading_api.api.query_order_status = MagicMock(return_value={"status": "order", "order": {"order": {"side": "A"}}})
+
+    trading_api.modify_order("BTC", 7, 1.0, 101.0, {"limit": {"tif": "Gtc"}})
+    trading_api.modify_order("BTC", 8, 2.0, 99.0, {"limit": {"tif": "Gtc"}}, is_buy=True)
+    first, second = exchange.modify_order.call_args_list
+    assert first.kwargs == {"oid": 7, "name": "BTC", "is_buy": False, "sz": 1.0, "limit_px": 101.0, "order_type": {"limit": {"tif": "Gtc"}}}
+    assert second.kwargs["is_buy"] is True and second.kwargs["oid"] == 8
+    trading_api.api.query_order_status.assert_called_once_with("0xabc", 7)
+
+
+def test_async_api_signs_and_posts_order():
+    import asyncio
+    import json
+    import httpx
+    from backend.client_registry import client_registry
+    from backend.market_cache import market_cache
+
+    posted = []
+
+    def handler(request: httpx.Request):
+        payload = json.loads(request.content)
+        posted.append((request.url.path, payload))
+        if payload.get("type") == "meta":
+            return httpx.Response(200, json={"universe": [{"name": "BTC", "szDecimals": 5}, {"name": "ETH", "szDecimals": 4}]})
+        if payload.get("type") == "spotMeta":
+            return httpx.Response(200, json={"universe": [], "tokens": []})
+        return httpx.Response(200, json={"status": "ok"})
+
+    async def scenario():
+        transport_client = httpx.AsyncClient(base_url="https://api.example", transport=httpx.MockTransport(handler))
+        with patch.object(client_registry, "get_async_client", return_value=transport_client):
+            api = AsyncHyperliquidAPI(private_key=TEST_PRIVATE_KEY)
+            return await api.place_order("ETH", True, 1.0, 2000.0, {"limit": {"tif": "Gtc"}})
+
+    market_cache.clear()
+    assert asyncio.run(scenario()) == {"status": "ok"}
+    path, body = posted[-1]
+    assert path == "/exchange"
+    assert body["action"]["orders"][0]["a"] == 1
+    assert set(body["signature"]) == {"r", "s", "v"}
+
+def test_consolidated_state_reports_per_address_errors(client: TestClient):
+    import asyncio
+
+    async def sub_accounts(self, user_address):
+        return [{"subAccountUser": "sub_ok"}, {"subAccountUser": "sub_slow"}]
+
+    async def user_state(self, user_address):
+        if user_address == "sub_slow":
+            await asyncio.sleep(1)
+        return {"assetPositions": [{"coin": "BTC"}], "marginSummary": {"accountValue": "10"}}
+
+    async def open_orders(self, user_address):
+        return [{"oid": user_address}]
+
+    auth_client = authenticated_client(client)
+    with patch.object(AsyncHyperliquidAPI, "get_sub_accounts", sub_accounts), \
+            patch.object(AsyncHyperliquidAPI, "get_user_state", user_state), \
+            patch.object(AsyncHyperliquidAPI, "get_open_orders", open_orders), \
+            patch("backend.routers.wallets.settings.upstream_call_timeout_seconds", 0.2):
+        response = auth_client.get("/wallets/master/consolidated-state")
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["total_account_value"] == 20
+    assert len(data["positions"]) == 2
+    assert list(data["errors"]) == ["sub_slow"]
+
+def test_address_state_shares_user_state_call(client: TestClient):
+    import json
+    import httpx
+    from backend.client_registry import client_registry
+
+    payload_types = []
+
+    def handler(request: httpx.Request):
+        payload = json.loads(request.content)
+        payload_types.append(payload["type"])
+        if payload["type"] == "clearinghouseState":
+            return httpx.Response(200, json={"assetPositions": [{"coin": "BTC"}], "spotAssetPositions": []})
+        return httpx.Response(200, json=[])
+
+    auth_client = authenticated_client(client)
+    with patch.object(
+        client_registry,
+        "get_async_client",
+        side_effect=lambda base_url: httpx.AsyncClient(base_url=base_url, transport=httpx.MockTransport(handler)),
+    ):
+        response = auth_client.get("/wallets/state/0xabc")
+
+    assert response.status_code == 200, response.text
+    assert response.json()["positions"] == [{"coin": "BTC"}]
+    assert sorted(payload_types) == ["clearinghouseState", "frontendOpenOrders"]
+    assert response.headers["X-Upstream-Calls"] == "2"
+    assert response.headers["X-Upstream-Calls-Shared"] == "1"
+
+def test_subscription_hub_shares_and_releases_upstream():
+    import asyncio
+    import json
+    import websockets
+    from backend.ws_hub import SubscriptionHub
+
+    async def scenario():
+        received = []
+        connections = []
+
+        async def upstream(ws):
+            connections.append(ws)
+            index = len(connections)
+            async for raw in ws:
+                message = json.loads(raw)
+                received.append((index, message["method"], message["subscription"]["type"]))
+                if message["method"] == "subscribe" and message["subscription"]["type"] == "userFills":
+                    await ws.send(json.dumps({"channel": "userFills", "data": {"user": "0xaaa", "fills": []}}))
+
+        async with websockets.serve(upstream, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            hub = SubscriptionHub(ws_url=f"ws://127.0.0.1:{port}", max_queue=2)
+            first = await hub.subscribe({"type": "userFills", "user": "0xAAA"})
+            second = await hub.subscribe({"type": "userFills", "user": "0xaaa"})
+            message = await asyncio.wait_for(first.get(), 5)
+            assert message["channel"] == "userFills"
+            assert (await asyncio.wait_for(second.get(), 5)) == message
+
+            events_a = await hub.subscribe({"type": "userEvents", "user": "0xaaa"})
+            events_b = await hub.subscribe({"type": "userEvents", "user": "0xbbb"})
+            assert hub.stats()["upstream_connections"] == 2
+            await asyncio.sleep(0.3)
+
+            for _ in range(3):
+                first.push({"n": 1})
+            assert first.dropped == 1
+
+            await hub.unsubscribe(first)
+            await hub.unsubscribe(second)
+            await hub.unsubscribe(events_a)
+            await hub.unsubscribe(events_b)
+            await asyncio.sleep(0.2)
+            assert hub.stats()["upstream_connections"] == 0
+        return received
+
+    received = asyncio.run(scenario())
+    assert received.count((1, "subscribe", "userFills")) == 1
+    assert (1, "unsubscribe", "userFills") in received
+    assert sum(1 for _, method, kind in received if method == "subscribe" and kind == "userEvents") == 2
+
+def test_fill_feed_delivers_live_and_missed_fills_once():
+    import asyncio
+    import queue
+    import time
+    from backend.fill_feed import FillFeed
+
+    class FakeHub:
+        def __init__(self):
+            self.subscriber = None
+            self.unsubscribed = asyncio.Event()
+
+        async def subscribe(self, subscription):
+            self.subscriber = asyncio.Queue()
+            self.subscription = subscription
+            return self.subscriber
+
+        async def unsubscribe(self, subscriber):
+            self.unsubscribed.set()
+
+    hub = FakeHub()
+    feed = FillFeed(linger=0)
+    now = int(time.time() * 1000)
+    fill = lambda tid, ts: {"tid": tid, "time": ts, "coin": "BTC", "side": "B", "sz": "1", "px": "10"}
+
+    with patch("backend.fill_feed.get_hub", return_value=hub):
+        fill_queue = feed.attach(7, "0xABC")
+        assert hub.subscription == {"type": "userFills", "user": "0xabc"}
+        for message in (
+            {"isSnapshot": True, "fills": [fill(1, now - 60_000)]},
+            {"fills": [fill(2, now + 10_000)]},
+            {"fills": [fill(2, now + 10_000)]},
+            {"isSnapshot": True, "fills": [fill(1, now - 60_000), fill(2, now + 10_000), fill(3, now + 20_000)]},
+        ):
+            feed._loop.call_soon_threadsafe(hub.subscriber.put_nowait, {"channel": "userFills", "data": message})
+
+        delivered = [fill_queue.get(timeout=5)["tid"] for _ in range(2)]
+        assert delivered == [2, 3]
+        with pytest.raises(queue.Empty):
+            fill_queue.get(timeout=0.2)
+
+        # A fill made while the subscription lingers reaches the bot that reattaches.
+        feed.linger = 5
+        feed.detach(7)
+        feed._loop.call_soon_threadsafe(hub.subscriber.put_nowait, {"channel": "userFills", "data": {"fills": [fill(4, now + 30_000)]}})
+        time.sleep(0.1)
+        fill_queue = feed.attach(8, "0xabc")
+        assert fill_queue.get(timeout=5)["tid"] == 4
+
+        feed.linger = 0
+        feed.detach(8)
+        asyncio.run_coroutine_threadsafe(asyncio.wait_for(hub.unsubscribed.wait(), 5), feed._loop).result()
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_bot_dashboard_batches_logs_and_resumes(client: TestClient, tmp_path, monkeypatch, use_inotify):
+    import threading
+    from backend.config import settings
+    from backend.status_segment import StatusWriter, segment_path
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "bot_tail_use_inotify", use_inotify)
+    (tmp_path / "bot_logs").mkdir()
+    log = tmp_path / "bot_logs" / "bot_1.log"
+    log.write_text("a\nb\n")
+    status = StatusWriter(segment_path(1))
+    status.publish(100.0, {})
+
+    with client.websocket_connect("/ws/bots/1/dashboard") as websocket:
+        frame = websocket.receive_json()
+        assert frame["type"] == "status" and frame["data"]["available_capital"] == 100.0
+        assert websocket.receive_json() == {"type": "logs", "start": 0, "offset": 4, "data": ["a", "b"]}
+        with log.open("a") as f:
+            f.write("c\nd\n")
+        assert websocket.receive_json() == {"type": "logs", "start": 4, "offset": 8, "data": ["c", "d"]}
+        # A heartbeat with an unchanged status is not sent.
+        status.publish(100.0, {})
+        with log.open("a") as f:
+            f.write("e\n")
+        assert websocket.receive_json()["data"] == ["e"]
+        status.publish(90.0, {"BTC": 0.5})
+        frame = websocket.receive_json()
+        assert frame["type"] == "status"
+        assert frame["data"]["available_capital"] == 90.0 and frame["data"]["positions"] == {"BTC": 0.5}
+
+        # Another bot logging faster than the status is polled does not hold this one's status back.
+        stop = threading.Event()
+
+        def chatter():
+            with (tmp_path / "bot_logs" / "bot_2.log").open("a") as f:
+                while not stop.wait(settings.bot_status_poll_seconds / 10):
+                    f.write("x\n")
+                    f.flush()
+
+        chatty = threading.Thread(target=chatter)
+        chatty.start()
+        try:
+            status.publish(80.0, {})
+            frame = websocket.receive_json()
+            assert frame["type"] == "status" and frame["data"]["available_capital"] == 80.0
+        finally:
+            stop.set()
+            chatty.join()
+
+    with log.open("a") as f:
+        f.write("f\n")
+    with client.websocket_connect("/ws/bots/1/dashboard?offset=10") as websocket:
+        assert websocket.receive_json()["type"] == "status"
+        assert websocket.receive_json() == {"type": "logs", "start": 10, "offset": 12, "data": ["f"]}
+    status.close()
+
+def test_status_segment_reads_are_never_torn(tmp_path):
+    import struct
+    from backend.status_segment import StatusReader, StatusWriter
+
+    path = str(tmp_path / "bot_1.status")
+    writer = StatusWriter(path)
+    reader = StatusReader(path)
+    writer.publish(250.0, {"ETH": -2.0, "BTC": 0.1})
+    status = reader.read()
+    assert status["available_capital"] == 250.0
+    assert status["positions"] == {"ETH": -2.0, "BTC": 0.1}
+    assert not status["stale"]
+
+    # A writer caught mid-update leaves an odd sequence number, which readers wait out.
+    seq = reader.sequence()
+    struct.pack_into("<Q", writer._mm, 0, seq + 1)
+    assert reader.read(retries=10) is None
+    struct.pack_into("<Q", writer._mm, 0, seq)
+
+    # A restarted bot reuses the segment, so an existing reader sees its updates.
+    writer.close()
+    restarted = StatusWriter(path)
+    restarted.publish(80.0, {})
+    assert reader.sequence() > seq
+    assert reader.read()["positions"] == {}
+    reader.close()
+    restarted.close()
+
+def test_worker_pool_reuses_and_recycles_warm_workers(tmp_path, monkeypatch):
+    import threading
+    from backend.worker_pool import WorkerPool
+
+    monkeypatch.chdir(tmp_path)
+
+    def fake_post(self, url_path, payload=None):
+        if payload.get("type") == "spotMeta":
+            return {"universe": [], "tokens": []}
+        return {"universe": [{"name": "BTC", "szDecimals": 5}]}
+
+    finished = []
+    done = threading.Semaphore(0)
+
+    def on_done(bot_id, process):
+        finished.append((bot_id, process.pid))
+        done.release()
+
+    # Workers are forked, so they inherit the stubbed transport.
+    with patch("hyperliquid.api.API.post", fake_post):
+        pool = WorkerPool(size=1, recycle_after=2, on_done=on_done)
+        try:
+            pids = []
+            for bot_id in (1, 2, 3):
+                worker = pool.acquire()
+                pids.append(worker.pid)
+                code = f"from backend.client_registry import client_registry\nprint('bot {bot_id}', len(client_registry._metas))"
+                worker.assign(bot_id, (bot_id, code, {}, TEST_PRIVATE_KEY, 100.0))
+                assert done.acquire(timeout=20)
+        finally:
+            pool.shutdown()
+
+    assert [bot_id for bot_id, _ in finished] == [1, 2, 3]
+    # One worker went back to the pool after its first bot and ran another.
+    assert len(set(pids)) == 2
+    # Exchange metadata was fetched during warm-up, before any bot ran.
+    assert (tmp_path / "bot_logs" / "bot_2.log").read_text() == "bot 2 1\n"
+
+def test_shared_workers_run_isolated_bots_on_one_process(tmp_path, monkeypatch):
+    import threading
+    import time
+    from eth_account import Account
+    from backend.config import settings
+    from backend.shared_workers import SharedWorkerGroup
+    from backend.status_segment import read_status
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "shared_worker_report_seconds", 0)
+    address = Account.from_key(TEST_PRIVATE_KEY).address
+
+    finished = []
+    done = threading.Semaphore(0)
+
+    def on_done(bot_id, handle):
+        finished.append(bot_id)
+        done.release()
+
+    async_bot = (
+        "import asyncio\n"
+        "marker = 'async'\n"
+        "async def main():\n"
+        "    print('waiting for fill')\n"
+        "    while not trading_api.capital_manager.positions:\n"
+        "        await asyncio.sleep(0.01)\n"
+        "    print('filled', trading_api.capital_manager.positions)\n"
+    )
+    sync_bot = "print('sync bot ran')\n"
+    ticking_bot = (
+        "import asyncio\n"
+        "async def main():\n"
+        "    while True:\n"
+        "        print('tick')\n"
+        "        await asyncio.sleep(0.01)\n"
+    )
+
+    def fake_post(self, url_path, payload=None):
+        if payload.get("type") == "spotMeta":
+            return {"universe": [], "tokens": []}
+        return {"universe": [{"name": "BTC", "szDecimals": 5}]}
+
+    # The worker is forked on the first bot, so it inherits the stubbed transport.
+    with patch("hyperliquid.api.API.post", fake_post):
+        group = SharedWorkerGroup(size=1, on_done=on_done)
+        first = group.acquire(1)
+    try:
+        group.launch(first, async_bot, {}, TEST_PRIVATE_KEY, 100.0, address)
+        second = group.acquire(2)
+        group.launch(second, sync_bot, {}, TEST_PRIVATE_KEY, 50.0, address)
+        assert first.pid == second.pid
+        assert done.acquire(timeout=20)
+        assert finished == [2]
+
+        third = group.acquire(3)
+        group.launch(third, ticking_bot, {}, TEST_PRIVATE_KEY, 10.0, address)
+        log = tmp_path / "bot_logs" / "bot_3.log"
+        deadline = time.monotonic() + 10
+        while (not log.exists() or "tick" not in log.read_text()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        third.terminate()
+        assert done.acquire(timeout=20)
+        assert finished == [2, 3]
+        stopped_at = log.read_text()
+        time.sleep(0.3)
+        # Nothing of a stopped bot keeps running in the worker.
+        assert log.read_text() == stopped_at
+
+        first.worker.fill_queue.put({"coin": "BTC", "side": "B", "sz": "1", "px": "10", "user": address.lower()})
+        assert done.acquire(timeout=20)
+        assert finished == [2, 3, 1]
+        deadline = time.monotonic() + 5
+        while "rss_bytes" not in group.stats()[0] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        stats = group.stats()
+    finally:
+        group.shutdown()
+
+    assert (tmp_path / "bot_logs" / "bot_1.log").read_text() == "waiting for fill\nfilled {'BTC': 1.0}\n"
+    # Blocking bots are refused, since stopping one would mean stopping the worker.
+    assert "shared mode needs an `async def main()`" in (tmp_path / "bot_logs" / "bot_2.log").read_text()
+    assert read_status(1)["available_capital"] == 90.0
+    assert read_status(2)["available_capital"] == 50.0
+    assert stats[0]["pid"] == first.pid and "rss_bytes" in stats[0] and "loop_lag_ms" in stats[0]
+
+def test_bot_monitor_samples_and_stops_bot_over_hard_limit(client: TestClient, monkeypatch):
+    import subprocess
+    import sys
+    import time
+    from backend.bot_metrics import BotMonitor
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "bot_metrics_samples", 3)
+    monkeypatch.setattr(settings, "bot_cpu_hard_limit_percent", 50)
+    monkeypatch.setattr(settings, "bot_limit_grace_samples", 2)
+    monitor = BotMonitor(interval=0)
+    stopped = []
+    monitor.on_hard_limit = lambda bot_id, reason: stopped.append((bot_id, reason))
+    monkeypatch.setattr("backend.routers.bots.bot_monitor", monitor)
+
+    auth_client = authenticated_client(client)
+    bot_id = auth_client.post("/bots/", json={"name": "b", "code": "print(1)", "input_schema": {}}).json()["id"]
+    spinner = subprocess.Popen([sys.executable, "-c", "while True: pass"])
+    try:
+        monitor.track(bot_id, spinner.pid)
+        for _ in range(4):
+            monitor.sample()
+            time.sleep(0.2)
+    finally:
+        spinner.kill()
+        spinner.wait()
+
+    # The first sample has no CPU rate yet; the next two over the limit stop the bot.
+    assert stopped and stopped[0][0] == bot_id and "cpu" in stopped[0][1]
+    response = auth_client.get(f"/bots/{bot_id}/metrics")
+    assert response.status_code == 200, response.text
+    metrics = response.json()
+    assert len(metrics["samples"]) == 3
+    assert metrics["samples"][-1]["cpu_percent"] > 50
+    assert metrics["samples"][-1]["rss_bytes"] > 0 and metrics["samples"][-1]["threads"] >= 1
+    assert metrics["stopped_reason"].startswith("hard limit exceeded")
+    assert auth_client.get(f"/bots/{bot_id + 1}/metrics").status_code == 404
+
+    # Another user sees neither the metrics nor the status of this bot.
+    client.post("/users/", json={"username": "other", "password": "password"})
+    token = client.post("/users/token", json={"username": "other", "password": "password"}).json()["access_token"]
+    client.headers = {"Authorization": f"Bearer {token}"}
+    assert client.get(f"/bots/{bot_id}/metrics").status_code == 404
+    assert client.get(f"/bots/{bot_id}/status").json()["detail"] == "Bot not found"
+
+BACKTEST_BOT = """
+def on_candle(candle):
+    positions = trading_api.get_positions(None)
+    if not positions and candle["c"] < 100:
+        trading_api.place_order("BTC", True, 1.0, 99.0, {"limit": {"tif": "Gtc"}})
+    elif positions and candle["c"] > 105:
+        trading_api.place_order("BTC", False, 1.0, 0.0, {"limit": {"tif": "Ioc"}})
+        print("exit at", candle["c"])
+"""
+
+def test_backtest_fills_limit_and_taker_orders_with_fees():
+    import numpy as np
+    from backend.backtest import run_backtest
+
+    close = [101.0, 99.5, 98.0, 103.0, 106.0, 107.0]
+    candles = {
+        "t": np.arange(6) * 60_000.0,
+        "o": np.array([101.0, 101.0, 99.0, 98.0, 103.0, 108.0]),
+        "h": np.array(close) + 1,
+        "l": np.array([100.0, 99.2, 97.0, 97.5, 102.0, 106.0]),
+        "c": np.array(close),
+        "v": np.ones(6),
+    }
+    result = run_backtest(BACKTEST_BOT, candles, "BTC", 1000.0, {}, taker_fee_bps=10, maker_fee_bps=0, slippage_bps=0)
+
+    assert result["error"] is None
+    # Bought at 99 when bar 2 traded down through the resting limit; sold at bar 5's open.
+    assert [(fill["bar"], fill["sz"], fill["px"]) for fill in result["fills"]] == [(2, 1.0, 99.0), (5, -1.0, 108.0)]
+    stats = result["stats"]
+    assert stats["fees"] == pytest.approx(0.108)
+    assert stats["final_equity"] == pytest.approx(1000 - 99 + 108 - 0.108)
+    assert stats["closing_trades"] == 1 and stats["win_rate"] == 1.0
+    assert stats["max_drawdown"] == pytest.approx(1 / 1000)
+    assert result["equity_curve"][-1] == [300000, pytest.approx(stats["final_equity"])]
+
+    # A resting order moved up by a modify fills at its new limit.
+    modifying = """
+def on_candle(candle):
+    if candle["t"] == 0:
+        trading_api.place_order("BTC", True, 1.0, 90.0, {"limit": {"tif": "Gtc"}})
+    elif candle["t"] == 60000:
+        oid = trading_api.get_open_orders(None)[0]["oid"]
+        print(trading_api.modify_orders([{"oid": oid, "symbol": "BTC", "sz": 1.0, "limit_px": 99.0, "order_type": {"limit": {"tif": "Gtc"}}},
+                                         {"oid": 42, "symbol": "BTC", "sz": 1.0, "limit_px": 99.0, "order_type": {"limit": {"tif": "Gtc"}}}]))
+"""
+    result = run_backtest(modifying, candles, "BTC", 1000.0, {}, taker_fee_bps=10, maker_fee_bps=0, slippage_bps=0)
+    assert result["error"] is None
+    assert [(fill["bar"], fill["px"]) for fill in result["fills"]] == [(2, 99.0)]
+
+    # A marketable buy whose next bar gaps above the limit rests there, and fills only once a bar trades at it.
+    gapping = {
+        "t": np.arange(3) * 60_000.0,
+        "o": np.array([100.0, 105.0, 104.0]),
+        "h": np.array([101.5, 106.0, 104.5]),
+        "l": np.array([100.0, 104.0, 101.5]),
+        "c": np.array([101.0, 105.0, 102.0]),
+        "v": np.ones(3),
+    }
+    crossing = """
+def on_candle(candle):
+    if candle["t"] == 0:
+        trading_api.place_order("BTC", True, 1.0, 102.0, {"limit": {"tif": runtime_inputs["tif"]}})
+"""
+    result = run_backtest(crossing, gapping, "BTC", 1000.0, {"tif": "Gtc"}, taker_fee_bps=10, maker_fee_bps=0, slippage_bps=0)
+    assert [(fill["bar"], fill["px"], fill["fee"]) for fill in result["fills"]] == [(2, 102.0, 0.0)]
+    result = run_backtest(crossing, gapping, "BTC", 1000.0, {"tif": "Ioc"}, taker_fee_bps=10, maker_fee_bps=0, slippage_bps=0)
+    assert result["error"] is None and result["fills"] == []
+
+    result = run_backtest("def on_candle(candle):\n    trading_api.estimate_impact('BTC', True, sizes=[1])\n", candles, "BTC", 1000.0, {}, 10, 0, 0)
+    assert result["error"].startswith("Exception: This bot uses trading_api.estimate_impact") and result["stats"]["bars"] == 0
+
+def test_backtest_endpoint_runs_bot_in_subprocess(client: TestClient, monkeypatch):
+    from backend.backtest import candles_to_arrays
+
+    auth_client = authenticated_client(client)
+    bot_id = auth_client.post("/bots/", json={"name": "bt", "code": BACKTEST_BOT, "input_schema": {}}).json()["id"]
+    rows = [{"t": i * 60_000, "o": p, "h": p + 1, "l": p - 1, "c": p, "v": 1} for i, p in enumerate([100.5, 98.0, 98.0, 106.0, 106.0])]
+    monkeypatch.setattr("backend.routers.bots.fetch_candles", lambda *args: candles_to_arrays(rows))
+
+    response = auth_client.post(
+        f"/bots/{bot_id}/backtest",
+        json={"symbol": "BTC", "start_time": 0, "end_time": 300_000, "capital_allocation": 500.0},
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["error"] is None
+    assert result["stats"]["fills"] == 2
+    assert result["logs"] == ["exit at 106.0"]
+
+def test_sweep_streams_ranked_results_from_shared_candles(client: TestClient, monkeypatch, tmp_path):
+    import json
+    from backend.backtest import candles_to_arrays
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "sweep_scratch_dir", str(tmp_path))
+    code = BACKTEST_BOT.replace("candle[\"c\"] > 105", "candle[\"c\"] > runtime_inputs[\"exit\"]")
+    auth_client = authenticated_client(client)
+    bot_id = auth_client.post("/bots/", json={"name": "sweep", "code": code, "input_schema": {"exit": "float"}}).json()["id"]
+    prices = [100.5, 98.0, 98.0, 102.0, 104.0, 106.0, 110.0, 112.0]
+    rows = [{"t": i * 60_000, "o": p, "h": p + 1, "l": p - 1, "c": p, "v": 1} for i, p in enumerate(prices)]
+    monkeypatch.setattr("backend.routers.bots.fetch_candles", lambda *args: candles_to_arrays(rows))
+    request = {"symbol": "BTC", "start_time": 0, "end_time": 480_000, "capital_allocation": 500.0, "workers": 2}
+
+    response = auth_client.post(f"/bots/{bot_id}/sweep", json={**request, "grid": {"exit": [101, 103, 105, 109]}})
+    assert response.status_code == 200, response.text
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["result"] * 4 + ["done"]
+    assert sorted(line["inputs"]["exit"] for line in lines[:4]) == [101, 103, 105, 109]
+    # Holding on until 109 sells at the final 112 open, the best exit in this history.
+    top = lines[-1]["top"]
+    assert top[0]["inputs"]["exit"] == 109 and top[0]["stats"]["total_return"] > top[-1]["stats"]["total_return"]
+    assert list(tmp_path.iterdir()) == []
+
+    response = auth_client.post(f"/bots/{bot_id}/sweep", json={**request, "ranges": {"entry": {"min": 1, "max": 2}}})
+    assert response.status_code == 400
+
+def test_candle_store_fetches_only_missing_ranges(client: TestClient, tmp_path, monkeypatch):
+    import asyncio
+    import time
+    from backend.candle_store import CandleStore
+
+    store = CandleStore(str(tmp_path / "candles.sqlite3"), page_size=100, concurrency=3)
+    monkeypatch.setattr("backend.routers.market.candle_store", store)
+    requested = []
+    on_loop = []
+    missing_chunks = store.missing_chunks
+
+    def off_loop(*args):
+        # Its SQLite query would otherwise block the event loop.
+        try:
+            on_loop.append(asyncio.get_running_loop())
+        except RuntimeError:
+            pass
+        return missing_chunks(*args)
+
+    monkeypatch.setattr(store, "missing_chunks", off_loop)
+
+    async def fake_candles(self, symbol, interval, start_time, end_time):
+        requested.append((start_time, end_time))
+        first = -(-start_time // 60_000) * 60_000
+        return [
+            {"t": t, "T": t + 59_999, "s": symbol, "i": interval, "o": "1.5", "c": "2", "h": "2.5", "l": "1", "v": "10", "n": 3}
+            for t in range(first, end_time + 1, 60_000)
+        ]
+
+    with patch.object(AsyncHyperliquidAPI, "get_candles", fake_candles):
+        params = {"symbol": "BTC", "interval": "1m", "start_time": 0, "end_time": 250 * 60_000 - 1}
+        candles = client.get("/market/candles", params=params).json()
+        assert len(candles) == 250 and candles[0] == {"t": 0, "T": 59_999, "s": "BTC", "i": "1m", "o": "1.5", "c": "2.0", "h": "2.5", "l": "1.0", "v": "10.0", "n": 3}
+        # Split into pages of 100 candles, fetched concurrently.
+        assert sorted(requested) == [(0, 5_999_999), (6_000_000, 11_999_999), (12_000_000, 14_999_999)]
+
+        requested.clear()
+        params = {"symbol": "BTC", "interval": "1m", "start_time": 200 * 60_000, "end_time": 300 * 60_000 - 1}
+        assert len(client.get("/market/candles", params=params).json()) == 100
+        assert requested == [(15_000_000, 17_999_999)]
+        assert store.stats()["ranges"] == 1
+
+        # The candle still forming is served but fetched again next time.
+        requested.clear()
+        now = int(time.time() * 1000)
+        params = {"symbol": "BTC", "interval": "1m", "start_time": now - 5 * 60_000, "end_time": now}
+        client.get("/market/candles", params=params)
+        client.get("/market/candles", params=params)
+        assert len(requested) == 2 and requested[1][0] > now - 2 * 60_000
+    assert on_loop == []
+
+def test_fill_ingestion_pages_dedupes_and_serves_keyset_pages(client: TestClient, monkeypatch):
+    import time
+    from backend import fill_ingest, models
+
+    auth_client = authenticated_client(client)
+    wallet_id = auth_client.post("/wallets/", json={"name": "w", "address": "0xabc", "private_key": "key"}).json()["id"]
+    base = int(time.time() * 1000) - 3_600_000
+    db = TestingSessionLocal()
+    db.add_all([
+        models.BotRun(bot_id=1, wallet_id=wallet_id, started_at_ms=base, stopped_at_ms=base + 4_500),
+        models.BotRun(bot_id=1, wallet_id=wallet_id, started_at_ms=base + 6_000),
+        models.BotRun(bot_id=2, wallet_id=wallet_id, started_at_ms=base + 6_000),
+    ])
+    db.commit()
+
+    # Two fills share a millisecond across the page boundary.
+    fills = [
+        {"coin": "BTC", "side": "B" if i % 2 else "A", "px": "100.5", "sz": "0.1", "time": base + offset,
+         "tid": 100 + i, "oid": i, "fee": "0.01", "closedPnl": "0.0", "dir": "Open Long", "hash": "0x0"}
+        for i, offset in enumerate([0, 1_000, 2_000, 3_000, 3_000, 5_000, 7_000])
+    ]
+    calls = []
+
+    def fetch(address, start, end):
+        calls.append(start)
+        return [fill for fill in fills if start <= fill["time"] <= end][:3]
+
+    monkeypatch.setattr(fill_ingest, "FILLS_PAGE_LIMIT", 3)
+    monkeypatch.setattr("backend.routers.wallets.HyperliquidAPI", lambda: MagicMock(get_user_fills_by_time=fetch))
+
+    pages, cursor = [], None
+    while True:
+        response = auth_client.get("/wallets/trade-history/0xabc", params={"limit": 3, **({"before": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    history = [fill for page in pages for fill in page]
+    assert [fill["tid"] for fill in history] == [106, 105, 104, 103, 102, 101, 100]
+    assert len(calls) == 4
+    assert history[0]["px"] == "100.5" and history[0]["side"] == "A"
+    # Attributed only while exactly one bot ran on the wallet.
+    assert [fill["bot_id"] for fill in history] == [None, None, 1, 1, 1, 1, 1]
+
+    fills.append({**fills[-1], "tid": 107, "time": base + 7_000})
+    wallet = db.get(models.Wallet, wallet_id)
+    assert fill_ingest.ingest_wallet(db, wallet, fetch) == 1
+    assert db.get(models.FillWatermark, wallet_id).last_fill_ms == base + 7_000
+    assert db.query(models.Trade).count() == 8
+
+    # The background pass stores a fill and the watermark while an on-demand ingestion is between
+    # reading the stored tids and inserting.
+    other = models.Wallet(name="w2", address="0xdef", private_key="key", owner_id=wallet.owner_id)
+    db.add(other)
+    db.commit()
+    trade_row = fill_ingest._trade_row
+
+    def raced(wallet_id, fill, runs):
+        if raced.first:
+            raced.first = False
+            background = TestingSessionLocal()
+            background.add(models.Trade(**trade_row(wallet_id, fill, [])))
+            background.add(models.FillWatermark(wallet_id=wallet_id, last_fill_ms=base))
+            background.commit()
+            background.close()
+        return trade_row(wallet_id, fill, runs)
+
+    raced.first = True
+    monkeypatch.setattr(fill_ingest, "_trade_row", raced)
+    assert fill_ingest.ingest_wallet(db, other, lambda address, start, end: fills[:2]) == 1
+    assert db.query(models.Trade).filter_by(wallet_id=other.id).count() == 2
+    assert db.get(models.FillWatermark, other.id).last_fill_ms == base + 1_000
+    db.close()
+
+    assert auth_client.get("/wallets/trade-history/0xabc", params={"before": "x"}).status_code == 400
+    # Without a limit, the whole first page.
+    assert len(auth_client.get("/wallets/trade-history/0xabc").json()) == 8
+
+    # A full page inside one millisecond cannot be paged further; the rest of the range still is.
+    crowded = [{"time": 10, "tid": tid} for tid in range(3)] + [{"time": 11, "tid": 3}, {"time": 12, "tid": 4}]
+    pages = fill_ingest._pages(lambda address, start, end: [e for e in crowded if start <= e["time"] <= end][:3], "0xabc", 10, 20, 3)
+    assert [[entry["tid"] for entry in page] for page in pages] == [[0, 1, 2], [3, 4]]
+
+
+def test_only_one_api_worker_runs_fill_ingestion(tmp_path, monkeypatch):
+    import asyncio
+    from backend import fill_ingest
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "fill_ingest_lock_path", str(tmp_path / "fill_ingest.lock"))
+    monkeypatch.setattr(settings, "fill_ingest_interval_seconds", 0.01)
+    passes = []
+    monkeypatch.setattr(fill_ingest, "ingest_all", lambda: passes.append(1))
+
+    async def run_for(seconds):
+        task = asyncio.create_task(fill_ingest.run_fill_ingestion())
+        await asyncio.sleep(seconds)
+        task.cancel()
+
+    # Another worker holds the lock; flock locks of separate opens conflict even within one process.
+    other_worker = fill_ingest._take_ingest_lock()
+    asyncio.run(run_for(0.1))
+    assert passes == []
+    other_worker.close()
+    asyncio.run(run_for(0.1))
+    assert passes
+
+def test_pnl_matches_fifo_lots_incrementally_and_on_rebuild(client: TestClient):
+    from backend import models, pnl
+
+    auth_client = authenticated_client(client)
+    wallet_id = auth_client.post("/wallets/", json={"name": "w", "address": "0xabc", "private_key": "key"}).json()["id"]
+    bot_id = auth_client.post("/bots/", json={"name": "b", "code": "print(1)", "input_schema": {}}).json()["id"]
+    db = TestingSessionLocal()
+
+    def trade(tid, side, quantity, price, fee, bot=None):
+        return models.Trade(wallet_id=wallet_id, bot_id=bot, tid=tid, symbol="BTC", side=side, quantity=quantity, price=price, fee=fee, time_ms=tid)
+
+    db.add_all([trade(1, "buy", 1, 100, 0.1, bot_id), trade(2, "buy", 1, 110, 0.1, bot_id), trade(3, "sell", 1.5, 120, 0.2)])
+    db.add(models.FundingPayment(wallet_id=wallet_id, symbol="BTC", time_ms=3, usdc=-1.0, position_size=0.5, rate=0.0001))
+    db.add(models.BotRun(bot_id=bot_id, wallet_id=wallet_id, started_at_ms=0))
+    db.commit()
+
+    with patch.object(AsyncHyperliquidAPI, "get_all_mids", AsyncMock(return_value={"BTC": "130"})):
+        result = auth_client.get(f"/wallets/{wallet_id}/pnl").json()
+        # FIFO: 1 @ 100 and half of 1 @ 110 closed at 120; 0.5 @ 110 still open.
+        assert result["wallet"]["realized_pnl"] == pytest.approx(25)
+        assert result["wallet"]["net_realized_pnl"] == pytest.approx(25 - 0.4 - 1)
+        assert result["wallet"]["unrealized_pnl"] == pytest.approx(10)
+        assert result["symbols"][0]["position"] == pytest.approx(0.5) and result["symbols"][0]["average_entry"] == pytest.approx(110)
+        assert result["bots"][0]["bot_id"] == bot_id and result["bots"][0]["fees"] == pytest.approx(0.2)
+        assert result["bots"][0]["total_pnl"] == pytest.approx(25 - 0.2 + 10)
+
+        db.add(trade(4, "sell", 1, 100, 0.1))
+        db.commit()
+        result = auth_client.get(f"/wallets/{wallet_id}/pnl").json()
+        # Closes the last 0.5 @ 110 and opens 0.5 short @ 100.
+        assert result["wallet"]["realized_pnl"] == pytest.approx(20)
+        assert result["symbols"][0]["position"] == pytest.approx(-0.5)
+        assert result["wallet"]["unrealized_pnl"] == pytest.approx(-15)
+        assert auth_client.get(f"/bots/{bot_id}/pnl").json()["wallets"][0]["realized_pnl"] == pytest.approx(20)
+
+    assert [(lot.quantity, lot.price) for lot in db.query(models.PnlLot)] == [(-0.5, 100)]
+    assert pnl.rebuild_wallet(db, wallet_id, replace=False) == []
+
+    # Two updates at once: the second waits for the first and finds nothing left to fold in.
+    import threading, time
+    db.add(trade(5, "buy", 2, 90, 0.1))
+    db.commit()
+    replay = pnl.replay
+
+    def slow_replay(*args):
+        time.sleep(0.1)
+        return replay(*args)
+
+    def update():
+        session = TestingSessionLocal()
+        try:
+            pnl.update_wallet(session, wallet_id)
+        finally:
+            session.close()
+
+    with patch.object(pnl, "replay", side_effect=slow_replay) as replayed:
+        threads = [threading.Thread(target=update) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert replayed.call_count == 1
+    db.expire_all()
+    assert [(lot.trade_id, lot.quantity) for lot in db.query(models.PnlLot)] == [(5, pytest.approx(1.5))]
+    assert pnl.rebuild_wallet(db, wallet_id, replace=False) == []
+
+    # A fill stored after one that traded later is matched in the order they traded.
+    late = trade(6, "buy", 1, 80, 0.1)
+    late.time_ms = 4
+    db.add(late)
+    db.commit()
+    pnl.update_wallet(db, wallet_id)
+    db.expire_all()
+    # Closes the 0.5 short @ 100 before trade 5 buys at 90, and leaves 0.5 @ 80 open ahead of it.
+    wallet_row = db.query(models.PnlAggregate).filter_by(wallet_id=wallet_id, scope=pnl.WALLET).one()
+    assert wallet_row.realized_pnl == pytest.approx(30)
+    assert sorted((lot.trade_id, lot.quantity) for lot in db.query(models.PnlLot)) == [(5, pytest.approx(2)), (6, pytest.approx(0.5))]
+    assert pnl.rebuild_wallet(db, wallet_id, replace=False) == []
+    db.query(models.PnlAggregate).filter_by(scope="wallet").update({"fees": 99.0})
+    db.commit()
+    assert len(pnl.rebuild_wallet(db, wallet_id)) == 1
+    assert pnl.rebuild_wallet(db, wallet_id, replace=False) == []
+    db.close()
+
+def test_book_manager_serves_grouped_depth_and_deltas_from_stream(client: TestClient, monkeypatch):
+    import asyncio
+    from backend import order_book
+    from backend.order_book import BookManager, book_delta
+
+    def l2(time_ms, bids, asks):
+        side = lambda levels: [{"px": str(px), "sz": str(sz), "n": 1} for px, sz in levels]
+        return {"coin": "BTC", "time": time_ms, "levels": [side(bids), side(asks)]}
+
+    class FakeHub:
+        def __init__(self):
+            self.queue = None
+            self.unsubscribed = 0
+
+        async def subscribe(self, subscription):
+            self.queue = asyncio.Queue()
+            return MagicMock(get=self.queue.get)
+
+        async def unsubscribe(self, subscriber):
+            self.unsubscribed += 1
+
+    rest = AsyncMock(return_value=l2(1, [(100.5, 1), (100.2, 2), (99.9, 3)], [(101.0, 1), (101.4, 2)]))
+
+    async def scenario():
+        hub = FakeHub()
+        manager = BookManager(hub, idle_seconds=0.05)
+        book, updated = await manager.listen("BTC", MagicMock(get_l2_book=rest))
+        # Bids round down to the tick, asks up.
+        grouped = book.snapshot(tick=1)
+        assert [(level["px"], level["sz"]) for level in grouped["levels"][0]] == [("100", "3"), ("99", "3")]
+        assert [(level["px"], level["sz"]) for level in grouped["levels"][1]] == [("101", "1"), ("102", "2")]
+
+        before = book.snapshot()
+        hub.queue.put_nowait({"channel": "l2Book", "data": l2(2, [(100.5, 4), (99.9, 3)], [(101.0, 1), (101.4, 2)])})
+        hub.queue.put_nowait({"channel": "l2Book", "data": l2(0, [], [])})  # older than the book, ignored
+        await asyncio.wait_for(updated.wait(), 1)
+        await asyncio.sleep(0.01)
+        assert book_delta(before, book.snapshot()) == {"time": 2, "bids": [["100.5", "4"], ["100.2", "0"]], "asks": []}
+        assert book.time == 2 and rest.await_count == 1
+
+        # Kept while watched, dropped once idle.
+        await asyncio.sleep(0.15)
+        assert "BTC" in manager.stats()
+        manager.unlisten("BTC", updated)
+        await asyncio.sleep(0.15)
+        assert manager.stats() == {} and hub.unsubscribed == 1
+
+    asyncio.run(scenario())
+
+    monkeypatch.setattr(order_book, "get_hub", FakeHub)
+    monkeypatch.setattr(order_book.settings, "book_idle_seconds", 0)
+    with patch.object(AsyncHyperliquidAPI, "get_l2_book", rest):
+        depth = client.get("/market/depth", params={"symbol": "BTC", "tick": 0.5, "depth": 1}).json()
+    assert depth["levels"] == [[{"px": "100.5", "sz": "1", "n": 1}], [{"px": "101", "sz": "1", "n": 1}]]
+
+def test_impact_estimates_walk_the_book_for_many_sizes(client: TestClient, monkeypatch):
+    import asyncio
+    from backend import order_book
+    from backend.bot_runner import BotTradingAPI
+
+    side = lambda levels: [{"px": str(px), "sz": str(sz), "n": 1} for px, sz in levels]
+    l2 = {"coin": "BTC", "time": 1, "levels": [side([(100, 1), (99, 1)]), side([(101, 1), (102, 2), (104, 5)])]}
+
+    class FakeHub:
+        async def subscribe(self, subscription):
+            return MagicMock(get=AsyncMock(side_effect=asyncio.CancelledError))
+
+    monkeypatch.setattr(order_book, "get_hub", FakeHub)
+    monkeypatch.setattr(order_book.settings, "book_idle_seconds", 0)
+    auth_client = authenticated_client(client)
+    with patch.object(AsyncHyperliquidAPI, "get_l2_book", AsyncMock(return_value=l2)):
+        result = auth_client.post("/trades/impact", json={"symbol": "BTC", "is_buy": True, "sizes": [0.5, 2, 10]}).json()
+        assert result["best_px"] == 101 and result["mid"] == 100.5
+        small, medium, large = result["estimates"]
+        assert (small["vwap"], small["levels"], small["slippage_bps"]) == (101, 1, 0)
+        assert small["impact_bps"] == pytest.approx(0.5 / 100.5 * 10_000)
+        assert (medium["vwap"], medium["worst_px"], medium["levels"], medium["complete"]) == (101.5, 102, 2, True)
+        # Deeper than the book: fills all 8 and says so.
+        assert (large["filled_size"], large["vwap"], large["complete"]) == (8, 825 / 8, False)
+
+        by_notional = auth_client.post("/trades/impact", json={"symbol": "BTC", "is_buy": True, "notionals": [305]}).json()["estimates"][0]
+        assert by_notional["filled_size"] == pytest.approx(3) and by_notional["levels"] == 2
+
+        assert auth_client.post("/trades/impact", json={"symbol": "BTC", "is_buy": True, "sizes": [0]}).status_code == 400
+
+    bot_api = BotTradingAPI.__new__(BotTradingAPI)
+    bot_api.api = MagicMock(get_l2_book=lambda symbol: l2)
+    sell = bot_api.estimate_impact("BTC", is_buy=False, sizes=[1.5])["estimates"][0]
+    assert sell["vwap"] == pytest.approx(149.5 / 1.5) and sell["slippage_bps"] == pytest.approx(100 / 3)
+
+def test_batch_orders_send_one_signed_action_and_map_statuses(client: TestClient):
+    from backend.market_cache import market_cache
+
+    posted = []
+
+    async def fake_post(self, url_path, payload):
+        if url_path == "/info":
+            if payload["type"] == "meta":
+                return {"universe": [{"name": "BTC", "szDecimals": 5}, {"name": "ETH", "szDecimals": 4}]}
+            if payload["type"] == "spotMeta":
+                return {"universe": [], "tokens": []}
+            if payload["oid"] == 99:
+                return {"status": "unknownOid"}
+            return {"status": "order", "order": {"order": {"side": "A"}}}
+        posted.append(payload)
+        kinds = payload["action"].get("orders") or payload["action"].get("modifies")
+        statuses = [{"resting": {"oid": 10 + i}} for i in range(len(kinds) - 1)] + [{"error": "Insufficient margin"}]
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+    market_cache.clear()
+    auth_client = authenticated_client(client)
+    wallet_id = auth_client.post("/wallets/", json={"name": "w", "address": "a", "private_key": TEST_PRIVATE_KEY}).json()["id"]
+    ladder = [{"symbol": "ETH", "is_buy": True, "sz": 1.0, "limit_px": 2000.0 - i, "order_type": {"limit": {"tif": "Gtc"}}} for i in range(3)]
+    with patch.object(AsyncHyperliquidAPI, "_post", fake_post):
+        results = auth_client.post("/trades/batch", json={"wallet_id": wallet_id, "orders": ladder}).json()
+        assert len(posted) == 1 and [wire["p"] for wire in posted[0]["action"]["orders"]] == ["2000", "1999", "1998"]
+        assert [(r["index"], r["order"]["limit_px"], r["status"]) for r in results] == [
+            (0, 2000.0, {"resting": {"oid": 10}}), (1, 1999.0, {"resting": {"oid": 11}}), (2, 1998.0, {"error": "Insufficient margin"}),
+        ]
+
+        modifies = [{"oid": 10, "symbol": "ETH", "is_buy": True, "sz": 2.0, "limit_px": 1990.0, "order_type": {"limit": {"tif": "Gtc"}}},
+                    {"oid": 11, "symbol": "BTC", "sz": 0.1, "limit_px": 50000.0, "order_type": {"limit": {"tif": "Gtc"}}}]
+        results = auth_client.put("/trades/batch", json={"wallet_id": wallet_id, "modifies": modifies}).json()
+        action = posted[1]["action"]
+        assert action["type"] == "batchModify" and [m["oid"] for m in action["modifies"]] == [10, 11]
+        # The side of the second modify was read from the resting order.
+        assert [m["order"]["b"] for m in action["modifies"]] == [True, False]
+        assert results[1]["status"] == {"error": "Insufficient margin"}
+
+        # An order the exchange does not know has no side to read.
+        modify = {"wallet_id": wallet_id, "symbol": "ETH", "sz": 1.0, "limit_px": 1990.0, "order_type": {"limit": {"tif": "Gtc"}}}
+        response = auth_client.put("/trades/99", json=modify)
+        assert response.status_code == 400 and "Order 99 was not found on the exchange (unknownOid)" in response.json()["detail"]
+        modifies[1]["oid"] = 99
+        assert auth_client.put("/trades/batch", json={"wallet_id": wallet_id, "modifies": modifies}).status_code == 400
+        assert len(posted) == 2
+
+    from backend.bot_runner import BotTradingAPI, CapitalManager
+    bot_api = BotTradingAPI.__new__(BotTradingAPI)
+    bot_api.api = MagicMock(place_orders_batch=MagicMock(return_value={"status": "err", "response": "Rate limited"}))
+    bot_api.capital_manager = CapitalManager(5000)
+    with pytest.raises(Exception, match="exceeds available capital"):
+        bot_api.place_orders(ladder)
+    assert [r["status"] for r in bot_api.place_orders(ladder[:2])] == [{"error": "Rate limited"}] * 2
+
+
+def test_order_gateway_sends_by_priority_coalesces_modifies_and_tracks_budget(client: TestClient, tmp_path, monkeypatch):
+    from concurrent.futures import Future
+    from backend import order_gateway
+    from backend.config import settings
+    from backend.order_gateway import CANCEL, MODIFY, ORDER, OrderGateway, TokenBucket
+    from eth_account import Account
+    import time
+
+    monkeypatch.setattr(settings, "order_gateway_bucket_path", str(tmp_path / "order_gateway.sqlite3"))
+    sent = []
+
+    def start(name):
+        def send():
+            sent.append(name)
+            done = Future()
+            done.set_result({"status": "ok", "sent": name})
+            return done
+        return send
+
+    address = Account.from_key(TEST_PRIVATE_KEY).address
+    gateway = OrderGateway(address, rate_limits=lambda: {"nRequestsUsed": 100, "nRequestsCap": 112})
+    # Held while queueing, so the dispatcher sees everything at once.
+    with gateway._cond:
+        new = gateway.submit(ORDER, start("new"))
+        first = gateway.submit(MODIFY, start("modify 7 @ 10"), oid=7)
+        latest = gateway.submit(MODIFY, start("modify 7 @ 11"), oid=7)
+        doomed = gateway.submit(MODIFY, start("modify 8"), oid=8)
+        cancel = gateway.submit(CANCEL, start("cancel 8"), oid=8)
+        assert gateway.stats()["queued"] == {"cancel": 1, "modify": 1, "order": 1}
+    assert new.result(timeout=5)["sent"] == "new"
+    assert sent == ["cancel 8", "modify 7 @ 11", "new"]
+    assert first.result()["sent"] == latest.result()["sent"] == "modify 7 @ 11"
+    assert cancel.result()["sent"] == "cancel 8" and doomed.result()["status"] == "err"
+    stats = gateway.stats()
+    assert (stats["sent"], stats["coalesced"], stats["dropped"]) == (3, 1, 1)
+
+    gateway._sync()
+    assert gateway.bucket.budget == 12
+
+    bucket = TokenBucket(rate=2, capacity=4)
+    now = time.monotonic()
+    assert bucket.wait_time(4, now) == 0
+    bucket.take(4, now)
+    assert bucket.wait_time(1, now) == pytest.approx(0.5)
+    bucket.sync(0)
+    # Out of budget on the exchange: one request every 10 seconds, whatever the local bucket holds.
+    assert bucket.wait_time(1, now + 5) == pytest.approx(5)
+    assert bucket.wait_time(1, now + 10) == 0
+
+    auth_client = authenticated_client(client)
+    auth_client.post("/wallets/", json={"name": "w", "address": address, "private_key": TEST_PRIVATE_KEY})
+    order_gateway._gateways[address.lower()] = gateway
+    try:
+        assert list(auth_client.get("/trades/gateway-stats").json()) == [address]
+    finally:
+        del order_gateway._gateways[address.lower()]
+
+
+def test_order_gateway_in_a_process_forked_after_the_parent_sent_starts_its_own(monkeypatch):
+    import multiprocessing
+    from backend import order_gateway
+    from backend.config import settings
+    from backend.order_gateway import ORDER
+
+    monkeypatch.setattr(settings, "order_gateway_sync_seconds", 0)
+    address = "0x" + "ab" * 20
+    assert order_gateway.submit_sync(address, ORDER, lambda: "parent") == "parent"
+
+    def child(results):
+        results.put(order_gateway.submit_sync(address, ORDER, lambda: "child"))
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    process = context.Process(target=child, args=(results,))
+    process.start()
+    try:
+        assert results.get(timeout=10) == "child"
+    finally:
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+        with order_gateway._lock:
+            order_gateway._gateways.pop(address, None)
+
+
+def test_order_gateway_shares_its_bucket_across_processes_skips_cancelled_actions_and_retires(tmp_path, monkeypatch):
+    import asyncio
+    import time
+    from concurrent.futures import Future
+    from backend import order_gateway
+    from backend.config import settings
+    from backend.order_gateway import CANCEL, ORDER, SharedTokenBucket
+
+    # Two buckets on one file stand for two processes sending for the same address.
+    path = str(tmp_path / "order_gateway.sqlite3")
+    here, there = SharedTokenBucket(path, "0xAbc", rate=1, capacity=3), SharedTokenBucket(path, "0xabc", rate=1, capacity=3)
+    now = time.monotonic()
+    assert here.acquire(2, now) == 0
+    assert there.acquire(2, now) == pytest.approx(1)
+    assert there.acquire(1, now) == 0
+    there.sync(0)
+    # Out of budget everywhere, not only in the process that read it: 10 seconds after the last request.
+    assert here.acquire(1, now + 3) == pytest.approx(7)
+
+    monkeypatch.setattr(settings, "order_gateway_bucket_path", path)
+    monkeypatch.setattr(settings, "order_gateway_idle_seconds", 0.2)
+    monkeypatch.setattr(settings, "order_gateway_sync_seconds", 0)
+    sent = []
+
+    async def send(name):
+        sent.append(name)
+        return {"status": "ok"}
+
+    async def scenario():
+        gateway = order_gateway.gateway_for("0xdef")
+        # Held so both actions are queued before the dispatcher looks.
+        with gateway._cond:
+            order = asyncio.ensure_future(order_gateway.submit_async("0xdef", ORDER, lambda: send("order")))
+            cancel = asyncio.ensure_future(order_gateway.submit_async("0xdef", CANCEL, lambda: send("cancel"), oid=1))
+            await asyncio.sleep(0)
+            order.cancel()
+            # The cancellation reaches the gateway's future on the loop's next pass.
+            await asyncio.sleep(0.01)
+            assert order.cancelled()
+        assert await cancel == {"status": "ok"}
+        await asyncio.sleep(0.05)
+        return gateway
+
+    gateway = asyncio.run(scenario())
+    assert sent == ["cancel"]
+    gateway._thread.join(timeout=2)
+    assert not gateway._thread.is_alive() and gateway.closed and "0xdef" not in order_gateway.stats()
+    assert order_gateway.gateway_for("0xdef") is not gateway
+
+
+def test_wallet_keys_are_decrypted_only_for_signing_and_zeroed_on_eviction(client: TestClient):
+    import time
+    from backend import crud, models
+    from backend.key_cache import KeyCache
+
+    crud.key_cache.clear()
+    auth_client = authenticated_client(client)
+    for i in range(3):
+        auth_client.post("/wallets/", json={"name": f"w{i}", "address": f"0x{i}", "private_key": f"key{i}"})
+    decrypt = MagicMock(wraps=crud.key_cache.decrypt)
+    with patch.object(crud.key_cache, "decrypt", decrypt):
+        assert len(auth_client.get("/wallets/").json()) == 3
+        assert len(auth_client.get("/wallets/export").json()) == 3
+        assert decrypt.call_count == 0
+        db = TestingSessionLocal()
+        wallet = db.query(models.Wallet).filter_by(address="0x1").one()
+        assert crud.wallet_private_key(wallet) == crud.wallet_private_key(wallet) == "key1"
+        assert decrypt.call_count == 1
+        assert wallet.private_key != "key1"
+
+    cache = KeyCache(lambda ciphertext: ciphertext.upper().encode(), ttl=60, max_size=2)
+    cache.get("a")
+    held = cache._entries["a"][0]
+    cache.get("b"), cache.get("c")
+    assert list(cache._entries) == ["b", "c"] and held == bytearray(1)
+    held = cache._entries["b"][0]
+    cache._entries["b"] = (held, time.monotonic() - 61)
+    assert cache.get("c") == "C" and "b" not in cache._entries and held == bytearray(1)
+    cache.invalidate("c")
+    assert len(cache) == 0
+
+
+def test_wallet_import_is_atomic_or_best_effort_and_reports_each_row(client: TestClient, monkeypatch):
+    import json
+    from backend import crud, models
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "wallet_import_chunk_size", 2)
+    auth_client = authenticated_client(client)
+    auth_client.post("/wallets/", json={"name": "old", "address": "0xold", "private_key": "old"})
+    rows = [{"name": f"w{i}", "address": f"0x{i}", "private_key": f"key{i}"} for i in range(5)]
+    rows[3] = {"name": "dup", "address": "0x1", "private_key": "k"}
+    rows.append({"name": "taken", "address": "0xold", "private_key": "k"})
+    rows.append({"name": "no key", "address": "0xnokey"})
+    body = json.dumps(rows).encode()
+
+    def streamed():
+        # Split mid-object, as a large upload arrives.
+        for at in range(0, len(body), 7):
+            yield body[at:at + 7]
+
+    response = auth_client.post("/wallets/import", content=streamed())
+    assert response.status_code == 400
+    report = response.json()
+    assert (report["status"], report["created"], report["failed"]) == ("failed", 0, 3)
+    assert [(r["index"], r["status"]) for r in report["results"]] == [
+        (0, "skipped"), (1, "skipped"), (2, "skipped"), (3, "error"), (4, "skipped"), (5, "error"), (6, "error"),
+    ]
+    assert "private_key" in report["results"][6]["error"]
+    assert [w["address"] for w in auth_client.get("/wallets/").json()] == ["0xold"]
+
+    ndjson = "\n".join(json.dumps(row) for row in rows).encode()
+    report = auth_client.post("/wallets/import?mode=best_effort", content=ndjson).json()
+    assert (report["status"], report["created"], report["failed"]) == ("partial", 4, 3)
+    created = {r["address"]: r["id"] for r in report["results"] if r["status"] == "created"}
+    assert sorted(created) == ["0x0", "0x1", "0x2", "0x4"]
+    db = TestingSessionLocal()
+    wallet = db.get(models.Wallet, created["0x2"])
+    assert wallet.private_key != "key2" and crud.wallet_private_key(wallet) == "key2"
+
+    assert auth_client.post("/wallets/import", content=b'[{"name": "x", "address": "0xx", "private_key": "k"}, {"na').status_code == 400
+    assert auth_client.post("/wallets/import", content=b"[]").json()["status"] == "success"
+
+
+def test_principal_is_cached_per_subject_and_bcrypt_runs_off_the_loop(client: TestClient):
+    import asyncio
+    import threading
+    from backend import crud, passwords, security
+
+    threads = []
+    hash_password = passwords.get_password_hash
+
+    def verify(plain, hashed):
+        threads.append(threading.current_thread().name)
+        return True
+
+    def get_password_hash(password):
+        threads.append(threading.current_thread().name)
+        return hash_password(password)
+
+    with patch.object(passwords, "verify_password", verify), patch.object(passwords, "get_password_hash", get_password_hash):
+        auth_client = authenticated_client(client)
+    assert len(threads) == 2 and all(name.startswith("bcrypt") for name in threads)
+
+    def off_the_loop(*args, **kwargs):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return query_user(*args, **kwargs)
+
+    query_user = crud.get_user
+    get_user = MagicMock(side_effect=off_the_loop)
+    with patch.object(crud, "get_user", get_user):
+        assert auth_client.get("/users/me/").json()["username"] == "testuser"
+        auth_client.post("/wallets/", json={"name": "w", "address": "0xw", "private_key": "k"})
+        # Relationships of the cached principal still load through the request's session.
+        assert auth_client.get("/trades/gateway-stats").json() == {}
+        assert get_user.call_count == 1
+
+        security.invalidate_principal("testuser")
+        assert auth_client.get("/users/me/").status_code == 200
+        assert get_user.call_count == 2
+
+
+def test_blocking_bots_asked_to_run_shared_get_their_own_process(monkeypatch):
+    import threading
+    from backend import bot_runner as runner_module
+
+    runner = runner_module.BotRunner.__new__(runner_module.BotRunner)
+    runner.active_bots, runner.pool, runner.shared, runner._lock = {}, None, MagicMock(), threading.Lock()
+    process = MagicMock(pid=4321)
+    with patch.object(runner_module.multiprocessing, "Process", return_value=process), \
+            patch.object(runner_module, "fill_feed"), patch.object(runner_module, "bot_monitor"):
+        runner.start_bot(5, "print('blocking')\n", {}, TEST_PRIVATE_KEY, 10.0, execution_mode="shared")
+        assert runner.active_bots[5] is process and not runner.shared.acquire.called
+        runner.start_bot(6, "async def main():\n    pass\n", {}, TEST_PRIVATE_KEY, 10.0, execution_mode="shared")
+        assert runner.shared.acquire.called
+
+
+def test_a_bot_stopped_twice_or_as_it_finishes_is_stopped_once():
+    import threading
+    from backend import bot_runner as runner_module
+
+    runner = runner_module.BotRunner.__new__(runner_module.BotRunner)
+    runner.active_bots, runner.pool, runner.shared, runner._lock = {}, None, MagicMock(), threading.Lock()
+    process = MagicMock(pid=4321)
+    # A pooled worker reports its bot finished while it is being terminated.
+    process.terminate.side_effect = lambda: runner._bot_finished(7, process)
+    with patch.object(runner_module.multiprocessing, "Process", return_value=process), \
+            patch.object(runner_module, "fill_feed") as feed, patch.object(runner_module, "bot_monitor") as monitor:
+        runner.start_bot(7, "print(1)\n", {}, TEST_PRIVATE_KEY, 10.0)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(runner.stop_bot(7)["status"])) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        runner._bot_finished(7, process)
+    assert sorted(results) == ["error", "error", "error", "success"]
+    assert process.terminate.call_count == 1 and feed.detach.call_count == 1 and monitor.untrack.call_count == 1
+    assert runner.active_bots == {}
+
+    # The bot monitor stops a bot over its hard limits the same way, and records the run's end.
+    with patch.object(runner_module.multiprocessing, "Process", return_value=process), \
+            patch.object(runner_module, "fill_feed"), patch.object(runner_module, "bot_monitor"), \
+            patch.object(runner_module, "SessionLocal"), patch.object(runner_module, "record_bot_stop") as recorded:
+        runner.start_bot(7, "print(1)\n", {}, TEST_PRIVATE_KEY, 10.0)
+        runner._stop_over_limit(7, "hard limit exceeded: cpu")
+        runner._stop_over_limit(7, "hard limit exceeded: cpu")
+        assert runner.stop_bot(7)["status"] == "error"
+    assert recorded.call_count == 1 and process.terminate.call_count == 2
+
+
+def test_pooled_worker_drops_the_previous_bots_fills_before_the_next_bot_attaches():
+    import multiprocessing
+    import threading
+    import time
+    from backend import bot_runner as runner_module
+    from backend.worker_pool import PooledWorker
+
+    worker = PooledWorker.__new__(PooledWorker)
+    worker.fill_queue, worker.process, worker.runs = multiprocessing.Queue(), MagicMock(pid=4321), 0
+    worker.conn = MagicMock()
+    worker.fill_queue.put({"tid": 1})
+    time.sleep(0.1)
+    runner = runner_module.BotRunner.__new__(runner_module.BotRunner)
+    runner.active_bots, runner.pool, runner.shared, runner._lock = {}, MagicMock(), MagicMock(), threading.Lock()
+    runner.pool.acquire.return_value = worker
+    # Fills the feed holds for the wallet are replayed as the bot attaches.
+    attach = lambda bot_id, address, fill_queue: fill_queue.put({"tid": 2})
+    with patch.object(runner_module, "fill_feed", MagicMock(attach=attach)), patch.object(runner_module, "bot_monitor"):
+        runner.start_bot(9, "print(1)\n", {}, TEST_PRIVATE_KEY, 10.0)
+    assert worker.fill_queue.get(timeout=5) == {"tid": 2}
+    assert worker.fill_queue.empty()
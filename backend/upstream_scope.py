@@ -0,0 +1,52 @@
+import asyncio
+import contextvars
+
+
+class UpstreamScope:
+    def __init__(self):
+        self.results = {}
+        self.upstream_calls = 0
+        self.shared_calls = 0
+
+
+_current_scope = contextvars.ContextVar("upstream_scope", default=None)
+
+# (event loop, key) -> task for read calls currently in flight across all requests.
+_in_flight = {}
+
+
+def begin_scope():
+    scope = UpstreamScope()
+    return scope, _current_scope.set(scope)
+
+
+def end_scope(token):
+    _current_scope.reset(token)
+
+
+def record_upstream_call():
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.upstream_calls += 1
+
+
+async def single_flight(key: str, fetch):
+    # Identical reads share one upstream call: memoised for the rest of the current
+    # request, and joined while already in flight for a concurrent request.
+    scope = _current_scope.get()
+    if scope is not None and key in scope.results:
+        scope.shared_calls += 1
+        return await asyncio.shield(scope.results[key])
+
+    flight_key = (asyncio.get_running_loop(), key)
+    task = _in_flight.get(flight_key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _in_flight[flight_key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(flight_key, None))
+    elif scope is not None:
+        scope.shared_calls += 1
+
+    if scope is not None:
+        scope.results[key] = task
+    return await asyncio.shield(task)
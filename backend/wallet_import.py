@@ -0,0 +1,182 @@
+import asyncio
+import codecs
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas
+from .client_registry import client_registry
+from .config import settings
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _encrypt_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.wallet_import_threads, thread_name_prefix="wallet-import")
+        return _executor
+
+
+def _encrypt(private_key: str) -> str:
+    return crud.f.encrypt(private_key.encode()).decode()
+
+
+async def iter_rows(chunks):
+    """Yields the objects of a JSON array, or of newline-delimited JSON, as the body streams in."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    ended = False
+    chunks = chunks.__aiter__()
+    while True:
+        position = 0
+        while True:
+            # Skips the array's brackets and separators; what remains is one value after another.
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if ended:
+                    raise ValueError(f"Malformed JSON near: {buffer[position:position + 40]!r}")
+                break
+            yield row
+        buffer = buffer[position:]
+        if ended:
+            return
+        try:
+            buffer += text.decode(await chunks.__anext__())
+        except StopAsyncIteration:
+            buffer += text.decode(b"", final=True)
+            ended = True
+
+
+class WalletImport:
+    """Imports wallets a chunk at a time, with each chunk's keys encrypted in parallel and its rows in one insert.
+
+    Atomic imports run in one transaction that is rolled back if any row fails; every row is still
+    checked, so the report lists all failures. Best-effort imports commit the valid rows of each chunk.
+    """
+
+    def __init__(self, db: Session, user_id: int, atomic: bool):
+        self.db = db
+        self.user_id = user_id
+        self.atomic = atomic
+        self.results = []
+        self.keys = {}  # index -> private key, to drop stale signers of the wallets created
+        self.seen = set()
+        self.pending = []
+        self.created = 0
+        self.failed = 0
+
+    def _fail(self, index: int, address, error: str):
+        self.results.append({"index": index, "address": address, "status": "error", "error": error})
+        self.failed += 1
+
+    def add(self, index: int, row) -> bool:
+        """Checks one row and queues it; returns True when a chunk is ready to flush."""
+        try:
+            wallet = schemas.WalletImport.model_validate(row)
+        except ValidationError as e:
+            address = row.get("address") if isinstance(row, dict) else None
+            self._fail(index, address, "; ".join(f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in e.errors()))
+            return False
+        if wallet.address in self.seen:
+            self._fail(index, wallet.address, "Duplicate address in this import")
+            return False
+        self.seen.add(wallet.address)
+        self.pending.append((index, wallet))
+        return len(self.pending) >= settings.wallet_import_chunk_size
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        addresses = [wallet.address for _, wallet in pending]
+        existing = set(self.db.scalars(select(models.Wallet.address).where(models.Wallet.address.in_(addresses))))
+        for index, wallet in pending:
+            if wallet.address in existing:
+                self._fail(index, wallet.address, "A wallet with this address already exists")
+        pending = [(index, wallet) for index, wallet in pending if wallet.address not in existing]
+        if self.atomic and self.failed:
+            # An atomic import that has failed only checks the remaining rows.
+            self.results += [{"index": index, "address": wallet.address, "status": "skipped"} for index, wallet in pending]
+            return
+        if not pending:
+            return
+        keys = _encrypt_executor().map(_encrypt, [wallet.private_key for _, wallet in pending])
+        rows = [
+            {"name": wallet.name, "address": wallet.address, "private_key": key, "owner_id": self.user_id}
+            for (_, wallet), key in zip(pending, keys)
+        ]
+        try:
+            ids = self.db.scalars(insert(models.Wallet).returning(models.Wallet.id, sort_by_parameter_order=True), rows).all()
+        except IntegrityError:
+            # Another request took one of the addresses since they were checked.
+            self.db.rollback()
+            if self.atomic:
+                for index, wallet in pending:
+                    self._fail(index, wallet.address, "A wallet with this address may already exist")
+                return
+            # Earlier chunks are committed, so only this one is retried, a row at a time.
+            ids = [self._insert_one(index, row) for (index, _), row in zip(pending, rows)]
+        for (index, wallet), wallet_id in zip(pending, ids):
+            if wallet_id is not None:
+                self.keys[index] = wallet.private_key
+                self.results.append({"index": index, "address": wallet.address, "status": "created", "id": wallet_id})
+                self.created += 1
+        if not self.atomic:
+            self.db.commit()
+
+    def _insert_one(self, index: int, row: dict):
+        try:
+            wallet_id = self.db.scalar(insert(models.Wallet).returning(models.Wallet.id), row)
+            self.db.commit()
+            return wallet_id
+        except IntegrityError:
+            self.db.rollback()
+            self._fail(index, row["address"], "A wallet with this address already exists")
+            return None
+
+    def finish(self):
+        self.flush()
+        if self.atomic and self.failed:
+            self.db.rollback()
+            for result in self.results:
+                if result["status"] == "created":
+                    result["status"] = "skipped"
+                    del result["id"]
+            self.created = 0
+        else:
+            self.db.commit()
+        for result in self.results:
+            if result["status"] == "created":
+                client_registry.invalidate(self.keys[result["index"]])
+        self.keys.clear()
+        self.results.sort(key=lambda result: result["index"])
+        status = "failed" if not self.created and self.failed else "partial" if self.failed else "success"
+        return {"status": status, "created": self.created, "failed": self.failed, "results": self.results}
+
+
+async def import_wallets(db: Session, user_id: int, rows, atomic: bool = True):
+    job = WalletImport(db, user_id, atomic)
+    try:
+        index = 0
+        async for row in rows:
+            if job.add(index, row):
+                await asyncio.to_thread(job.flush)
+            index += 1
+        return await asyncio.to_thread(job.finish)
+    except Exception:
+        db.rollback()
+        raise
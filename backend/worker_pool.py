@@ -0,0 +1,184 @@
+import multiprocessing
+import multiprocessing.connection
+import queue
+import sys
+import threading
+
+from hyperliquid.utils import constants
+
+from .client_registry import client_registry
+from .config import settings
+
+
+def _warm_up():
+    # Clients inherited from the parent share its sockets, so start clean, then
+    # fetch exchange metadata now instead of on the bot's first call.
+    client_registry.clear()
+    try:
+        client_registry.warm(constants.MAINNET_API_URL)
+    except Exception as e:
+        print(f"Worker warm-up could not fetch exchange metadata: {e}")
+
+
+def worker_main(conn, fill_queue, recycle_after: int):
+    from .bot_runner import run_bot_process
+
+    _warm_up()
+    conn.send(("ready",))
+    stdout, stderr = sys.stdout, sys.stderr
+    for _ in range(recycle_after):
+        try:
+            assignment = conn.recv()
+        except EOFError:
+            return
+        if assignment is None:
+            return
+        try:
+            run_bot_process(*assignment, fill_queue)
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        conn.send(("done", assignment[0]))
+
+
+class PooledWorker:
+    def __init__(self, context, recycle_after: int):
+        self.conn, child_conn = context.Pipe()
+        self.fill_queue = context.Queue()
+        self.process = context.Process(target=worker_main, args=(child_conn, self.fill_queue, recycle_after))
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.runs = 0
+        self.bot_id = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def drain_fills(self):
+        # Fills left over from the previous bot on this worker are not the next one's. Called
+        # before the next bot is attached to the fill feed, so none of its fills are dropped.
+        while True:
+            try:
+                self.fill_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def assign(self, bot_id: int, assignment: tuple):
+        self.bot_id = bot_id
+        self.runs += 1
+        self.conn.send(assignment)
+
+
+class WorkerPool:
+    """Pre-forked bot processes that have already imported and warmed up, waiting for an assignment."""
+
+    def __init__(self, size: int, recycle_after: int, on_done=None):
+        self.size = size
+        self.recycle_after = recycle_after
+        self.on_done = on_done
+        self._context = multiprocessing.get_context()
+        self._idle = []
+        self._busy = []
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = multiprocessing.Pipe(duplex=False)
+        self._monitor = None
+        self._closed = False
+
+    def start(self):
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._watch, name="bot-worker-pool", daemon=True)
+                self._monitor.start()
+        self._replenish()
+
+    def acquire(self) -> PooledWorker:
+        self.start()
+        with self._lock:
+            # Prefer a worker that has finished warming up.
+            self._idle.sort(key=lambda worker: not worker.ready)
+            worker = None
+            while self._idle and worker is None:
+                candidate = self._idle.pop(0)
+                if candidate.process.is_alive():
+                    worker = candidate
+            if worker is None:
+                worker = PooledWorker(self._context, self.recycle_after)
+            self._busy.append(worker)
+        self._wake()
+        threading.Thread(target=self._replenish, daemon=True).start()
+        return worker
+
+    def _replenish(self):
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) >= self.size:
+                    break
+                self._idle.append(PooledWorker(self._context, self.recycle_after))
+        self._wake()
+
+    def _wake(self):
+        self._wakeup_w.send(None)
+
+    def _watch(self):
+        while True:
+            with self._lock:
+                workers = {worker.conn: worker for worker in self._idle + self._busy}
+            for conn in multiprocessing.connection.wait([self._wakeup_r, *workers]):
+                if conn is self._wakeup_r:
+                    conn.recv()
+                    continue
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    self._retire(workers[conn])  # terminated by stop_bot, or crashed
+                    continue
+                if message[0] == "ready":
+                    workers[conn].ready = True
+                elif message[0] == "done":
+                    self._finished(workers[conn], message[1])
+
+    def _finished(self, worker: PooledWorker, bot_id: int):
+        if self.on_done is not None:
+            self.on_done(bot_id, worker.process)
+        with self._lock:
+            if worker in self._busy:
+                self._busy.remove(worker)
+            worker.bot_id = None
+            if worker.runs < self.recycle_after and not self._closed:
+                self._idle.append(worker)
+                return
+        worker.conn.close()
+        worker.process.join()
+        self._replenish()
+
+    def _retire(self, worker: PooledWorker):
+        with self._lock:
+            for workers in (self._idle, self._busy):
+                if worker in workers:
+                    workers.remove(worker)
+        worker.conn.close()
+        worker.process.join()
+        if worker.bot_id is not None and self.on_done is not None:
+            self.on_done(worker.bot_id, worker.process)
+        self._replenish()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "ready": sum(worker.ready for worker in self._idle),
+                "busy": len(self._busy),
+                "recycle_after": self.recycle_after,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers = self._idle + self._busy
+            self._idle, self._busy = [], []
+        for worker in workers:
+            worker.process.terminate()
+        for worker in workers:
+            worker.process.join()
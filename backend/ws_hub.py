@@ -0,0 +1,175 @@
+import asyncio
+import json
+from collections import defaultdict
+
+import websockets
+from hyperliquid.utils import constants
+from hyperliquid.websocket_manager import subscription_to_identifier, ws_msg_to_identifier
+
+from .config import settings
+
+WS_URL = "ws" + constants.MAINNET_API_URL[len("http"):] + "/ws"
+
+
+def hub_key(subscription: dict) -> str:
+    # userEvents and orderUpdates are not keyed by user on the wire, so the hub
+    # qualifies them itself to keep different addresses apart.
+    identifier = subscription_to_identifier(subscription)
+    user = subscription.get("user", "").lower()
+    if user and user not in identifier:
+        return f"{identifier}:{user}"
+    return identifier
+
+
+class Subscriber:
+    def __init__(self, key: str, subscription: dict, max_queue: int):
+        self.key = key
+        self.subscription = subscription
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=max_queue)
+
+    def push(self, message):
+        # Slow consumers lose their oldest messages instead of stalling the upstream reader.
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class _UpstreamConnection:
+    def __init__(self, hub):
+        self.hub = hub
+        self.routes = {}  # wire identifier -> (hub key, subscription)
+        self._ws = None
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        backoff = 1
+        while True:
+            try:
+                async with websockets.connect(self.hub.ws_url, ping_interval=None) as ws:
+                    self._ws = ws
+                    backoff = 1
+                    for _, subscription in list(self.routes.values()):
+                        await self._send("subscribe", subscription)
+                    heartbeat = asyncio.create_task(self._heartbeat())
+                    try:
+                        async for raw in ws:
+                            self.hub._dispatch(self, json.loads(raw))
+                    finally:
+                        heartbeat.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Upstream websocket error, reconnecting in {backoff}s: {e}")
+            self._ws = None
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    async def _heartbeat(self):
+        # Hyperliquid drops connections that stay silent for a minute.
+        while True:
+            await asyncio.sleep(50)
+            await self._ws.send(json.dumps({"method": "ping"}))
+
+    async def _send(self, method: str, subscription: dict):
+        if self._ws is None:
+            return  # (re)subscribed from self.routes once connected
+        try:
+            await self._ws.send(json.dumps({"method": method, "subscription": subscription}))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def add(self, key: str, subscription: dict):
+        self.routes[subscription_to_identifier(subscription)] = (key, subscription)
+        await self._send("subscribe", subscription)
+
+    async def remove(self, subscription: dict):
+        del self.routes[subscription_to_identifier(subscription)]
+        await self._send("unsubscribe", subscription)
+
+    async def close(self):
+        self._task.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+
+
+class SubscriptionHub:
+    """One upstream socket shared by every local consumer of the same subscription."""
+
+    def __init__(self, ws_url: str = WS_URL, max_queue: int = 100):
+        self.ws_url = ws_url
+        self.max_queue = max_queue
+        self._subscribers = defaultdict(set)
+        self._placement = {}  # hub key -> _UpstreamConnection
+        self._connections = []
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, subscription: dict) -> Subscriber:
+        key = hub_key(subscription)
+        subscriber = Subscriber(key, subscription, self.max_queue)
+        async with self._lock:
+            self._subscribers[key].add(subscriber)
+            if key not in self._placement:
+                connection = self._connection_for(subscription_to_identifier(subscription))
+                self._placement[key] = connection
+                await connection.add(key, subscription)
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber):
+        async with self._lock:
+            subscribers = self._subscribers.get(subscriber.key)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if subscribers:
+                return
+            del self._subscribers[subscriber.key]
+            connection = self._placement.pop(subscriber.key)
+            await connection.remove(subscriber.subscription)
+            if not connection.routes:
+                await connection.close()
+                self._connections.remove(connection)
+
+    def _connection_for(self, identifier: str) -> _UpstreamConnection:
+        for connection in self._connections:
+            if identifier not in connection.routes:
+                return connection
+        connection = _UpstreamConnection(self)
+        self._connections.append(connection)
+        return connection
+
+    def _dispatch(self, connection: _UpstreamConnection, message: dict):
+        try:
+            identifier = ws_msg_to_identifier(message)
+        except (KeyError, TypeError, IndexError):
+            return
+        route = connection.routes.get(identifier)
+        if route is None:
+            return
+        for subscriber in self._subscribers.get(route[0], ()):
+            subscriber.push(message)
+
+    def stats(self):
+        return {
+            "upstream_connections": len(self._connections),
+            "subscriptions": {key: len(subscribers) for key, subscribers in self._subscribers.items()},
+            "dropped": sum(sub.dropped for subscribers in self._subscribers.values() for sub in subscribers),
+        }
+
+
+# Hubs own asyncio primitives, so there is one per event loop.
+_hubs = {}
+
+
+def get_hub() -> SubscriptionHub:
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        for stale in [other for other in _hubs if other.is_closed()]:
+            del _hubs[stale]
+        hub = _hubs[loop] = SubscriptionHub(max_queue=settings.ws_client_queue_size)
+    return hub
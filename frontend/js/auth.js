@@ -109,37 +109,37 @@ document.addEventListener("DOMContentLoaded", () => {
     }
 
     if (importInput) {
-        importInput.addEventListener("change", (event) => {
+        importInput.addEventListener("change", async (event) => {
             const file = event.target.files[0];
             if (!file) return;
 
-            const reader = new FileReader();
-            reader.onload = async (e) => {
-                try {
-                    const wallets = JSON.parse(e.target.result);
-                    const token = localStorage.getItem("jwt");
-                    if (!token) return;
+            const token = localStorage.getItem("jwt");
+            if (!token) return;
 
-                    const response = await fetch("/wallets/import", {
-                        method: "POST",
-                        headers: {
-                            "Content-Type": "application/json",
-                            "Authorization": `Bearer ${token}`
-                        },
-                        body: JSON.stringify(wallets)
-                    });
+            try {
+                // The file is sent as it is, so the server can read it as it streams in.
+                const response = await fetch("/wallets/import", {
+                    method: "POST",
+                    headers: {
+                        "Content-Type": "application/json",
+                        "Authorization": `Bearer ${token}`
+                    },
+                    body: file
+                });
+                const report = await response.json();
 
-                    if (response.ok) {
-                        alert("Wallets imported successfully!");
-                    } else {
-                        alert("Failed to import wallets.");
-                    }
-                } catch (error) {
-                    console.error("Error importing wallets:", error);
-                    alert("An error occurred while importing wallets.");
+                if (response.ok) {
+                    alert(`Imported ${report.created} wallets.`);
+                } else if (report.results) {
+                    const errors = report.results.filter((row) => row.status === "error");
+                    alert(`No wallets were imported. ${errors.length} rows failed, the first with: ${errors[0].error}`);
+                } else {
+                    alert("Failed to import wallets.");
                 }
-            };
-            reader.readAsText(file);
+            } catch (error) {
+                console.error("Error importing wallets:", error);
+                alert("An error occurred while importing wallets.");
+            }
         });
     }
 });
@@ -83,31 +83,58 @@ document.addEventListener("DOMContentLoaded", () => {
 
         const logContent = document.getElementById("bot-log-content");
         const statusContent = document.getElementById("bot-status-content");
+        const metricsContent = document.getElementById("bot-metrics-content");
         logContent.textContent = "";
+        metricsContent.textContent = "";
         statusContent.textContent = "Connecting...";
 
         dashboardModal.style.display = "block";
 
-        const wsUrl = `ws://localhost:8000/ws/bots/${botId}/dashboard`;
-        dashboardWs = new WebSocket(wsUrl);
-
-        dashboardWs.onmessage = function(event) {
-            const message = JSON.parse(event.data);
-            if (message.type === 'log') {
-                logContent.textContent += message.data + '\n';
-            } else if (message.type === 'status') {
-                statusContent.textContent = JSON.stringify(message.data, null, 2);
-            }
-        };
-
-        dashboardWs.onclose = function() {
-            statusContent.textContent = "Connection closed.";
-        };
+        // Byte offset of the last log line shown, so a reconnect resumes where it left off.
+        let logOffset = 0;
+
+        function connect() {
+            const wsUrl = `ws://localhost:8000/ws/bots/${botId}/dashboard?offset=${logOffset}`;
+            const ws = new WebSocket(wsUrl);
+            dashboardWs = ws;
+
+            ws.onmessage = function(event) {
+                const message = JSON.parse(event.data);
+                if (message.type === 'logs') {
+                    logContent.textContent += message.data.join('\n') + '\n';
+                    logOffset = message.offset;
+                } else if (message.type === 'reset') {
+                    logContent.textContent = "";
+                    logOffset = 0;
+                } else if (message.type === 'status') {
+                    statusContent.textContent = JSON.stringify(message.data, null, 2);
+                } else if (message.type === 'metrics') {
+                    const m = message.data;
+                    metricsContent.textContent =
+                        `CPU ${m.cpu_percent.toFixed(1)}%  RSS ${(m.rss_bytes / 1048576).toFixed(1)} MB  ` +
+                        `threads ${m.threads}  fds ${m.open_fds}  sockets ${m.sockets}`;
+                }
+            };
+
+            ws.onclose = function() {
+                if (dashboardWs !== ws || dashboardModal.style.display === "none") {
+                    statusContent.textContent = "Connection closed.";
+                    return;
+                }
+                statusContent.textContent = "Reconnecting...";
+                setTimeout(() => {
+                    if (dashboardWs === ws && dashboardModal.style.display !== "none") {
+                        connect();
+                    }
+                }, 2000);
+            };
+
+            ws.onerror = function(error) {
+                console.error("WebSocket Error:", error);
+            };
+        }
 
-        dashboardWs.onerror = function(error) {
-            statusContent.textContent = "An error occurred.";
-            console.error("WebSocket Error:", error);
-        };
+        connect();
     }
 
     // --- Main Page Logic ---
@@ -214,6 +241,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
         const wallet_id = parseInt(document.getElementById("run-wallet-selector").value);
         const capital_allocation = parseFloat(document.getElementById("capital-allocation").value);
+        const execution_mode = document.getElementById("execution-mode").value;
 
         const runtime_inputs = {};
         const bot = bots.find(b => b.id === currentBotId);
@@ -230,7 +258,7 @@ document.addEventListener("DOMContentLoaded", () => {
                     "Content-Type": "application/json",
                     "Authorization": `Bearer ${token}`,
                 },
-                body: JSON.stringify({ wallet_id, capital_allocation, runtime_inputs }),
+                body: JSON.stringify({ wallet_id, capital_allocation, runtime_inputs, execution_mode }),
             });
 
             if (response.ok) {
@@ -327,23 +327,40 @@ function uuidv4() {
         });
     }
 
-    async function loadDepthChart(symbol) {
-        if (!symbol) return;
-        try {
-            const response = await fetch(`/market/depth?symbol=${symbol}`, {
-                headers: { "Authorization": `Bearer ${token}` }
-            });
-            if (!response.ok) throw new Error("Failed to fetch depth chart data");
-            const data = await response.json();
-
-            const bids = data.levels[0].map(level => ({ time: parseFloat(level.px), value: parseFloat(level.sz) }));
-            const asks = data.levels[1].map(level => ({ time: parseFloat(level.px), value: parseFloat(level.sz) }));
+    let depthSocket;
 
-            bidSeries.setData(bids);
-            askSeries.setData(asks);
-        } catch (error) {
-            console.error("Error fetching depth chart data:", error);
-        }
+    function loadDepthChart(symbol) {
+        if (!symbol) return;
+        if (depthSocket) depthSocket.close();
+
+        // The server sends the book once, then only the levels that changed.
+        const bids = new Map();
+        const asks = new Map();
+        const render = () => {
+            const toSeries = levels => [...levels.entries()]
+                .map(([px, sz]) => ({ time: parseFloat(px), value: parseFloat(sz) }))
+                .sort((a, b) => a.time - b.time);
+            bidSeries.setData(toSeries(bids));
+            askSeries.setData(toSeries(asks));
+        };
+
+        const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        depthSocket = new WebSocket(`${wsProtocol}//${window.location.host}/ws/market/${symbol}/book`);
+        depthSocket.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            if (message.type === "snapshot") {
+                bids.clear();
+                asks.clear();
+                message.levels[0].forEach(level => bids.set(level.px, level.sz));
+                message.levels[1].forEach(level => asks.set(level.px, level.sz));
+            } else {
+                for (const [levels, changes] of [[bids, message.bids], [asks, message.asks]]) {
+                    changes.forEach(([px, sz]) => parseFloat(sz) === 0 ? levels.delete(px) : levels.set(px, sz));
+                }
+            }
+            render();
+        };
+        depthSocket.onerror = (error) => console.error("Error streaming depth chart data:", error);
     }
 
     initializeDepthChart();